@@ -5,7 +5,7 @@ from django.db.models import Sum
 from django.utils import timezone
 from django.urls import reverse
 from django.http import HttpResponse
-from .models import Category, FinanceTransaction, FinancialSummary, InventoryTransaction, DailyRevenue
+from .models import Category, FinanceTransaction, FinancialSummary, InventoryTransaction, DailyRevenue, FinanceOutbox
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -455,4 +455,13 @@ class DailyRevenueAdmin(admin.ModelAdmin):
         for obj in queryset:
             obj.mark_printed(request.user)
         self.message_user(request, f"Marked {queryset.count()} items as printed.")
-    mark_as_printed.short_description = "🖨️ Mark selected items as printed"
\ No newline at end of file
+    mark_as_printed.short_description = "🖨️ Mark selected items as printed"
+
+@admin.register(FinanceOutbox)
+class FinanceOutboxAdmin(admin.ModelAdmin):
+    list_display = ('source_type', 'source_id', 'created_at', 'processed_at', 'attempts')
+    list_filter = ('source_type', 'processed_at', 'attempts')
+    search_fields = ('source_id', 'last_error')
+    ordering = ['-id']
+    readonly_fields = ('source_type', 'source_id', 'created_at', 'processed_at', 'attempts', 'last_error')
+    exclude = ('site',)
@@ -0,0 +1,232 @@
+"""
+Set-based ledger posting for sales and procurement documents
+
+``handle_invoice_status_change`` builds SoldItem rows one invoice at a time
+on save. Bulk loaders skip that signal and call ``post_sales_ledger`` once at
+the end instead; the finance outbox worker (see finance.outbox) calls it for
+each batch of paid invoices queued by ``sync_invoice_to_finance``.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from portal.invoice_utils import build_sold_item, sales_lines
+from portal.models import Invoice, SoldItem
+from portal.sales_facts import schedule_sales_facts
+
+from .models import FinanceTransaction, InventoryTransaction
+from .signals import get_or_create_finance_category, get_system_user
+from .summaries import apply_contributions, inventory_contribution
+
+logger = logging.getLogger(__name__)
+
+
+def post_sales_ledger(invoice_ids, site, batch_size=2000):
+    """
+    Build the ledger rows for the given paid invoices of ``site`` in chunks of
+    ``batch_size`` invoices, add the revenue and cost of the new inventory rows
+    to their FinancialSummary months as increments, and refresh the sales facts
+    of the days that gained sold items. Invoices that already have ledger rows
+    are skipped, so the pass can be re-run safely. Returns the number of rows
+    created per model.
+    """
+    invoice_ids = list(invoice_ids)
+    category = get_or_create_finance_category('Sales Revenue', 'sale', site)
+    system_user = get_system_user()
+    counts = {'sold_items': 0, 'finance_transactions': 0, 'inventory_transactions': 0}
+    sold_days = set()
+
+    for start in range(0, len(invoice_ids), batch_size):
+        chunk = invoice_ids[start:start + batch_size]
+        chunk_counts, chunk_days = _post_chunk(chunk, site, category, system_user, batch_size)
+        for key, value in chunk_counts.items():
+            counts[key] += value
+        sold_days |= chunk_days
+
+    for day in sorted(sold_days):
+        schedule_sales_facts(site.pk, day)
+
+    logger.info(f"Posted sales ledger for {len(invoice_ids)} invoice(s) on {site.domain}: {counts}")
+    return counts
+
+
+def _post_chunk(invoice_ids, site, category, system_user, batch_size):
+    invoices = {
+        invoice.pk: invoice
+        for invoice in Invoice.all_objects.filter(pk__in=invoice_ids, site=site, status='paid').select_related('customer')
+    }
+    has_finance = set(
+        FinanceTransaction.all_objects.filter(source_type='invoice', source_id__in=invoices)
+        .values_list('source_id', flat=True)
+    )
+    has_sold_items = set(
+        SoldItem.all_objects.filter(invoice_id__in=invoices).values_list('invoice_id', flat=True).distinct()
+    )
+
+    transactions, sold_items, inventory = sales_rows(
+        invoices, category, system_user, skip_finance=has_finance, skip_sold_items=has_sold_items,
+        batch_size=batch_size,
+    )
+    sold_by_day = defaultdict(set)
+    for sold_item in sold_items:
+        sold_by_day[invoices[sold_item.invoice_id].date].add(sold_item.invoice_id)
+
+    with transaction.atomic():
+        FinanceTransaction.all_objects.bulk_create(transactions, batch_size=batch_size)
+        SoldItem.all_objects.bulk_create(sold_items, batch_size=batch_size)
+        InventoryTransaction.all_objects.bulk_create(inventory, batch_size=batch_size)
+
+        # date_sold is auto_now_add, so the INSERT stamped the new rows with the
+        # current time; move them back to their invoice day
+        for day, day_invoice_ids in sold_by_day.items():
+            SoldItem.all_objects.filter(invoice_id__in=day_invoice_ids).update(date_sold=start_of_day(day))
+
+        # bulk_create skips the summary signals; the invoices themselves were
+        # counted when they were saved as paid
+        apply_contributions(inventory_contribution(row) for row in inventory)
+
+    counts = {
+        'sold_items': len(sold_items),
+        'finance_transactions': len(transactions),
+        'inventory_transactions': len(inventory),
+    }
+    return counts, set(sold_by_day)
+
+
+# =============================================================================
+# ROW BUILDERS
+# =============================================================================
+
+def sales_rows(invoices, category, system_user, skip_finance=(), skip_sold_items=(), batch_size=2000):
+    """
+    Unsaved ``(finance transactions, sold items, inventory transactions)`` for
+    paid ``invoices`` (pk -> Invoice with ``customer`` loaded), built in one pass
+    over their lines. Invoices in ``skip_finance``/``skip_sold_items`` only get
+    the other rows.
+    """
+    transactions = []
+    for invoice in invoices.values():
+        if invoice.pk in skip_finance:
+            continue
+        customer_name = invoice.customer.full_name if invoice.customer else 'Walk-in'
+        transactions.append(FinanceTransaction(
+            type='sale_receipt',
+            category=category,
+            amount=invoice.grand_total,
+            date=invoice.date,
+            description=f'Sales Invoice #{invoice.invoice_number} - {customer_name}',
+            payment_method=invoice.payment_mode,
+            reference=invoice.invoice_number,
+            source_type='invoice',
+            source_id=invoice.pk,
+            auto_generated=True,
+            created_by=system_user,
+            site_id=invoice.site_id,
+        ))
+
+    # Sales are costed at the cost recorded on their sold items when the
+    # invoice was paid, not at the product's current cost price
+    sale_costs = {
+        (invoice_id, product_id): unit_cost
+        for invoice_id, product_id, unit_cost in SoldItem.all_objects.filter(
+            invoice_id__in=[pk for pk in invoices if pk in skip_sold_items],
+        ).values_list('invoice_id', 'product_id', 'unit_cost')
+    }
+
+    # One pass over the lines builds both the SoldItem and the inventory rows
+    sold_items = []
+    inventory = []
+    for item in sales_lines(invoices, chunk_size=batch_size):
+        invoice = invoices[item.invoice_id]
+        product = item.product
+        if invoice.pk not in skip_sold_items:
+            sold_item = build_sold_item(invoice, item, date_sold=start_of_day(invoice.date))
+            sold_items.append(sold_item)
+            sale_costs.setdefault((invoice.pk, product.pk), sold_item.unit_cost)
+        if invoice.pk not in skip_finance:
+            unit_cost = sale_costs.get((invoice.pk, product.pk))
+            if unit_cost is None:
+                unit_cost = product.cost_price
+            inventory.append(InventoryTransaction(
+                product=product,
+                type='sale',
+                quantity=-item.quantity,
+                unit_cost=unit_cost,
+                unit_price=item.unit_price,
+                total_cost=unit_cost * item.quantity,
+                total_revenue=item.subtotal(),
+                invoice_id=invoice.pk,
+                date=start_of_day(invoice.date),
+                notes=f'Sale via Invoice #{invoice.invoice_number}',
+                site_id=invoice.site_id,
+            ))
+    return transactions, sold_items, inventory
+
+
+def purchase_order_rows(orders, category, system_user):
+    """
+    Unsaved ``(finance transactions, inventory transactions)`` for received
+    ``orders`` loaded with ``supplier`` and prefetched ``items__product``.
+    """
+    transactions = []
+    inventory = []
+    for order in orders:
+        transactions.append(FinanceTransaction(
+            type='purchase',
+            category=category,
+            amount=order.total,
+            date=order.order_date,
+            description=f'Purchase Order #{order.reference} - {order.supplier.name}',
+            payment_method=order.payment_mode,
+            reference=order.reference,
+            source_type='purchase_order',
+            source_id=order.pk,
+            auto_generated=True,
+            created_by=system_user,
+            site_id=order.site_id,
+        ))
+        for item in order.items.all():
+            inventory.append(InventoryTransaction(
+                product=item.product,
+                type='purchase',
+                quantity=item.quantity,  # Positive for purchases (stock increase)
+                unit_cost=item.unit_cost,
+                unit_price=item.product.unit_price,
+                total_cost=item.total,
+                purchase_order=order,
+                date=start_of_day(order.order_date),
+                notes=f'Purchase via PO #{order.reference}',
+                site_id=order.site_id,
+            ))
+    return transactions, inventory
+
+
+def purchase_payment_rows(payments, category, system_user):
+    """Unsaved finance transactions for ``payments`` loaded with ``purchase_order__supplier``"""
+    return [
+        FinanceTransaction(
+            type='purchase_payment',
+            category=category,
+            amount=payment.amount,
+            date=payment.payment_date,
+            description=f'Payment for PO #{payment.purchase_order.reference} - {payment.purchase_order.supplier.name}',
+            payment_method=payment.payment_method,
+            reference=payment.reference or f'PAY-{payment.purchase_order.reference}',
+            source_type='purchase_payment',
+            source_id=payment.pk,
+            auto_generated=True,
+            created_by=system_user,
+            site_id=payment.purchase_order.site_id,
+        )
+        for payment in payments
+    ]
+
+
+def start_of_day(day):
+    """Midnight at the start of ``day``, for the DateTimeField dates of ledger rows"""
+    moment = datetime.combine(day, datetime.min.time())
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:11
+
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def fill_sales_counters(apps, schema_editor):
+    """Seed the counters from the sale inventory transactions, so increments start from the real totals"""
+    FinancialSummary = apps.get_model('finance', 'FinancialSummary')
+    InventoryTransaction = apps.get_model('finance', 'InventoryTransaction')
+    totals = (
+        InventoryTransaction.objects.filter(type='sale')
+        .annotate(period=TruncMonth('date'))
+        .values('site_id', 'period')
+        .annotate(revenue=Sum('total_revenue'), cost=Sum('total_cost'))
+        .order_by()
+    )
+    by_month = {}
+    for row in totals:
+        period = row['period']
+        if isinstance(period, datetime) and timezone.is_aware(period):
+            period = timezone.localtime(period)
+        by_month[(row['site_id'], period.year, period.month)] = (row['revenue'] or Decimal('0'), row['cost'] or Decimal('0'))
+
+    summaries = []
+    for summary in FinancialSummary.objects.all():
+        revenue, cost = by_month.get((summary.site_id, summary.year, summary.month), (Decimal('0'), Decimal('0')))
+        summary.sales_revenue = revenue
+        summary.sales_cost = cost
+        summary.gross_profit = revenue - cost
+        summary.profit_margin = ((revenue - cost) * 100 / revenue).quantize(Decimal('0.01')) if revenue > 0 else Decimal('0')
+        summaries.append(summary)
+    FinancialSummary.objects.bulk_update(
+        summaries, ['sales_revenue', 'sales_cost', 'gross_profit', 'profit_margin'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0002_dailyrevenue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='financialsummary',
+            name='sales_cost',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Cost of sale inventory transactions', max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='financialsummary',
+            name='sales_revenue',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Revenue of sale inventory transactions, kept so profit margin can be maintained incrementally', max_digits=15),
+        ),
+        migrations.RunPython(fill_sales_counters, migrations.RunPython.noop),
+    ]
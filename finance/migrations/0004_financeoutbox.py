@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0003_financialsummary_sales_revenue_cost'),
+        ('sites', '0002_alter_domain_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinanceOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_type', models.CharField(choices=[('invoice', 'Invoice'), ('purchase_order', 'Purchase Order'), ('purchase_payment', 'Purchase Payment')], max_length=20)),
+                ('source_id', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('site', models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, related_name='%(app_label)s_%(class)s_set', to='sites.site')),
+            ],
+            options={
+                'verbose_name': 'Finance Outbox Entry',
+                'verbose_name_plural': 'Finance Outbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='finance_outbox_pending_idx')],
+            },
+        ),
+    ]
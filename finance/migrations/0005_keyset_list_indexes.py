@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_financeoutbox'),
+        ('sites', '0002_alter_domain_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='financetransaction',
+            index=models.Index(fields=['site', '-date', '-id'], name='fintx_site_date_id_idx'),
+        ),
+    ]
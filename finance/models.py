@@ -76,6 +76,10 @@ class FinanceTransaction(FinanceSiteModel):
     
     class Meta:
         ordering = ['-date', 'site']
+        indexes = [
+            # Keyset pagination of the transaction list
+            models.Index(fields=['site', '-date', '-id'], name='fintx_site_date_id_idx'),
+        ]
         verbose_name = 'Finance Transaction'
         verbose_name_plural = 'Finance Transactions'
     
@@ -99,6 +103,14 @@ class FinancialSummary(FinanceSiteModel):
     total_purchase_payments = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     
     # Profit metrics
+    sales_revenue = models.DecimalField(
+        max_digits=15, decimal_places=2, default=0,
+        help_text="Revenue of sale inventory transactions, kept so profit margin can be maintained incrementally"
+    )
+    sales_cost = models.DecimalField(
+        max_digits=15, decimal_places=2, default=0,
+        help_text="Cost of sale inventory transactions"
+    )
     gross_profit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     profit_margin = models.DecimalField(max_digits=5, decimal_places=2, default=0)  # Percentage
     
@@ -241,4 +253,34 @@ class DailyRevenue(FinanceSiteModel):
         self.save(update_fields=['printed_count', 'last_printed_at', 'last_printed_by'])
     
     def __str__(self):
-        return f"{self.site.domain}: {self.date} - QAR {self.daily_revenue:,.2f}"
\ No newline at end of file
+        return f"{self.site.domain}: {self.date} - QAR {self.daily_revenue:,.2f}"
+
+class FinanceOutbox(FinanceSiteModel):
+    """
+    Pending finance synchronisation for a sales or procurement document.
+
+    The save signals only append a row here inside the document's own
+    transaction; ``manage.py run_finance_worker`` builds the finance rows later.
+    """
+    SOURCE_TYPES = [
+        ('invoice', 'Invoice'),
+        ('purchase_order', 'Purchase Order'),
+        ('purchase_payment', 'Purchase Payment'),
+    ]
+
+    source_type = models.CharField(max_length=20, choices=SOURCE_TYPES)
+    source_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['processed_at', 'id'], name='finance_outbox_pending_idx')]
+        verbose_name = 'Finance Outbox Entry'
+        verbose_name_plural = 'Finance Outbox'
+
+    def __str__(self):
+        state = 'processed' if self.processed_at else 'pending'
+        return f"{self.source_type} #{self.source_id} ({state})"
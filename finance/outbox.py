@@ -0,0 +1,167 @@
+"""
+Transactional outbox for sales and procurement finance synchronisation
+
+Saving a paid invoice, a received purchase order or a purchase payment only
+appends a ``FinanceOutbox`` row in the same transaction as the document, so
+the POS request never touches categories, the system user or the item loops.
+``process_outbox`` drains pending rows in batches and builds the finance rows
+set-based per source type. Every handler checks for existing rows keyed on
+``source_type``/``source_id``, so replaying an entry is harmless.
+
+The drain runs in its own process, ``manage.py run_finance_worker`` (or
+``run_finance_worker --once`` from cron), never inside the web workers.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.sites.models import Site
+from django.db import connection, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import FinanceOutbox, FinanceTransaction, InventoryTransaction
+
+logger = logging.getLogger(__name__)
+
+# Entries that failed this many times stay in the table for inspection
+MAX_ATTEMPTS = 5
+
+
+def enqueue_finance_sync(source_type, source_id, site_id):
+    """Record that a document needs finance rows; one INSERT on the caller's transaction"""
+    return FinanceOutbox.all_objects.create(source_type=source_type, source_id=source_id, site_id=site_id)
+
+
+# =============================================================================
+# DRAINING
+# =============================================================================
+
+def process_outbox(batch_size=200):
+    """
+    Process up to ``batch_size`` pending entries, oldest first. Duplicate entries
+    for one document are handled once. Returns the number of entries processed.
+
+    On databases with ``SELECT ... FOR UPDATE SKIP LOCKED`` several workers can
+    drain the same table without picking the same entries.
+    """
+    features = connection.features
+    with transaction.atomic():
+        entries = FinanceOutbox.all_objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS).order_by('id')
+        if features.has_select_for_update:
+            entries = entries.select_for_update(skip_locked=features.has_select_for_update_skip_locked)
+        entries = list(entries[:batch_size])
+        if not entries:
+            return 0
+
+        by_type = defaultdict(lambda: defaultdict(set))
+        for entry in entries:
+            by_type[entry.source_type][entry.site_id].add(entry.source_id)
+
+        failed = {}
+        for source_type, sites in by_type.items():
+            for site_id, source_ids in sites.items():
+                try:
+                    with transaction.atomic():
+                        HANDLERS[source_type](sorted(source_ids), site_id)
+                except Exception as exc:
+                    logger.exception(f"Finance sync failed for {source_type} {sorted(source_ids)} on site {site_id}")
+                    failed[(source_type, site_id)] = str(exc)
+
+        done = [entry.pk for entry in entries if (entry.source_type, entry.site_id) not in failed]
+        FinanceOutbox.all_objects.filter(pk__in=done).update(processed_at=timezone.now())
+        for (source_type, site_id), error in failed.items():
+            retry = [entry.pk for entry in entries if (entry.source_type, entry.site_id) == (source_type, site_id)]
+            FinanceOutbox.all_objects.filter(pk__in=retry).update(attempts=F('attempts') + 1, last_error=error)
+
+    logger.info(f"Finance outbox batch: {len(done)} processed, {len(entries) - len(done)} failed")
+    return len(entries)
+
+
+def drain_outbox(batch_size=200):
+    """Process batches until nothing is pending; returns the number of entries processed"""
+    total = 0
+    while processed := process_outbox(batch_size):
+        total += processed
+    return total
+
+
+def outbox_lag():
+    """
+    Lag metrics for monitoring: pending and failed entry counts and the age in
+    seconds of the oldest pending entry (0 when the outbox is drained).
+    """
+    pending = FinanceOutbox.all_objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+    stats = pending.aggregate(oldest=Min('created_at'))
+    oldest = stats['oldest']
+    return {
+        'pending': pending.count(),
+        'failed': FinanceOutbox.all_objects.filter(processed_at__isnull=True, attempts__gte=MAX_ATTEMPTS).count(),
+        'oldest_pending_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
+
+
+def purge_processed(days=7):
+    """Delete entries processed more than ``days`` days ago; returns the number deleted"""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = FinanceOutbox.all_objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
+
+
+# =============================================================================
+# HANDLERS
+# =============================================================================
+
+def sync_invoices(invoice_ids, site_id):
+    """Sales ledger rows for paid invoices, set-based through the bulk ledger pass"""
+    from .ledger import post_sales_ledger
+
+    post_sales_ledger(invoice_ids, Site.objects.get(pk=site_id))
+
+
+def sync_purchase_orders(order_ids, site_id):
+    """Purchase transaction and inbound inventory rows for received purchase orders"""
+    from procurement.models import PurchaseOrder
+    from .ledger import purchase_order_rows
+    from .signals import get_or_create_finance_category, get_system_user
+
+    existing = FinanceTransaction.all_objects.filter(source_type='purchase_order', source_id__in=order_ids)
+    orders = list(
+        PurchaseOrder.all_objects.filter(pk__in=order_ids, site_id=site_id, status='received')
+        .exclude(pk__in=existing.values('source_id'))
+        .select_related('supplier')
+        .prefetch_related('items__product')
+    )
+    if not orders:
+        return
+
+    category = get_or_create_finance_category('Inventory Purchase', 'purchase', site_id)
+    transactions, inventory = purchase_order_rows(orders, category, get_system_user())
+    FinanceTransaction.all_objects.bulk_create(transactions)
+    InventoryTransaction.all_objects.bulk_create(inventory)
+
+
+def sync_purchase_payments(payment_ids, site_id):
+    """Payment transactions for purchase payments"""
+    from procurement.models import PurchasePayment
+    from .ledger import purchase_payment_rows
+    from .signals import get_or_create_finance_category, get_system_user
+
+    existing = FinanceTransaction.all_objects.filter(source_type='purchase_payment', source_id__in=payment_ids)
+    payments = list(
+        PurchasePayment.objects.filter(pk__in=payment_ids, purchase_order__site_id=site_id, amount__gt=0)
+        .exclude(pk__in=existing.values('source_id'))
+        .select_related('purchase_order__supplier')
+    )
+    if not payments:
+        return
+
+    category = get_or_create_finance_category('Purchase Payments', 'expense', site_id)
+    FinanceTransaction.all_objects.bulk_create(purchase_payment_rows(payments, category, get_system_user()))
+
+
+HANDLERS = {
+    'invoice': sync_invoices,
+    'purchase_order': sync_purchase_orders,
+    'purchase_payment': sync_purchase_payments,
+}
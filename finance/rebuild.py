@@ -0,0 +1,193 @@
+"""
+Set-based rebuild of the auto-generated finance ledger
+
+Repairs what the sync signals and the outbox worker should have written: for
+one site and month, the auto-generated FinanceTransaction rows of paid invoices,
+received purchase orders and purchase payments, their sale and purchase
+InventoryTransaction rows, and the month's FinancialSummary. The expected rows
+come from one query per source table and the shared row builders in
+finance.ledger; the stored rows are replaced with one DELETE and one bulk
+INSERT per table, so no signal chains are replayed.
+
+``rebuild_ledger`` runs the months of a range in parallel on a process pool.
+"""
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from django.db import connection, connections, transaction
+from django.db.models import Q
+
+from .ledger import purchase_order_rows, purchase_payment_rows, sales_rows, start_of_day
+from .models import FinanceTransaction, InventoryTransaction
+from .summaries import reconcile_summaries
+
+logger = logging.getLogger(__name__)
+
+SOURCE_TYPES = ('invoice', 'purchase_order', 'purchase_payment')
+
+
+def month_range(start, end):
+    """First days of the months from ``start`` to ``end``, both inclusive"""
+    months = []
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def rebuild_ledger(partitions, dry_run=False, workers=1):
+    """
+    Rebuild every ``(site_id, month)`` partition and yield ``(partition, diff)``
+    as each one finishes. With ``workers`` above 1 the partitions run in a pool
+    of processes, each with its own database connection.
+    """
+    if workers <= 1:
+        for site_id, month in partitions:
+            yield (site_id, month), rebuild_month(site_id, month, dry_run=dry_run)
+        return
+
+    # Create the shared categories and system user once instead of racing for them
+    for site_id in {site_id for site_id, _ in partitions}:
+        _ledger_categories(site_id)
+    # Forked workers must not share the parent's connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(rebuild_month, site_id, month, dry_run): (site_id, month)
+            for site_id, month in partitions
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def rebuild_month(site_id, month, dry_run=False):
+    """
+    Regenerate the ledger of one site and month. Returns the difference between
+    the stored and the expected rows::
+
+        {'finance': {'missing': 0, 'extra': 0, 'changed': 0},
+         'inventory': {'missing': 0, 'extra': 0},
+         'summary': 0}
+
+    where ``summary`` counts drifting FinancialSummary values. With ``dry_run``
+    nothing is written.
+    """
+    start, end = month, next_month(month)
+    with transaction.atomic():
+        expected_finance, expected_inventory = _expected_rows(site_id, start, end)
+        stored_finance = FinanceTransaction.all_objects.filter(
+            site_id=site_id, auto_generated=True, source_type__in=SOURCE_TYPES, date__gte=start, date__lt=end,
+        )
+        stored_inventory = InventoryTransaction.all_objects.filter(
+            Q(type='sale', invoice__isnull=False) | Q(type='purchase', purchase_order__isnull=False),
+            site_id=site_id, date__gte=start_of_day(start), date__lt=start_of_day(end),
+        )
+        diff = {
+            'finance': _finance_diff(stored_finance, expected_finance),
+            'inventory': _inventory_diff(stored_inventory, expected_inventory),
+        }
+
+        if not dry_run and (any(diff['finance'].values()) or any(diff['inventory'].values())):
+            stored_finance.delete()
+            # The summary is reconciled below, so skip the per-row post_delete receivers
+            _delete_ledger_inventory(site_id, start, end)
+            FinanceTransaction.all_objects.bulk_create(expected_finance, batch_size=1000)
+            InventoryTransaction.all_objects.bulk_create(expected_inventory, batch_size=1000)
+
+        drift, missing = reconcile_summaries(site=site_id, start=start, end=end, fix=not dry_run)
+        diff['summary'] = len(drift) + len(missing)
+
+    logger.info(f"Rebuilt finance ledger for site {site_id} {start:%Y-%m}{' (dry run)' if dry_run else ''}: {diff}")
+    return diff
+
+
+def _delete_ledger_inventory(site_id, start, end):
+    """
+    Delete the sale and purchase inventory rows of a partition with one DELETE
+    statement. ``QuerySet.delete()`` would load every row to send post_delete.
+    """
+    table = InventoryTransaction._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(table)} "
+            "WHERE site_id = %s AND date >= %s AND date < %s "
+            "AND ((type = 'sale' AND invoice_id IS NOT NULL) OR (type = 'purchase' AND purchase_order_id IS NOT NULL))",
+            [site_id, *(connection.ops.adapt_datetimefield_value(start_of_day(day)) for day in (start, end))],
+        )
+
+
+def _expected_rows(site_id, start, end):
+    from portal.models import Invoice
+    from procurement.models import PurchaseOrder, PurchasePayment
+    from .signals import get_system_user
+
+    system_user = get_system_user()
+    invoices = {
+        invoice.pk: invoice
+        for invoice in Invoice.all_objects.filter(
+            site_id=site_id, status='paid', date__gte=start, date__lt=end,
+        ).select_related('customer')
+    }
+    orders = (
+        PurchaseOrder.all_objects.filter(site_id=site_id, status='received', order_date__gte=start, order_date__lt=end)
+        .select_related('supplier')
+        .prefetch_related('items__product')
+    )
+    payments = PurchasePayment.objects.filter(
+        purchase_order__site_id=site_id, amount__gt=0, payment_date__gte=start, payment_date__lt=end,
+    ).select_related('purchase_order__supplier')
+
+    sales_category, purchase_category, payment_category = _ledger_categories(site_id)
+    finance, _, inventory = sales_rows(invoices, sales_category, system_user, skip_sold_items=invoices)
+    order_finance, order_inventory = purchase_order_rows(orders, purchase_category, system_user)
+    finance += order_finance
+    inventory += order_inventory
+    finance += purchase_payment_rows(payments, payment_category, system_user)
+    return finance, inventory
+
+
+def _ledger_categories(site_id):
+    from .signals import get_or_create_finance_category, get_system_user
+
+    get_system_user()
+    return (
+        get_or_create_finance_category('Sales Revenue', 'sale', site_id),
+        get_or_create_finance_category('Inventory Purchase', 'purchase', site_id),
+        get_or_create_finance_category('Purchase Payments', 'expense', site_id),
+    )
+
+
+def _finance_diff(stored, expected):
+    stored = {
+        (source_type, source_id): (amount, day)
+        for source_type, source_id, amount, day in stored.values_list('source_type', 'source_id', 'amount', 'date')
+    }
+    expected = {(row.source_type, row.source_id): (row.amount, row.date) for row in expected}
+    return {
+        'missing': len(expected.keys() - stored.keys()),
+        'extra': len(stored.keys() - expected.keys()),
+        'changed': sum(1 for key in expected.keys() & stored.keys() if expected[key] != stored[key]),
+    }
+
+
+def _inventory_diff(stored, expected):
+    fields = ('type', 'invoice_id', 'purchase_order_id', 'product_id', 'quantity', 'total_cost', 'total_revenue')
+    stored = Counter(stored.values_list(*fields))
+    expected = Counter(tuple(getattr(row, field) for field in fields) for row in expected)
+    return {
+        'missing': sum((expected - stored).values()),
+        'extra': sum((stored - expected).values()),
+    }
+
+
+def _init_worker():
+    import django
+    django.setup()
+    connections.close_all()
@@ -1,270 +1,121 @@
 """
 Django signals to automatically sync sales and procurement data to finance app
 """
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from decimal import Decimal
-from datetime import datetime
+from datetime import date
 
+from portal import reference_data
 from portal.models import Invoice, InvoiceItem
+from portal.totals import totals_changed
 from procurement.models import PurchaseOrder, PurchasePayment
-from .models import FinanceTransaction, Category, InventoryTransaction, FinancialSummary
+from .models import FinanceTransaction, InventoryTransaction
+from .outbox import enqueue_finance_sync
+from .summaries import (
+    apply_contribution_change, apply_summary_delta, inventory_contribution, invoice_contribution,
+    purchase_order_contribution, purchase_payment_contribution, reconcile_summaries,
+)
 
 
 def get_or_create_finance_category(name, transaction_type, site):
-    """Helper function to get or create finance categories"""
-    category, created = Category.objects.get_or_create(
-        name=name,
-        type=transaction_type,
-        site=site,
-        defaults={'description': f'Auto-created category for {transaction_type}'}
-    )
-    return category
+    """Helper function to get or create finance categories (memoized per process)"""
+    return reference_data.get_finance_category(name, transaction_type, site)
 
 
 def get_system_user():
-    """Get or create a system user for auto-generated transactions"""
-    user, created = User.objects.get_or_create(
-        username='system_finance',
-        defaults={
-            'first_name': 'System',
-            'last_name': 'Finance',
-            'email': 'system@finance.local',
-            'is_active': True,
-        }
-    )
-    return user
+    """Get or create a system user for auto-generated transactions (memoized per process)"""
+    return reference_data.get_system_user()
 
 
 @receiver(post_save, sender=Invoice)
 def sync_invoice_to_finance(sender, instance, created, **kwargs):
-    """Automatically create finance transaction when invoice is saved"""
+    """Queue the finance transaction of a paid invoice for the finance worker"""
     if instance.status == 'paid':  # Only sync paid invoices
-        # Check if transaction already exists
-        existing = FinanceTransaction.objects.filter(
-            source_type='invoice',
-            source_id=instance.id,
-            site=instance.site
-        ).first()
-        
-        if not existing:
-            # Get or create sales category
-            category = get_or_create_finance_category('Sales Revenue', 'sale', instance.site)
-            
-            # Create finance transaction
-            transaction = FinanceTransaction.objects.create(
-                type='sale_receipt',
-                category=category,
-                amount=instance.grand_total,
-                date=instance.date,
-                description=f'Sales Invoice #{instance.invoice_number} - {instance.customer.full_name if instance.customer else "Walk-in"}',
-                payment_method=instance.payment_mode,
-                reference=instance.invoice_number,
-                source_type='invoice',
-                source_id=instance.id,
-                auto_generated=True,
-                created_by=get_system_user(),
-                site=instance.site
-            )
-            
-            # Create inventory transactions for each item
-            for item in instance.items.all():
-                InventoryTransaction.objects.create(
-                    product=item.product,
-                    type='sale',
-                    quantity=-item.quantity,  # Negative for sales (stock reduction)
-                    unit_cost=item.product.cost_price,
-                    unit_price=item.unit_price,
-                    total_cost=item.product.cost_price * item.quantity,
-                    total_revenue=item.subtotal(),
-                    invoice=instance,
-                    date=datetime.combine(instance.date, datetime.min.time()),
-                    notes=f'Sale via Invoice #{instance.invoice_number}',
-                    site=instance.site
-                )
-        
-        # Update financial summary
-        update_financial_summary(instance.site, instance.date.year, instance.date.month)
+        enqueue_finance_sync('invoice', instance.id, instance.site_id)
 
 
 @receiver(post_save, sender=PurchaseOrder)
 def sync_purchase_order_to_finance(sender, instance, created, **kwargs):
-    """Automatically create finance transaction when purchase order is completed"""
+    """Queue the finance transaction of a received purchase order for the finance worker"""
     if instance.status == 'received':  # Only sync received orders
-        # Check if transaction already exists
-        existing = FinanceTransaction.objects.filter(
-            source_type='purchase_order',
-            source_id=instance.id,
-            site=instance.site
-        ).first()
-        
-        if not existing:
-            # Get or create purchase category
-            category = get_or_create_finance_category('Inventory Purchase', 'purchase', instance.site)
-            
-            # Create finance transaction
-            transaction = FinanceTransaction.objects.create(
-                type='purchase',
-                category=category,
-                amount=instance.total,
-                date=instance.order_date,
-                description=f'Purchase Order #{instance.reference} - {instance.supplier.name}',
-                payment_method=instance.payment_mode,
-                reference=instance.reference,
-                source_type='purchase_order',
-                source_id=instance.id,
-                auto_generated=True,
-                created_by=get_system_user(),
-                site=instance.site
-            )
-            
-            # Create inventory transactions for each item
-            for item in instance.items.all():
-                InventoryTransaction.objects.create(
-                    product=item.product,
-                    type='purchase',
-                    quantity=item.quantity,  # Positive for purchases (stock increase)
-                    unit_cost=item.unit_cost,
-                    unit_price=item.product.unit_price,
-                    total_cost=item.total,
-                    purchase_order=instance,
-                    date=datetime.combine(instance.order_date, datetime.min.time()),
-                    notes=f'Purchase via PO #{instance.reference}',
-                    site=instance.site
-                )
-        
-        # Update financial summary
-        update_financial_summary(instance.site, instance.order_date.year, instance.order_date.month)
+        enqueue_finance_sync('purchase_order', instance.id, instance.site_id)
 
 
 @receiver(post_save, sender=PurchasePayment)
 def sync_purchase_payment_to_finance(sender, instance, created, **kwargs):
-    """Automatically create finance transaction when purchase payment is made"""
+    """Queue the finance transaction of a purchase payment for the finance worker"""
     if instance.amount > 0:  # Only sync actual payments
-        # Check if transaction already exists
-        existing = FinanceTransaction.objects.filter(
-            source_type='purchase_payment',
-            source_id=instance.id,
-            site=instance.purchase_order.site
-        ).first()
-        
-        if not existing:
-            # Get or create payment category
-            category = get_or_create_finance_category('Purchase Payments', 'expense', instance.purchase_order.site)
-            
-            # Create finance transaction
-            transaction = FinanceTransaction.objects.create(
-                type='purchase_payment',
-                category=category,
-                amount=instance.amount,
-                date=instance.payment_date,
-                description=f'Payment for PO #{instance.purchase_order.reference} - {instance.purchase_order.supplier.name}',
-                payment_method=instance.payment_method,
-                reference=instance.reference or f'PAY-{instance.purchase_order.reference}',
-                source_type='purchase_payment',
-                source_id=instance.id,
-                auto_generated=True,
-                created_by=get_system_user(),
-                site=instance.purchase_order.site
-            )
-        
-        # Update financial summary
-        update_financial_summary(
-            instance.purchase_order.site, 
-            instance.payment_date.year, 
-            instance.payment_date.month
-        )
+        enqueue_finance_sync('purchase_payment', instance.id, instance.purchase_order.site_id)
 
 
 def update_financial_summary(site, year, month):
-    """Update or create financial summary for the given month"""
-    from django.db.models import Sum, Count, Avg
-    
-    summary, created = FinancialSummary.objects.get_or_create(
-        site=site,
-        year=year,
-        month=month,
-        defaults={
-            'total_sales': Decimal('0'),
-            'total_invoices': 0,
-            'total_purchases': Decimal('0'),
-            'total_purchase_orders': 0,
-            'total_purchase_payments': Decimal('0'),
-            'gross_profit': Decimal('0'),
-            'profit_margin': Decimal('0'),
-            'cash_inflow': Decimal('0'),
-            'cash_outflow': Decimal('0'),
-            'net_cash_flow': Decimal('0'),
-        }
-    )
-    
-    # Calculate sales metrics
-    from portal.models import Invoice
-    sales_data = Invoice.objects.filter(
-        site=site,
-        date__year=year,
-        date__month=month,
-        status='paid'
-    ).aggregate(
-        total=Sum('grand_total'),
-        count=Count('id'),
-        avg=Avg('grand_total')
+    """
+    Recompute the financial summary for the given month from source.
+
+    Regular saves keep the summary current through incremental deltas (see
+    finance.summaries); this full recompute overwrites the counters, so only
+    use it for repairs while nothing else writes to the month.
+    """
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1)
+    reconcile_summaries(site=site, start=start, end=end)
+
+
+# =============================================================================
+# INCREMENTAL FINANCIAL SUMMARY
+# =============================================================================
+
+SUMMARY_CONTRIBUTIONS = {
+    Invoice: invoice_contribution,
+    PurchaseOrder: purchase_order_contribution,
+    PurchasePayment: purchase_payment_contribution,
+    InventoryTransaction: inventory_contribution,
+}
+
+
+def remember_summary_contribution(sender, instance, raw=False, **kwargs):
+    """Capture what the stored row contributes before it is overwritten"""
+    if raw:
+        return
+    previous = sender._base_manager.filter(pk=instance.pk).first() if instance.pk else None
+    instance._summary_contribution = SUMMARY_CONTRIBUTIONS[sender](previous)
+
+
+def apply_summary_contribution(sender, instance, raw=False, **kwargs):
+    """Move the month summary by the difference between the old and new contribution"""
+    if raw:
+        return
+    contribution = SUMMARY_CONTRIBUTIONS[sender](instance)
+    apply_contribution_change(getattr(instance, '_summary_contribution', None), contribution)
+    instance._summary_contribution = contribution
+
+
+def remove_summary_contribution(sender, instance, **kwargs):
+    """Take a deleted row's contribution back out of its month summary"""
+    apply_contribution_change(SUMMARY_CONTRIBUTIONS[sender](instance), None)
+
+
+for _model in SUMMARY_CONTRIBUTIONS:
+    pre_save.connect(remember_summary_contribution, sender=_model, dispatch_uid=f'summary_pre_save_{_model.__name__}')
+    post_save.connect(apply_summary_contribution, sender=_model, dispatch_uid=f'summary_post_save_{_model.__name__}')
+    post_delete.connect(remove_summary_contribution, sender=_model, dispatch_uid=f'summary_post_delete_{_model.__name__}')
+
+
+@receiver(totals_changed, sender=Invoice)
+def sync_invoice_totals_to_finance(sender, pk, previous, totals, document, **kwargs):
+    """
+    The totals engine writes invoice totals with UPDATE, bypassing post_save,
+    so carry grand total changes of paid invoices into the month summary and
+    the invoice's finance transaction here.
+    """
+    if document['status'] != 'paid':
+        return
+    apply_summary_delta(
+        document['site_id'],
+        date(document['date'].year, document['date'].month, 1),
+        {'total_sales': totals['grand_total'] - previous['grand_total']},
     )
-    
-    summary.total_sales = sales_data['total'] or Decimal('0')
-    summary.total_invoices = sales_data['count'] or 0
-    summary.average_sale_value = sales_data['avg'] or Decimal('0')
-    
-    # Calculate purchase metrics
-    purchase_data = PurchaseOrder.objects.filter(
-        site=site,
-        order_date__year=year,
-        order_date__month=month,
-        status='received'
-    ).aggregate(
-        total=Sum('total'),
-        count=Count('id')
-    )
-    
-    summary.total_purchases = purchase_data['total'] or Decimal('0')
-    summary.total_purchase_orders = purchase_data['count'] or 0
-    
-    # Calculate payment metrics
-    payment_data = PurchasePayment.objects.filter(
-        purchase_order__site=site,
-        payment_date__year=year,
-        payment_date__month=month
-    ).aggregate(total=Sum('amount'))
-    
-    summary.total_purchase_payments = payment_data['total'] or Decimal('0')
-    
-    # Calculate profit metrics
-    inventory_profit = InventoryTransaction.objects.filter(
-        site=site,
-        date__year=year,
-        date__month=month,
-        type='sale'
-    ).aggregate(
-        revenue=Sum('total_revenue'),
-        cost=Sum('total_cost')
-    )
-    
-    total_revenue = inventory_profit['revenue'] or Decimal('0')
-    total_cost = inventory_profit['cost'] or Decimal('0')
-    
-    summary.gross_profit = total_revenue - total_cost
-    if total_revenue > 0:
-        summary.profit_margin = (summary.gross_profit / total_revenue) * 100
-    else:
-        summary.profit_margin = Decimal('0')
-    
-    # Calculate cash flow
-    summary.cash_inflow = summary.total_sales
-    summary.cash_outflow = summary.total_purchase_payments
-    summary.net_cash_flow = summary.cash_inflow - summary.cash_outflow
-    
-    summary.save()
+    FinanceTransaction.all_objects.filter(source_type='invoice', source_id=pk).update(amount=totals['grand_total'])
 
 
 # Clean up signals for deletions
@@ -0,0 +1,275 @@
+"""
+Incremental FinancialSummary maintenance
+
+Every source row contributes a fixed set of counters to one month of one site:
+a paid invoice adds its grand total and one invoice, a received purchase order
+its total and one order, a purchase payment its amount, and a sale inventory
+transaction its revenue and cost. When a row changes, the signals compare its
+old and new contribution and apply the difference to the month row with ``F()``
+increments, so a write costs O(1) instead of re-aggregating the month.
+
+``reconcile_summaries`` recomputes the counters from source with one grouped
+query per table; it backs ``manage.py reconcile_financial_summaries``. Bulk
+loaders and the finance worker add the contributions of the rows they write
+with ``apply_contributions`` instead, so they never overwrite the counters
+that concurrent saves are incrementing.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import FinancialSummary, InventoryTransaction
+
+logger = logging.getLogger(__name__)
+
+# Counters maintained by increments; the remaining summary fields derive from them
+COUNTER_FIELDS = (
+    'total_sales', 'total_invoices', 'total_purchases', 'total_purchase_orders',
+    'total_purchase_payments', 'sales_revenue', 'sales_cost',
+)
+DERIVED_FIELDS = ('average_sale_value', 'gross_profit', 'profit_margin', 'cash_inflow', 'cash_outflow', 'net_cash_flow')
+
+
+# =============================================================================
+# CONTRIBUTIONS
+# =============================================================================
+
+def invoice_contribution(invoice):
+    if invoice is None or invoice.status != 'paid':
+        return None
+    return (invoice.site_id, _month(invoice.date), {'total_sales': invoice.grand_total, 'total_invoices': 1})
+
+
+def purchase_order_contribution(order):
+    if order is None or order.status != 'received':
+        return None
+    return (order.site_id, _month(order.order_date), {'total_purchases': order.total, 'total_purchase_orders': 1})
+
+
+def purchase_payment_contribution(payment):
+    if payment is None:
+        return None
+    site_id = payment.purchase_order.site_id
+    return (site_id, _month(payment.payment_date), {'total_purchase_payments': payment.amount})
+
+
+def inventory_contribution(transaction):
+    if transaction is None or transaction.type != 'sale':
+        return None
+    moment = transaction.date
+    if isinstance(moment, datetime) and timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return (
+        transaction.site_id,
+        _month(moment),
+        {'sales_revenue': transaction.total_revenue or Decimal('0'), 'sales_cost': transaction.total_cost},
+    )
+
+
+def apply_contribution_change(old, new):
+    """Apply ``new - old`` to the affected month rows; either side may be None"""
+    _apply_signed([(old, -1), (new, 1)])
+
+
+def apply_contributions(contributions):
+    """
+    Add the contributions of rows written in bulk, which skips the signals,
+    with one increment per affected month row; None entries are ignored.
+    """
+    _apply_signed((contribution, 1) for contribution in contributions)
+
+
+def _apply_signed(contributions):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for contribution, sign in contributions:
+        if contribution is None:
+            continue
+        site_id, month, values = contribution
+        for field, value in values.items():
+            deltas[(site_id, month)][field] += sign * (value or 0)
+
+    for (site_id, month), values in deltas.items():
+        apply_summary_delta(site_id, month, values)
+
+
+def apply_summary_delta(site_id, month, deltas):
+    """
+    Add ``deltas`` (counter field -> amount) to the site's month row with one
+    increment UPDATE, then refresh the ratios derived from the counters.
+    """
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    summary, _ = FinancialSummary.all_objects.get_or_create(site_id=site_id, year=month.year, month=month.month)
+    sales = deltas.get('total_sales', 0)
+    payments = deltas.get('total_purchase_payments', 0)
+    profit = deltas.get('sales_revenue', 0) - deltas.get('sales_cost', 0)
+
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if sales:
+        increments['cash_inflow'] = F('cash_inflow') + sales
+    if payments:
+        increments['cash_outflow'] = F('cash_outflow') + payments
+    if sales or payments:
+        increments['net_cash_flow'] = F('net_cash_flow') + (sales - payments)
+    if profit:
+        increments['gross_profit'] = F('gross_profit') + profit
+
+    rows = FinancialSummary.all_objects.filter(pk=summary.pk)
+    rows.update(**increments)
+    # Ratios read the counters written by the statement above, in a second
+    # statement so the result does not depend on the database's column order
+    rows.update(
+        average_sale_value=Case(
+            When(total_invoices__gt=0, then=F('total_sales') / F('total_invoices')),
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        profit_margin=Case(
+            When(sales_revenue__gt=0, then=F('gross_profit') * 100 / F('sales_revenue')),
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=5, decimal_places=2),
+        ),
+    )
+
+
+# =============================================================================
+# RECONCILIATION
+# =============================================================================
+
+def reconcile_summaries(site=None, start=None, end=None, fix=True):
+    """
+    Recompute the summaries for months in ``[start, end)`` (first days of months,
+    either may be None) from source with one grouped query per table.
+
+    Returns ``(drift, missing)``: ``(site_id, year, month, field, stored, expected)``
+    tuples for stored rows that disagree with the source, and the month rows that
+    do not exist yet. With ``fix`` set both are written.
+    """
+    from portal.models import Invoice
+    from procurement.models import PurchaseOrder, PurchasePayment
+
+    site_id = getattr(site, 'pk', site)
+    expected = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, Decimal('0')))
+
+    def collect(queryset, date_field, site_field, **aggregates):
+        queryset = _in_range(queryset, date_field, start, end)
+        if site_id is not None:
+            queryset = queryset.filter(**{site_field: site_id})
+        rows = (
+            queryset.annotate(period=TruncMonth(date_field))
+            .values(site_field, 'period')
+            .annotate(**aggregates)
+            .order_by()
+        )
+        for row in rows:
+            period = row.pop('period')
+            if isinstance(period, datetime):
+                period = timezone.localtime(period) if timezone.is_aware(period) else period
+            key = (row.pop(site_field), period.year, period.month)
+            for field, value in row.items():
+                expected[key][field] = Decimal(value or 0)
+
+    collect(
+        Invoice.all_objects.filter(status='paid'), 'date', 'site_id',
+        total_sales=Sum('grand_total'), total_invoices=Count('id'),
+    )
+    collect(
+        PurchaseOrder.all_objects.filter(status='received'), 'order_date', 'site_id',
+        total_purchases=Sum('total'), total_purchase_orders=Count('id'),
+    )
+    collect(
+        PurchasePayment.objects.all(), 'payment_date', 'purchase_order__site_id',
+        total_purchase_payments=Sum('amount'),
+    )
+    collect(
+        InventoryTransaction.all_objects.filter(type='sale'), 'date', 'site_id',
+        sales_revenue=Sum('total_revenue'), sales_cost=Sum('total_cost'),
+    )
+
+    stored_rows = FinancialSummary.all_objects.all()
+    if site_id is not None:
+        stored_rows = stored_rows.filter(site_id=site_id)
+    stored = {
+        (summary.site_id, summary.year, summary.month): summary
+        for summary in stored_rows
+        if _month_in_range(summary.year, summary.month, start, end)
+    }
+
+    drift = []
+    to_update = []
+    to_create = []
+    for key in sorted(set(expected) | set(stored)):
+        values = _with_derived(expected[key] if key in expected else dict.fromkeys(COUNTER_FIELDS, Decimal('0')))
+        summary = stored.get(key)
+        if summary is None:
+            summary = FinancialSummary(site_id=key[0], year=key[1], month=key[2])
+            to_create.append(summary)
+        changed = False
+        for field, value in values.items():
+            current = Decimal(getattr(summary, field) or 0)
+            if current != value:
+                if summary.pk:
+                    drift.append((*key, field, current, value))
+                setattr(summary, field, value)
+                changed = True
+        if changed and summary.pk:
+            to_update.append(summary)
+
+    if fix:
+        FinancialSummary.all_objects.bulk_update(to_update, COUNTER_FIELDS + DERIVED_FIELDS, batch_size=500)
+        FinancialSummary.all_objects.bulk_create(to_create, batch_size=500)
+    logger.info(f"Reconciled financial summaries: {len(drift)} drifting value(s), {len(to_create)} new month(s)")
+    return drift, to_create
+
+
+def _with_derived(counters):
+    values = {field: _round(Decimal(counters[field])) for field in COUNTER_FIELDS}
+    values['total_invoices'] = int(values['total_invoices'])
+    values['total_purchase_orders'] = int(values['total_purchase_orders'])
+    values['average_sale_value'] = _round(values['total_sales'] / values['total_invoices']) if values['total_invoices'] else Decimal('0')
+    values['gross_profit'] = values['sales_revenue'] - values['sales_cost']
+    values['profit_margin'] = (
+        _round(values['gross_profit'] * 100 / values['sales_revenue']) if values['sales_revenue'] > 0 else Decimal('0')
+    )
+    values['cash_inflow'] = values['total_sales']
+    values['cash_outflow'] = values['total_purchase_payments']
+    values['net_cash_flow'] = values['cash_inflow'] - values['cash_outflow']
+    return values
+
+
+def _round(value):
+    return value.quantize(Decimal('0.01'))
+
+
+def _month(value):
+    return date(value.year, value.month, 1)
+
+
+def _in_range(queryset, field, start, end):
+    # Plain range filters keep the date indexes usable, unlike __year/__month
+    is_datetime = queryset.model._meta.get_field(field.split('__')[0]).get_internal_type() == 'DateTimeField'
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': _bound(start, is_datetime)})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': _bound(end, is_datetime)})
+    return queryset
+
+
+def _bound(day, is_datetime):
+    if not is_datetime:
+        return day
+    moment = datetime.combine(day, datetime.min.time())
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+
+def _month_in_range(year, month, start, end):
+    first = date(year, month, 1)
+    return (start is None or first >= start) and (end is None or first < end)
@@ -1,3 +1,206 @@
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
 from django.test import TestCase
 
-# Create your tests here.
+from finance.models import FinancialSummary, FinanceTransaction, InventoryTransaction
+from finance.outbox import drain_outbox, outbox_lag
+from portal.models import Category, Invoice, InvoiceItem, Product
+from procurement.models import PurchaseOrder, PurchasePayment, Supplier
+
+
+class FinancialSummaryDeltaTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(
+            category=category, name='Phone', sku='PH-1', description='',
+            cost_price=Decimal('60.00'), unit_price=Decimal('100.00'), stock=10, warranty_period=12,
+        )
+        self.month = date.today().replace(day=1)
+
+    def _summary(self):
+        return FinancialSummary.objects.get(year=self.month.year, month=self.month.month)
+
+    def _paid_invoice(self, number, quantity):
+        invoice = Invoice.objects.create(invoice_number=number, due_date=date.today(), status='draft')
+        with self.captureOnCommitCallbacks(execute=True):
+            InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=quantity, unit_price=Decimal('100.00'))
+        invoice.refresh_from_db()
+        invoice.status = 'paid'
+        invoice.save()
+        return invoice
+
+    def test_invoice_changes_move_the_month_by_deltas(self):
+        first = self._paid_invoice('2025011501', 2)
+        self._paid_invoice('2025011502', 1)
+        drain_outbox()  # Sale inventory rows (revenue and cost) come from the finance worker
+        summary = self._summary()
+        self.assertEqual(summary.total_sales, Decimal('300.00'))
+        self.assertEqual(summary.total_invoices, 2)
+        self.assertEqual(summary.average_sale_value, Decimal('150.00'))
+        self.assertEqual(summary.gross_profit, Decimal('120.00'))
+        self.assertEqual(summary.profit_margin, Decimal('40.00'))
+
+        # Totals recalculated by the engine reach the summary too
+        with self.captureOnCommitCallbacks(execute=True):
+            InvoiceItem.objects.create(invoice=first, product=self.product, quantity=1, unit_price=Decimal('50.00'))
+        self.assertEqual(self._summary().total_sales, Decimal('350.00'))
+
+        first.refresh_from_db()
+        first.status = 'cancelled'
+        first.save()
+        summary = self._summary()
+        self.assertEqual(summary.total_sales, Decimal('100.00'))
+        self.assertEqual(summary.total_invoices, 1)
+
+    def test_purchases_and_payments(self):
+        supplier = Supplier.objects.create(name='Acme')
+        order = PurchaseOrder.objects.create(
+            supplier=supplier, reference='PO-1', order_date=self.month, delivery_date=self.month,
+            status='received', total=Decimal('500.00'),
+        )
+        payment = PurchasePayment.objects.create(purchase_order=order, amount=Decimal('200.00'), payment_date=self.month)
+        summary = self._summary()
+        self.assertEqual(summary.total_purchases, Decimal('500.00'))
+        self.assertEqual(summary.total_purchase_payments, Decimal('200.00'))
+        self.assertEqual(summary.net_cash_flow, Decimal('-200.00'))
+
+        payment.delete()
+        self.assertEqual(self._summary().total_purchase_payments, Decimal('0.00'))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        self._paid_invoice('2025011501', 1)
+        FinancialSummary.objects.filter(pk=self._summary().pk).update(total_sales=Decimal('999.00'))
+
+        out = StringIO()
+        call_command('reconcile_financial_summaries', dry_run=True, stdout=out)
+        self.assertIn('total_sales: stored 999.00, expected 100.00', out.getvalue())
+        self.assertEqual(self._summary().total_sales, Decimal('999.00'))
+
+        call_command('reconcile_financial_summaries', stdout=StringIO())
+        self.assertEqual(self._summary().total_sales, Decimal('100.00'))
+
+
+class FinanceOutboxTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(
+            category=category, name='Phone', sku='PH-1', description='',
+            cost_price=Decimal('60.00'), unit_price=Decimal('100.00'), stock=10, warranty_period=12,
+        )
+
+    def test_saving_only_queues_and_the_worker_is_idempotent(self):
+        invoice = Invoice.objects.create(invoice_number='2025011501', due_date=date.today(), status='draft')
+        with self.captureOnCommitCallbacks(execute=True):
+            InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=2, unit_price=Decimal('100.00'))
+        invoice.refresh_from_db()
+        invoice.status = 'paid'
+        invoice.save()
+        invoice.save()
+
+        self.assertFalse(FinanceTransaction.objects.exists())
+        self.assertEqual(outbox_lag()['pending'], 2)
+
+        self.assertEqual(drain_outbox(), 2)
+        finance = FinanceTransaction.objects.get(source_type='invoice', source_id=invoice.pk)
+        self.assertEqual(finance.amount, Decimal('200.00'))
+        self.assertEqual(InventoryTransaction.objects.filter(invoice=invoice).count(), 1)
+        self.assertEqual(outbox_lag(), {'pending': 0, 'failed': 0, 'oldest_pending_seconds': 0})
+
+        # Replaying the same document does not duplicate its rows
+        invoice.save()
+        drain_outbox()
+        self.assertEqual(FinanceTransaction.objects.filter(source_id=invoice.pk).count(), 1)
+        self.assertEqual(InventoryTransaction.objects.filter(invoice=invoice).count(), 1)
+
+    def test_worker_only_adds_the_rows_it_writes(self):
+        invoice = Invoice.objects.create(invoice_number='2025011501', due_date=date.today(), status='draft')
+        with self.captureOnCommitCallbacks(execute=True):
+            InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=2, unit_price=Decimal('100.00'))
+        invoice.refresh_from_db()
+        invoice.status = 'paid'
+        invoice.save()
+        month = invoice.date.replace(day=1)
+        # An increment the worker does not know about, e.g. from a concurrent save
+        FinancialSummary.objects.filter(year=month.year, month=month.month).update(total_sales=F('total_sales') + 1)
+
+        drain_outbox()
+        summary = FinancialSummary.objects.get(year=month.year, month=month.month)
+        self.assertEqual(summary.total_sales, Decimal('201.00'))
+        self.assertEqual((summary.sales_revenue, summary.sales_cost), (Decimal('200.00'), Decimal('120.00')))
+
+    def test_purchase_order_and_payment(self):
+        supplier = Supplier.objects.create(name='Acme')
+        order = PurchaseOrder.objects.create(
+            supplier=supplier, reference='PO-1', order_date=date.today(), delivery_date=date.today(),
+            status='received', total=Decimal('500.00'),
+        )
+        PurchasePayment.objects.create(purchase_order=order, amount=Decimal('200.00'), payment_date=date.today())
+
+        out = StringIO()
+        call_command('run_finance_worker', once=True, stdout=out)
+        self.assertIn('Pending: 0  Failed: 0', out.getvalue())
+        self.assertEqual(
+            sorted(FinanceTransaction.objects.values_list('type', 'amount')),
+            [('purchase', Decimal('500.00')), ('purchase_payment', Decimal('200.00'))],
+        )
+
+
+class RebuildFinanceLedgerTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(
+            category=category, name='Phone', sku='PH-1', description='',
+            cost_price=Decimal('60.00'), unit_price=Decimal('100.00'), stock=10, warranty_period=12,
+        )
+        self.month = date.today().strftime('%Y-%m')
+
+    def _rebuild(self, **options):
+        out = StringIO()
+        call_command('rebuild_finance_ledger', start=self.month, end=self.month, stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run_reports_and_rebuild_repairs(self):
+        invoice = Invoice.objects.create(invoice_number='2025011501', due_date=date.today(), status='draft')
+        with self.captureOnCommitCallbacks(execute=True):
+            InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=2, unit_price=Decimal('100.00'))
+        invoice.refresh_from_db()
+        invoice.status = 'paid'
+        invoice.save()
+        drain_outbox()
+        self.assertIn('Missing rows: 0  Extra rows: 0  Changed rows: 0  Summary values: 0', self._rebuild(dry_run=True))
+
+        FinanceTransaction.objects.filter(source_id=invoice.pk).update(amount=Decimal('1.00'))
+        InventoryTransaction.objects.filter(invoice=invoice).delete()
+        FinancialSummary.objects.update(sales_revenue=Decimal('0.00'))
+
+        output = self._rebuild(dry_run=True)
+        self.assertIn('finance +0 -0 ~1  inventory +1 -0', output)
+        self.assertFalse(InventoryTransaction.objects.filter(invoice=invoice).exists())
+
+        self._rebuild()
+        self.assertEqual(FinanceTransaction.objects.get(source_id=invoice.pk).amount, Decimal('200.00'))
+        self.assertEqual(InventoryTransaction.objects.filter(invoice=invoice).count(), 1)
+        summary = FinancialSummary.objects.get()
+        self.assertEqual((summary.sales_revenue, summary.gross_profit), (Decimal('200.00'), Decimal('80.00')))
+        self.assertIn('Missing rows: 0  Extra rows: 0', self._rebuild(dry_run=True))
+
+    def test_sales_keep_their_cost_at_the_time_of_sale(self):
+        invoice = Invoice.objects.create(invoice_number='2025011501', due_date=date.today(), status='draft')
+        with self.captureOnCommitCallbacks(execute=True):
+            InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=2, unit_price=Decimal('100.00'))
+        invoice.refresh_from_db()
+        invoice.status = 'paid'
+        invoice.save()
+        Product.objects.filter(pk=self.product.pk).update(cost_price=Decimal('90.00'))
+        drain_outbox()
+        self.assertEqual(InventoryTransaction.objects.get(invoice=invoice).total_cost, Decimal('120.00'))
+        self.assertIn('Missing rows: 0  Extra rows: 0  Changed rows: 0', self._rebuild(dry_run=True))
+
+        InventoryTransaction.objects.filter(invoice=invoice).update(total_cost=Decimal('1.00'))
+        self.assertIn('inventory +1 -1', self._rebuild(dry_run=True))
+        self._rebuild()
+        self.assertEqual(InventoryTransaction.objects.get(invoice=invoice).total_cost, Decimal('120.00'))
@@ -15,6 +15,8 @@ from datetime import date, timedelta
 
 from .models import FinanceTransaction, Category, DailyRevenue
 from finance.forms import TransactionForm
+from portal.pagination import KeysetPaginationMixin
+from portal.summaries import summarize
 from procurement.models import PurchaseOrder, PurchasePayment
 
 # Import for PDF generation
@@ -97,11 +99,12 @@ class TransactionUpdateView(UpdateView):
         messages.success(self.request, 'Transaction updated successfully!')
         return super().form_valid(form)
 
-class TransactionListView(ListView):
+class TransactionListView(KeysetPaginationMixin, ListView):
     model = FinanceTransaction
     template_name = 'finance/transaction_list.html'
     paginate_by = 20
     context_object_name = 'transactions'
+    keyset_ordering = ('-date', '-id')
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -123,25 +126,14 @@ class TransactionListView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Calculate totals for the filtered queryset
-        transactions = self.get_queryset()
-        
-        total_income = transactions.filter(
-            type__in=['sale', 'sale_receipt']
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        total_expenses = transactions.filter(
-            type__in=['purchase', 'expense']
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        net_balance = total_income - total_expenses
-        
-        context.update({
-            'total_transactions': transactions.count(),
-            'total_income': total_income,
-            'total_expenses': total_expenses,
-            'net_balance': net_balance,
-        })
+        # Calculate totals for the filtered queryset in a single query
+        totals = summarize(
+            self.object_list,
+            total_transactions=Count('id'),
+            total_income=Sum('amount', filter=Q(type__in=['sale', 'sale_receipt'])),
+            total_expenses=Sum('amount', filter=Q(type__in=['purchase', 'expense'])),
+        )
+        context.update(totals, net_balance=totals['total_income'] - totals['total_expenses'])
         
         return context
 
@@ -6,7 +6,7 @@ from import_export.widgets import ForeignKeyWidget
 from django.contrib.admin import AdminSite
 from django.utils.translation import gettext_lazy as _
 from portal.models import (CartItem, Product, Category, Order, Customer, 
-        Cart, ProductEnquiry, Invoice, InvoiceItem, SoldItem)
+        Cart, ProductEnquiry, Invoice, InvoiceItem, SoldItem, DocumentSequence)
 from portal.widgets import ProductSearchWidget
 from django.utils.html import format_html
 from django import forms
@@ -340,29 +340,17 @@ class ProductAdmin(BarcodeAdminMixin, ImportExportModelAdmin):
             self.message_user(request, "All selected products already have barcodes.", level='warning')
             return
         
-        success_count = 0
-        error_count = 0
-        
-        for product in products_without_barcode:
-            result = BarcodeGenerator.generate_barcode_for_product(product)
-            if result['success']:
-                success_count += 1
-            else:
-                error_count += 1
-        
-        if success_count > 0:
-            self.message_user(
-                request, 
-                f'Successfully generated {success_count} barcode(s).', 
-                level='success'
-            )
-        
-        if error_count > 0:
-            self.message_user(
-                request, 
-                f'Failed to generate {error_count} barcode(s).', 
-                level='error'
-            )
+        try:
+            products = BarcodeGenerator.assign_barcodes(products_without_barcode)
+        except Exception as e:
+            self.message_user(request, f'Failed to generate barcodes: {e}', level='error')
+            return
+
+        self.message_user(
+            request, 
+            f'Successfully generated {len(products)} barcode(s).', 
+            level='success'
+        )
     
     generate_barcodes_for_selected.short_description = "🏷️ Generate barcodes for selected products"
     
@@ -520,4 +508,20 @@ class SoldItemAdmin(admin.ModelAdmin):
         return qs.select_related('invoice', 'invoice__customer', 'product').order_by('-date_sold')
 
 
+@admin.register(DocumentSequence)
+class DocumentSequenceAdmin(admin.ModelAdmin):
+    list_display = ('document_type', 'day', 'last_value', 'updated_at')
+    list_filter = ('document_type',)
+    date_hierarchy = 'day'
+    ordering = ('-day', 'document_type')
+    
+    def has_add_permission(self, request):
+        # Rows are created by DocumentSequence.allocate on the first number of the day
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        # Editing a live counter could hand out duplicate numbers
+        return False
+
+
 # Register a simple admin class for barcode management
@@ -4,6 +4,8 @@ from django.views.decorators.http import require_GET
 from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Q
 from .models import Product
+from .search import search_products
+from .barcode_index import get_by_code
 from django.core import serializers
 import json
 
@@ -18,14 +20,8 @@ def product_search_ajax(request):
     if len(query) < 2:
         return JsonResponse({'products': []})
     
-    # Search in multiple fields
-    products = Product.objects.filter(
-        Q(name__icontains=query) |
-        Q(barcode__icontains=query) |
-        Q(category__name__icontains=query) |
-        Q(description__icontains=query),
-        is_active=True
-    ).select_related('category')[:20]  # Limit to 20 results
+    # Ranked search over names, codes, category and descriptions
+    products = search_products(query, Product.objects.filter(is_active=True)).select_related('category')[:20]
     
     results = []
     for product in products:
@@ -54,9 +50,9 @@ def product_barcode_lookup(request):
         return JsonResponse({'error': 'No barcode provided'}, status=400)
     
     try:
-        product = Product.objects.select_related('category').get(
-            barcode=barcode,
-            is_active=True
+        product = get_by_code(
+            Product.objects.select_related('category').filter(is_active=True),
+            barcode
         )
         
         result = {
@@ -85,14 +81,10 @@ def product_search_public(request):
     if len(query) < 2:
         return JsonResponse({'products': []})
     
-    # Search in multiple fields
-    products = Product.objects.filter(
-        Q(name__icontains=query) |
-        Q(barcode__icontains=query) |
-        Q(category__name__icontains=query),
-        is_active=True,
-        stock__gt=0  # Only show products in stock
-    ).select_related('category')[:15]  # Limit to 15 results
+    # Ranked search; only products in stock
+    products = search_products(
+        query, Product.objects.filter(is_active=True, stock__gt=0)
+    ).select_related('category')[:15]
     
     results = []
     for product in products:
@@ -123,10 +115,9 @@ def product_barcode_lookup_public(request):
         return JsonResponse({'error': 'No barcode provided'}, status=400)
     
     try:
-        product = Product.objects.select_related('category').get(
-            barcode=barcode,
-            is_active=True,
-            stock__gt=0
+        product = get_by_code(
+            Product.objects.select_related('category').filter(is_active=True, stock__gt=0),
+            barcode
         )
         
         result = {
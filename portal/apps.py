@@ -23,5 +23,12 @@ class PortalConfig(AppConfig):
         # Import signals to register them
         try:
             from . import signals  # noqa: F401
+            from . import reference_data  # noqa: F401
+            from . import dashboard  # noqa: F401
+            from . import valuation  # noqa: F401
+            from . import search  # noqa: F401
+            from . import barcode_index  # noqa: F401
+            from . import typeahead  # noqa: F401
+            from . import checks  # noqa: F401
         except Exception:
             pass
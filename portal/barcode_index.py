@@ -0,0 +1,309 @@
+"""
+Shared barcode/SKU index
+
+Scanner lookups are exact matches on ``barcode`` (or ``sku``), and most of the
+cost of a miss or a hit is the database round trip. With
+``settings.BARCODE_INDEX_PATH`` set, every code is written to one compact file
+on local disk: a header with a version stamp, fixed-size entries sorted by
+key, and the key bytes. Each worker memory-maps the file read-only, so all
+workers share the page cache copy and a lookup is a binary search over the
+map. A hit is fetched by primary key (and still checked against the code, so
+a product whose code changed since the last build is never returned by its
+old one).
+
+Requests never rebuild the file. Product saves that change a barcode or SKU,
+creations, deletions and ``BarcodeGenerator.assign_barcodes`` only record the
+time of the change in the cache (``mark_codes_changed``). While that is newer
+than the index's build stamp, misses and mismatched hits are answered by the
+database; otherwise a miss needs no query. ``manage.py rebuild_barcode_index
+--watch`` rebuilds the file in the background whenever it is stale: the new
+file is written next to the old one and moved into place with ``os.replace``;
+workers notice the new inode on their next lookup and swap maps, while lookups
+already running keep reading the old map. Like the version counters of
+``portal.dashboard`` the change time needs a cache shared by all processes.
+Without the setting, lookups go to the database as before.
+"""
+import contextlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_delete, post_init, post_save
+
+from .models import Product
+
+try:
+    import fcntl
+    FLOCK_AVAILABLE = True
+except ImportError:
+    FLOCK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CHANGED_KEY = 'barcodes:index:changed'
+
+MAGIC = b'BCX1'
+FORMAT_VERSION = 1
+
+# magic, format version, stamp (build time in ns), entry count
+HEADER = struct.Struct('<4sIQI')
+# key offset, key length, product id
+ENTRY = struct.Struct('<IH2xQ')
+
+# Key prefix per indexed field, so barcodes and SKUs share one sorted table
+FIELDS = {
+    'barcode': b'B',
+    'sku': b'S',
+}
+
+_lock = threading.Lock()
+_current = None
+
+
+class InvalidIndex(Exception):
+    pass
+
+
+def index_path():
+    """The configured index file, or None when the index is disabled"""
+    return getattr(settings, 'BARCODE_INDEX_PATH', None)
+
+
+def _key(field, code):
+    return FIELDS[field] + code.encode('utf-8')
+
+
+# =============================================================================
+# READING
+# =============================================================================
+
+class BarcodeIndex:
+    """A read-only memory map of one index file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            stat = os.fstat(handle.fileno())
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        if len(self._map) < HEADER.size:
+            raise InvalidIndex(f"Barcode index '{path}' is truncated")
+        magic, version, self.stamp, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise InvalidIndex(f"'{path}' is not a version {FORMAT_VERSION} barcode index")
+        self._keys_start = HEADER.size + self.count * ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, code, field='barcode'):
+        """The product id indexed under ``code``, or None"""
+        key = _key(field, code)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, product_id = ENTRY.unpack_from(self._map, HEADER.size + middle * ENTRY.size)
+            start = self._keys_start + offset
+            probe = self._map[start:start + length]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                return product_id
+        return None
+
+
+def get_index():
+    """
+    This process's map of the current index file, remapped when the file was
+    replaced; None when the index is disabled, missing or unreadable.
+    """
+    global _current
+    path = index_path()
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    index = _current
+    if index is not None and index.signature == signature:
+        return index
+    with _lock:
+        if _current is not None and _current.signature == signature:
+            return _current
+        try:
+            index = BarcodeIndex(path)
+        except (OSError, ValueError, InvalidIndex):
+            logger.exception(f"Could not map the barcode index '{path}'")
+            return None
+        # The previous map is closed once no running lookup holds it
+        _current = index
+    logger.debug(f"Mapped barcode index {index.stamp} ({index.count} keys)")
+    return index
+
+
+def get_by_code(queryset, code, field='barcode'):
+    """
+    ``queryset.get(<field>=code)`` answered from the index: a miss raises
+    DoesNotExist without a query and a hit is fetched by primary key. Falls
+    back to the plain query when there is no index, and for misses when codes
+    changed after the index was built.
+    """
+    index = get_index()
+    if index is None:
+        return queryset.get(**{field: code})
+    product_id = index.lookup(code, field)
+    if product_id is not None:
+        try:
+            return queryset.get(pk=product_id, **{field: code})
+        except queryset.model.DoesNotExist:
+            if not is_stale(index):
+                raise
+    elif not is_stale(index):
+        raise queryset.model.DoesNotExist(f"No product with {field} '{code}'")
+    return queryset.get(**{field: code})
+
+
+def is_stale(index):
+    """Whether codes changed since ``index`` was built"""
+    return (cache.get(CHANGED_KEY) or 0) > index.stamp
+
+
+def read_stamp(path=None):
+    """Build stamp of the index file at ``path`` (default: the configured one); None without a valid file"""
+    path = path or index_path()
+    try:
+        with open(path, 'rb') as handle:
+            magic, version, stamp, _ = HEADER.unpack(handle.read(HEADER.size))
+    except (TypeError, OSError, struct.error):
+        return None
+    return stamp if magic == MAGIC and version == FORMAT_VERSION else None
+
+
+def needs_rebuild(path=None):
+    """Whether the index file at ``path`` is missing or older than the last code change"""
+    stamp = read_stamp(path)
+    return stamp is None or (cache.get(CHANGED_KEY) or 0) > stamp
+
+
+# =============================================================================
+# BUILDING
+# =============================================================================
+
+@contextlib.contextmanager
+def _build_lock(path):
+    """Serialize builds across processes, so an older snapshot never replaces a newer one"""
+    if not FLOCK_AVAILABLE:
+        yield
+        return
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_barcode_index(path=None, using=DEFAULT_DB_ALIAS):
+    """
+    Write the codes of every product of every site to ``path`` (default: the
+    configured one) and atomically replace the previous file. Returns
+    ``(stamp, number of keys)``.
+    """
+    path = path or index_path()
+    if not path:
+        raise InvalidIndex('BARCODE_INDEX_PATH is not set')
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    with _build_lock(path):
+        # Taken before reading, so changes committed during the build leave the file stale
+        stamp = time.time_ns()
+        keys = []
+        codes = Product.all_objects.using(using).values_list('pk', *FIELDS)
+        for row in codes.iterator(chunk_size=5000):
+            product_id, values = row[0], row[1:]
+            keys.extend((_key(field, code), product_id) for field, code in zip(FIELDS, values) if code)
+        keys.sort()
+
+        entries = bytearray(ENTRY.size * len(keys))
+        offset = 0
+        for position, (key, product_id) in enumerate(keys):
+            ENTRY.pack_into(entries, position * ENTRY.size, offset, len(key), product_id)
+            offset += len(key)
+
+        handle, temporary = tempfile.mkstemp(prefix='.barcode-index-', dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as target:
+                target.write(HEADER.pack(MAGIC, FORMAT_VERSION, stamp, len(keys)))
+                target.write(entries)
+                target.write(b''.join(key for key, _ in keys))
+                target.flush()
+                os.fsync(target.fileno())
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporary)
+            raise
+
+    logger.info(f"Built barcode index {stamp} with {len(keys)} keys at {path}")
+    return stamp, len(keys)
+
+
+def _record_change():
+    cache.set(CHANGED_KEY, time.time_ns(), None)
+
+
+def mark_codes_changed(using=None):
+    """Record that product codes changed, so lookups verify misses until the next build"""
+    if not index_path():
+        return
+    _record_change()
+    if connections[using or DEFAULT_DB_ALIAS].in_atomic_block:
+        # A build may read the rows before the write commits
+        transaction.on_commit(_record_change, using=using)
+
+
+# =============================================================================
+# SIGNALS
+# =============================================================================
+
+def _indexed_values(instance):
+    # Deferred fields are left alone rather than loaded
+    return tuple(instance.__dict__.get(field) for field in FIELDS)
+
+
+def remember_codes(sender, instance, **kwargs):
+    instance._indexed_codes = _indexed_values(instance)
+
+
+def product_saved(sender, instance, created=False, raw=False, update_fields=None, using=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(FIELDS):
+        return
+    values = _indexed_values(instance)
+    if created or values != getattr(instance, '_indexed_codes', None):
+        mark_codes_changed(using)
+    instance._indexed_codes = values
+
+
+def product_deleted(sender, instance, using=None, **kwargs):
+    mark_codes_changed(using)
+
+
+post_init.connect(remember_codes, sender=Product, dispatch_uid='barcode_index_post_init_Product')
+post_save.connect(product_saved, sender=Product, dispatch_uid='barcode_index_post_save_Product')
+post_delete.connect(product_deleted, sender=Product, dispatch_uid='barcode_index_post_delete_Product')
@@ -5,47 +5,72 @@ import barcode
 from barcode.writer import ImageWriter
 from io import BytesIO
 import base64
-from django.utils import timezone
-from django.db import models
-import random
-import string
+from django.db import models, transaction
 
 
 class BarcodeGenerator:
     """Generate unique barcodes for products"""
-    
+
+    # EAN13 bodies are the 3-digit prefix followed by a 9-digit sequence, all
+    # inside the GS1 restricted-circulation range (200-299). Legacy random codes
+    # used "290" + YYMM + 5 random digits, so the sequential range cannot clash.
+    PREFIX = "291"
+    SEQUENCE_DIGITS = 9
+
     @staticmethod
     def generate_unique_barcode():
         """Generate a unique EAN13 barcode number"""
-        # EAN13 format: 12 digits + 1 check digit
-        # Use a custom prefix to identify our generated barcodes
-        prefix = "290"  # Country code for internal use
-        
-        # Get current year and month
-        now = timezone.now()
-        year_month = f"{now.year % 100:02d}{now.month:02d}"
-        
-        # Generate random digits for the remaining positions
-        while True:
-            # Generate 5 random digits (3+4+5 = 12 total digits)
-            random_part = ''.join(random.choices(string.digits, k=5))
-            
-            # Combine parts (without check digit) - should be exactly 12 digits
-            barcode_without_check = f"{prefix}{year_month}{random_part}"
-            
-            # Ensure we have exactly 12 digits
-            if len(barcode_without_check) != 12:
-                continue
-                
-            # Calculate EAN13 check digit
-            check_digit = BarcodeGenerator.calculate_ean13_check_digit(barcode_without_check)
-            full_barcode = f"{barcode_without_check}{check_digit}"
-            
-            # Check if this barcode already exists
-            from portal.models import Product
-            if not Product.objects.filter(barcode=full_barcode).exists():
-                return full_barcode
-    
+        return BarcodeGenerator.reserve_barcodes(1)[0]
+
+    @staticmethod
+    def reserve_barcodes(count):
+        """
+        Claim ``count`` sequential EAN13 numbers with one counter update and
+        return them with their check digits. No uniqueness lookups are needed.
+        """
+        from portal.models import DocumentSequence
+        if count < 1:
+            return []
+        first = DocumentSequence.allocate('barcode', count)
+        last = first + count - 1
+        if last >= 10 ** BarcodeGenerator.SEQUENCE_DIGITS:
+            raise ValueError("Barcode sequence exhausted")
+        bodies = [
+            f"{BarcodeGenerator.PREFIX}{value:0{BarcodeGenerator.SEQUENCE_DIGITS}d}"
+            for value in range(first, last + 1)
+        ]
+        return [f"{body}{BarcodeGenerator.calculate_ean13_check_digit(body)}" for body in bodies]
+
+    @staticmethod
+    def assign_barcodes(products, batch_size=500):
+        """
+        Give every product in ``products`` a new barcode from one reserved range
+        and write them with a single ``bulk_update``, refreshing their search
+        documents and flagging the barcode index, which ``bulk_update`` does
+        not. Returns the products.
+        """
+        from portal.barcode_index import mark_codes_changed
+        from portal.models import Product
+        from portal.search import rebuild_search_documents
+        products = list(products)
+        with transaction.atomic():
+            for product, barcode_number in zip(products, BarcodeGenerator.reserve_barcodes(len(products))):
+                product.barcode = barcode_number
+            Product.all_objects.bulk_update(products, ['barcode'], batch_size=batch_size)
+            rebuild_search_documents(Product.all_objects.filter(pk__in=[product.pk for product in products]))
+            mark_codes_changed()
+        return products
+
+    @staticmethod
+    def existing_max_sequence():
+        """Highest sequence already used in the sequential range, to seed the counter"""
+        from portal.models import Product
+        highest = (
+            Product.all_objects.filter(barcode__startswith=BarcodeGenerator.PREFIX, barcode__regex=r'^\d{13}$')
+            .order_by('-barcode').values_list('barcode', flat=True).first()
+        )
+        return int(highest[3:12]) if highest else 0
+
     @staticmethod
     def calculate_ean13_check_digit(code):
         """Calculate the check digit for EAN13 barcode"""
@@ -127,17 +152,11 @@ class BarcodeGenerator:
         """Generate barcodes for all products that don't have SKU or barcode"""
         from portal.models import Product
         products_without_barcode = Product.objects.filter(
-            models.Q(barcode__isnull=True) | models.Q(barcode='') |
-            models.Q(sku__isnull=True) | models.Q(sku='')
+            models.Q(barcode__isnull=True) | models.Q(barcode='')
         )
-        
-        results = []
-        for product in products_without_barcode:
-            if not product.barcode:  # Only generate if no barcode exists
-                result = BarcodeGenerator.generate_barcode_for_product(product)
-                results.append({
-                    'product': product,
-                    'result': result
-                })
-        
-        return results
+
+        products = BarcodeGenerator.assign_barcodes(products_without_barcode)
+        return [
+            {'product': product, 'result': {'success': True, 'barcode_number': product.barcode, 'product': product}}
+            for product in products
+        ]
@@ -149,26 +149,27 @@ def generate_bulk_barcodes(request):
         messages.error(request, 'No products selected')
         return redirect('barcode_generator_dashboard')
     
-    success_count = 0
-    error_count = 0
     errors = []
-    
+    products = Product.objects.filter(id__in=[pk for pk in selected_products if str(pk).isdigit()])
+    found = {str(product.id): product for product in products}
     for product_id in selected_products:
-        try:
-            product = Product.objects.get(id=product_id)
-            if not product.barcode:
-                result = BarcodeGenerator.generate_barcode_for_product(product)
-                if result['success']:
-                    success_count += 1
-                else:
-                    error_count += 1
-                    errors.append(f"{product.name}: {result.get('error', 'Unknown error')}")
-            else:
-                error_count += 1
-                errors.append(f"{product.name}: Already has barcode")
-        except Product.DoesNotExist:
-            error_count += 1
+        if product_id not in found:
             errors.append(f"Product ID {product_id}: Not found")
+
+    pending = []
+    for product in found.values():
+        if product.barcode:
+            errors.append(f"{product.name}: Already has barcode")
+        else:
+            pending.append(product)
+
+    # One reserved range and one bulk_update for the whole selection
+    success_count = 0
+    try:
+        success_count = len(BarcodeGenerator.assign_barcodes(pending))
+    except Exception as e:
+        errors.append(str(e))
+    error_count = len(errors)
     
     # Show results
     if success_count > 0:
@@ -0,0 +1,34 @@
+"""
+System checks for the portal
+
+The version counters of ``portal.dashboard`` (also behind the dashboard ETags,
+the report cache and report job coalescing), ``portal.typeahead`` and
+``portal.reference_data``, like the code change time of
+``portal.barcode_index``, only reach other processes through a shared cache.
+``manage.py check --deploy`` warns when the default cache cannot provide that.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries are not visible to other processes
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f"The default cache ({backend}) is not shared between processes.",
+            hint=(
+                'Dashboard, report and typeahead caches are invalidated (and barcode index changes noticed) '
+                'through the default cache; configure Redis, Memcached or the database cache so every worker sees them.'
+            ),
+            id='portal.W001',
+        )
+    ]
@@ -0,0 +1,56 @@
+"""
+Per-transaction coalescing of deferred work
+
+Writers that need follow-up work (totals recalculation, sales fact rebuilds)
+queue keys with ``pending_batch`` as often as they like. Inside a transaction
+the keys collect in one batch per kind of work and connection, flushed by a
+single ``on_commit`` callback, so the work runs once per key when the
+transaction commits. A rollback drops the callback together with the work it
+was queued for; the next write then starts a fresh batch.
+"""
+import threading
+from collections import defaultdict
+
+from django.db import connections, transaction
+
+_local = threading.local()
+
+
+class _Batch:
+    """Keys awaiting ``run`` in the current transaction of one connection"""
+
+    def __init__(self, name, using, run):
+        self.name = name
+        self.using = using
+        self.run = run
+        self.keys = defaultdict(set)
+
+    def flush(self):
+        pending = _pending()
+        if pending.get((self.name, self.using)) is self:
+            del pending[(self.name, self.using)]
+        self.run(self.keys, self.using)
+
+    def is_registered(self, connection):
+        return any(hook[1] == self.flush for hook in connection.run_on_commit)
+
+
+def _pending():
+    if not hasattr(_local, 'pending'):
+        _local.pending = {}
+    return _local.pending
+
+
+def pending_batch(name, run, using):
+    """
+    The keys queued under ``name`` in the current transaction of ``using``: a
+    ``defaultdict(set)`` to add to. ``run(keys, using)`` receives it once the
+    transaction commits. Callers outside a transaction run their work directly.
+    """
+    connection = connections[using]
+    pending = _pending()
+    batch = pending.get((name, using))
+    if batch is None or not batch.is_registered(connection):
+        batch = pending[(name, using)] = _Batch(name, using, run)
+        transaction.on_commit(batch.flush, using=using)
+    return batch.keys
@@ -0,0 +1,519 @@
+"""
+Dashboard metrics service
+
+``DashboardMetrics`` computes every figure shown on the dashboard and its
+summary fragment with one query per table: the Invoice, PurchaseOrder and
+Customer figures are conditional aggregates (``Count``/``Sum`` with
+``filter=``) evaluated as window functions next to the table's most recent
+rows, the Product figures come from the running counters of
+``portal.valuation``, and the product lists are picked from one union of their
+candidates. The whole result is cached per site. The summary is also split into
+tiles (``TILES``) that are cached with their own timeouts and can be computed
+concurrently, each on its own database connection.
+
+Cache keys embed a per-site version counter. The post_save/post_delete and
+``totals_changed`` receivers at the bottom bump the counter of the written
+row's site, which orphans the cached metrics at once; inside a transaction the
+counter is bumped again on commit so a dashboard read between the write and the
+commit cannot keep stale figures alive. Sales fact rebuilds bump it too, as
+they write in bulk. ``DASHBOARD_CACHE_TIMEOUT`` (seconds,
+default 300) only bounds how long figures that depend on the date can lag.
+
+The counters live in the default cache, which every web and worker process
+must share (Redis, Memcached or the database cache, as for
+``portal.reference_data``): besides these metrics they key the dashboard
+ETags, the report cache of ``portal.reports`` and the job coalescing of
+``portal.report_jobs``. With the per-process local memory cache a process
+never sees the bumps of writes made by another one and keeps serving stale
+figures; ``manage.py check --deploy`` warns about such a cache (see
+``portal.checks``).
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import Case, CharField, Count, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When, Window
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from procurement.models import PurchaseOrder, Supplier
+
+from .models import Customer, DailySalesFact, InventoryValuation, Invoice, Product
+from .totals import totals_changed
+
+VERSION_KEY = 'dashboard:version:{site_id}'
+METRICS_KEY = 'dashboard:metrics:{site_id}:{version}:{day}'
+TILE_KEY = 'dashboard:tile:{site_id}:{tile}:{version}:{day}'
+
+# Tiles of the dashboard summary and how long each may be served from the cache
+# (seconds) while no write bumps the version; DASHBOARD_TILE_TIMEOUTS overrides them
+TILES = {
+    'revenue': 60,
+    'inventory': 300,
+    'procurement': 300,
+    'categories': 900,
+    'high_value_products': 900,
+}
+
+
+def _cache_timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def tile_timeout(name):
+    return getattr(settings, 'DASHBOARD_TILE_TIMEOUTS', {}).get(name, TILES[name])
+
+
+def data_version(site_id):
+    """Counter bumped on every write that can change the dashboard of ``site_id``"""
+    return cache.get(VERSION_KEY.format(site_id=site_id)) or 0
+
+
+def dashboard_etag(site_id, *parts):
+    """ETag for a dashboard response built from ``parts``, stable until the site's data changes"""
+    key = ':'.join(str(part) for part in (site_id, data_version(site_id), timezone.now().date(), *parts))
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+class DashboardMetrics:
+    """Dashboard figures and lists of one site, cached until the site's data changes"""
+
+    def __init__(self, site_id=None, today=None):
+        self.site_id = site_id or settings.SITE_ID
+        self.today = today or timezone.now().date()
+        self.month_start = self.today.replace(day=1)
+        self.last_month_end = self.month_start - timedelta(days=1)
+        self.last_month_start = self.last_month_end.replace(day=1)
+        self._loaded = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self):
+        """All metrics as a dict, from the cache when the site has not changed since"""
+        version = data_version(self.site_id)
+        key = METRICS_KEY.format(site_id=self.site_id, version=version, day=self.today.isoformat())
+        metrics = cache.get(key)
+        if metrics is None:
+            metrics = self.compute()
+            cache.set(key, metrics, _cache_timeout())
+        return metrics
+
+    def compute(self):
+        metrics = {'current_month': self.month_start.strftime('%B %Y')}
+        for name in TILES:
+            metrics.update(self.compute_tile(name))
+        metrics.update(self.lists())
+        return metrics
+
+    # =========================================================================
+    # TILES - independently cached parts of the dashboard
+    # =========================================================================
+
+    def tile(self, name):
+        """Figures of one tile, cached for the tile's own timeout"""
+        return self.tiles([name])[name]
+
+    def tiles(self, names, workers=None):
+        """
+        Figures of several tiles keyed by name. Tiles missing from the cache are
+        computed concurrently on a bounded thread pool, each thread on its own
+        database connection, so the slowest tile sets the latency.
+        """
+        for name in names:
+            if name not in TILES:
+                raise KeyError(f"Unknown dashboard tile '{name}'")
+        version = data_version(self.site_id)
+        keys = {
+            name: TILE_KEY.format(site_id=self.site_id, tile=name, version=version, day=self.today.isoformat())
+            for name in names
+        }
+        cached = cache.get_many(keys.values())
+        results = {name: cached[key] for name, key in keys.items() if key in cached}
+        missing = [name for name in names if name not in results]
+
+        workers = min(workers or getattr(settings, 'DASHBOARD_TILE_WORKERS', 4), len(missing))
+        if workers > 1 and not connection.in_atomic_block:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                computed = dict(zip(missing, pool.map(self._compute_tile_in_thread, missing)))
+        else:
+            # Other connections would not see the rows of an open transaction
+            computed = {name: self.compute_tile(name) for name in missing}
+
+        for name, figures in computed.items():
+            cache.set(keys[name], figures, tile_timeout(name))
+        results.update(computed)
+        return results
+
+    def compute_tile(self, name):
+        return getattr(self, f'{name}_tile')()
+
+    def _compute_tile_in_thread(self, name):
+        try:
+            return self.compute_tile(name)
+        finally:
+            # Pool threads are not closed by the request cycle, so drop their connections here
+            connections.close_all()
+
+    def revenue_tile(self):
+        return {
+            'total_customers': self._customers()[0]['total_customers'],
+            **self.invoice_figures(),
+        }
+
+    def inventory_tile(self):
+        return self.product_figures()
+
+    def procurement_tile(self):
+        return {
+            'active_suppliers': Supplier.all_objects.filter(site_id=self.site_id, is_active=True).count(),
+            **self.purchase_order_figures(),
+        }
+
+    def categories_tile(self):
+        rows = sorted(
+            (row for row in self._valuations() if row.category_id is not None and row.active_count > 0),
+            key=lambda row: -row.active_count,
+        )[:5]
+        return {
+            'products_by_category': [
+                {
+                    'category__name': row.category.name,
+                    'count': row.active_count,
+                    'total_cost_value': row.cost_value,
+                    'total_value': row.selling_value,
+                    'profit': row.potential_profit,
+                    'avg_cost': row.avg_cost_price,
+                    'avg_selling': row.avg_unit_price,
+                    'profit_margin': (
+                        (row.avg_unit_price - row.avg_cost_price) / row.avg_cost_price * 100
+                        if row.avg_cost_price > 0 else 0
+                    ),
+                }
+                for row in rows
+            ],
+        }
+
+    def high_value_products_tile(self):
+        return {'high_value_products': self._products()['high_value_products']}
+
+    # =========================================================================
+    # AGGREGATES - one query per table
+    # =========================================================================
+
+    def product_figures(self):
+        # Read from the running counters instead of scanning the products
+        valuation = next(
+            (row for row in self._valuations() if row.category_id is None), None,
+        ) or InventoryValuation(site_id=self.site_id)
+        figures = {
+            'active_products': valuation.active_count,
+            'total_inventory_cost_value': valuation.cost_value,
+            'total_inventory_value': valuation.selling_value,
+            'potential_profit': valuation.potential_profit,
+            'avg_cost_price': valuation.avg_cost_price,
+            'avg_product_cost': valuation.avg_unit_price,
+        }
+        figures['avg_profit_margin'] = 0
+        if figures['avg_cost_price'] > 0:
+            figures['avg_profit_margin'] = (
+                (figures['avg_product_cost'] - figures['avg_cost_price']) / figures['avg_cost_price']
+            ) * 100
+        return figures
+
+    def invoice_figures(self):
+        figures = dict(self._invoices()[0])
+        figures['monthly_revenue'] = figures['monthly_revenue'] or 0
+        figures['last_month_revenue'] = figures['last_month_revenue'] or 0
+
+        figures['revenue_change'] = 0
+        if figures['last_month_revenue'] > 0:
+            figures['revenue_change'] = (
+                (figures['monthly_revenue'] - figures['last_month_revenue']) / figures['last_month_revenue']
+            ) * 100
+        return figures
+
+    def purchase_order_figures(self):
+        figures = dict(self._purchase_orders()[0])
+        figures['total_procurement_value'] = figures['total_procurement_value'] or 0
+        figures['monthly_procurement'] = figures['monthly_procurement'] or 0
+
+        figures['avg_order_value'] = 0
+        if figures['total_purchase_orders'] > 0:
+            figures['avg_order_value'] = figures['total_procurement_value'] / figures['total_purchase_orders']
+        return figures
+
+    # =========================================================================
+    # LISTS
+    # =========================================================================
+
+    def lists(self):
+        return {
+            'recent_invoices': self._invoices()[1],
+            'recent_purchase_orders': self._purchase_orders()[1],
+            'recent_customers': self._customers()[1],
+            'low_stock_products': self._products()['low_stock_products'],
+            'recent_products': self._products()['recent_products'],
+            'top_products': self._products()['top_products'],
+        }
+
+    # =========================================================================
+    # LOADS - shared by the tiles and lists of one DashboardMetrics
+    # =========================================================================
+
+    def _shared(self, name, loader):
+        """
+        ``loader()``, run once per instance: tiles and lists that read the same
+        table reuse one query, also when the tiles run on the thread pool.
+        """
+        with self._lock:
+            lock = self._load_locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._loaded:
+                self._loaded[name] = loader()
+            return self._loaded[name]
+
+    def _invoices(self):
+        """``(figures, ten most recent invoices)`` of the site"""
+        paid = Q(status='paid')
+        return self._shared('invoices', lambda: _with_totals(
+            Invoice.all_objects.filter(site_id=self.site_id).select_related('customer').order_by('-date'),
+            10,
+            pending_invoices=Count('id', filter=Q(status__in=['draft', 'pending'])),
+            monthly_revenue=Sum('grand_total', filter=paid & Q(date__gte=self.month_start)),
+            last_month_revenue=Sum(
+                'grand_total', filter=paid & Q(date__gte=self.last_month_start, date__lte=self.last_month_end),
+            ),
+        ))
+
+    def _purchase_orders(self):
+        """``(figures, ten most recent purchase orders)`` of the site"""
+        return self._shared('purchase_orders', lambda: _with_totals(
+            PurchaseOrder.all_objects.filter(site_id=self.site_id).select_related('supplier').order_by('-created_at'),
+            10,
+            pending_purchase_orders=Count('id', filter=Q(status__in=['draft', 'ordered'])),
+            total_purchase_orders=Count('id'),
+            total_procurement_value=Sum('total'),
+            monthly_procurement=Sum('total', filter=Q(order_date__gte=self.month_start)),
+        ))
+
+    def _customers(self):
+        """``(figures, five most recent customers)`` of the site"""
+        return self._shared('customers', lambda: _with_totals(
+            Customer.all_objects.filter(site_id=self.site_id).order_by('-created_at'),
+            5,
+            total_customers=Count('id'),
+        ))
+
+    def _valuations(self):
+        """The site's InventoryValuation rows: the site total and one per category"""
+        return self._shared('valuations', lambda: list(
+            InventoryValuation.all_objects.filter(site_id=self.site_id).select_related('category')
+        ))
+
+    def _products(self):
+        """
+        The product lists, read in one query: the union of the ten most
+        expensive, lowest stocked and newest active products and the five best
+        sellers of the month, each list then picked from the union in Python.
+        """
+        return self._shared('products', self._load_products)
+
+    def _load_products(self):
+        products = Product.all_objects.filter(site_id=self.site_id)
+        active = products.filter(is_active=True)
+        facts = DailySalesFact.all_objects.filter(site_id=self.site_id, date__gte=self.month_start)
+        month_sales = facts.filter(product_id=OuterRef('pk')).values('product_id')
+        best_sellers = (
+            facts.filter(product__isnull=False)
+            .values('product_id')
+            .annotate(total_qty=Sum('quantity'))
+            .order_by('-total_qty')
+            .values('product_id')[:5]
+        )
+        rows = list(
+            products.filter(
+                Q(pk__in=active.order_by('-unit_price').values('pk')[:10])
+                | Q(pk__in=active.filter(stock__lte=10).order_by('stock').values('pk')[:10])
+                | Q(pk__in=active.order_by('-id').values('pk')[:10])
+                | Q(pk__in=best_sellers)
+            )
+            .select_related('category')
+            .annotate(
+                profit_per_unit=F('unit_price') - F('cost_price'),
+                total_cost_value=F('cost_price') * F('stock'),
+                total_selling_value=F('unit_price') * F('stock'),
+                profit_margin_calc=Case(
+                    When(cost_price__gt=0, then=(F('unit_price') - F('cost_price')) / F('cost_price') * 100),
+                    default=0,
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+                month_quantity=Subquery(month_sales.annotate(total=Sum('quantity')).values('total')),
+                month_revenue=Subquery(
+                    month_sales.annotate(total=Sum('revenue')).values('total'),
+                    output_field=DecimalField(max_digits=14, decimal_places=2),
+                ),
+            )
+        )
+        active_rows = [product for product in rows if product.is_active]
+        sold = sorted((product for product in rows if product.month_quantity), key=lambda p: -p.month_quantity)
+        return {
+            'high_value_products': sorted(active_rows, key=lambda product: -product.unit_price)[:10],
+            'low_stock_products': sorted(
+                (product for product in active_rows if product.stock <= 10), key=lambda product: product.stock,
+            )[:10],
+            'recent_products': sorted(active_rows, key=lambda product: -product.pk)[:10],
+            'top_products': [
+                {'product__name': product.name, 'total_qty': product.month_quantity, 'total_revenue': product.month_revenue}
+                for product in sold[:5]
+            ],
+        }
+
+
+def _with_totals(queryset, limit, **aggregates):
+    """
+    ``(figures, first rows)`` of ``queryset`` in one query: the aggregates are
+    evaluated as window functions over every row of the queryset, before the
+    ``limit``, and read from the first row (empty tables give empty figures).
+    """
+    rows = list(queryset.annotate(**{name: Window(aggregate) for name, aggregate in aggregates.items()})[:limit])
+    if rows:
+        figures = {name: getattr(rows[0], name) for name in aggregates}
+    else:
+        figures = {name: 0 if isinstance(aggregate, Count) else None for name, aggregate in aggregates.items()}
+    return figures, rows
+
+
+# =============================================================================
+# REVENUE TIME SERIES
+# =============================================================================
+
+BUCKETS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def bucket_start(day, bucket):
+    """First day of the ``bucket`` containing ``day`` (weeks start on Monday, like TruncWeek)"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_range(start, end, bucket):
+    """Start days of every ``bucket`` overlapping ``start`` to ``end`` (inclusive)"""
+    buckets = []
+    current = bucket_start(start, bucket)
+    while current <= end:
+        buckets.append(current)
+        if bucket == 'month':
+            current = (current + timedelta(days=32)).replace(day=1)
+        else:
+            current += timedelta(days=7 if bucket == 'week' else 1)
+    return buckets
+
+
+def revenue_series(start, end, bucket='day', site_id=None):
+    """
+    Paid revenue from ``start`` to ``end`` (inclusive) per ``bucket``, next to
+    the period of the same length right before it. Both periods come from one
+    GROUP BY over the truncated invoice date; buckets without sales are filled
+    in with zeros::
+
+        {'current': [{'date': date, 'revenue': Decimal, 'invoices': int}, ...],
+         'previous': [...],
+         'totals': {'current': Decimal, 'previous': Decimal, 'change': float}}
+    """
+    site_id = site_id or settings.SITE_ID
+    previous_end = start - timedelta(days=1)
+    previous_start = previous_end - (end - start)
+    rows = (
+        Invoice.all_objects.filter(site_id=site_id, status='paid', date__gte=previous_start, date__lte=end)
+        .annotate(
+            bucket=BUCKETS[bucket]('date'),
+            period=Case(
+                When(date__lt=start, then=Value('previous')),
+                default=Value('current'),
+                output_field=CharField(),
+            ),
+        )
+        .values('period', 'bucket')
+        .annotate(revenue=Sum('grand_total'), invoices=Count('id'))
+        .order_by()
+    )
+    found = {(row['period'], row['bucket']): row for row in rows}
+
+    series = {}
+    for period, first, last in (('current', start, end), ('previous', previous_start, previous_end)):
+        series[period] = []
+        for day in bucket_range(first, last, bucket):
+            row = found.get((period, day), {})
+            series[period].append({
+                'date': day,
+                'revenue': row.get('revenue') or 0,
+                'invoices': row.get('invoices') or 0,
+            })
+
+    current = sum(point['revenue'] for point in series['current'])
+    previous = sum(point['revenue'] for point in series['previous'])
+    series['totals'] = {
+        'current': current,
+        'previous': previous,
+        'change': float((current - previous) / previous * 100) if previous else 0,
+    }
+    return series
+
+
+def top_customers(start, end, limit=5, site_id=None):
+    """Customers with the most paid revenue from ``start`` to ``end`` (inclusive)"""
+    site_id = site_id or settings.SITE_ID
+    return list(
+        Invoice.all_objects.filter(
+            site_id=site_id, status='paid', customer__isnull=False, date__gte=start, date__lte=end,
+        )
+        .values('customer_id', 'customer__full_name')
+        .annotate(revenue=Sum('grand_total'))
+        .order_by('-revenue')[:limit]
+    )
+
+
+# =============================================================================
+# INVALIDATION
+# =============================================================================
+
+def invalidate_dashboard(site_id):
+    """Orphan the cached metrics of ``site_id``"""
+    key = VERSION_KEY.format(site_id=site_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _invalidate_for(site_id):
+    invalidate_dashboard(site_id)
+    if connection.in_atomic_block:
+        # Other requests may recompute from the old rows before the write commits
+        transaction.on_commit(lambda: invalidate_dashboard(site_id))
+
+
+def invalidate_dashboard_metrics(sender, instance, **kwargs):
+    _invalidate_for(instance.site_id)
+
+
+def _invalidate_on_totals(sender, pk, previous, totals, document, **kwargs):
+    # Totals are recalculated when the line writes commit, so no second bump is needed
+    invalidate_dashboard(document['site_id'])
+
+
+for _model in (
+    'portal.Customer', 'portal.Product', 'portal.Category', 'portal.Invoice',
+    'procurement.Supplier', 'procurement.PurchaseOrder',
+):
+    post_save.connect(invalidate_dashboard_metrics, sender=_model, dispatch_uid=f'dashboard_save_{_model}')
+    post_delete.connect(invalidate_dashboard_metrics, sender=_model, dispatch_uid=f'dashboard_delete_{_model}')
+totals_changed.connect(_invalidate_on_totals, dispatch_uid='dashboard_totals_changed')
@@ -0,0 +1,178 @@
+"""
+Streaming report exports
+
+Each export is a flat ``values_list`` projection (related names come through
+joins, never per-row lookups) read with ``.iterator(chunk_size=...)``, so the
+rows are never held in memory together. ``export_rows`` yields the header and
+rows; ``stream_csv`` turns them into CSV chunks for a StreamingHttpResponse,
+and ``write_xlsx`` writes them with XlsxWriter in constant-memory mode when the
+package is installed.
+"""
+import csv
+from decimal import Decimal
+
+from django.conf import settings
+
+from procurement.models import PurchaseOrder, PurchasePayment
+
+from .models import Invoice
+
+try:
+    import xlsxwriter
+    XLSX_AVAILABLE = True
+except ImportError:
+    XLSX_AVAILABLE = False
+
+CHUNK_SIZE = 2000
+
+
+def _invoices(filters, site_id):
+    invoices = Invoice.all_objects.filter(site_id=site_id)
+    if filters.get('customer_id'):
+        invoices = invoices.filter(customer_id=filters['customer_id'])
+    if filters.get('date_from'):
+        invoices = invoices.filter(date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        invoices = invoices.filter(date__lte=filters['date_to'])
+    if filters.get('status'):
+        invoices = invoices.filter(status=filters['status'])
+    return invoices.order_by('date', 'pk')
+
+
+def _purchase_orders(filters, site_id):
+    orders = PurchaseOrder.all_objects.filter(site_id=site_id)
+    if filters.get('supplier_id'):
+        orders = orders.filter(supplier_id=filters['supplier_id'])
+    if filters.get('date_from'):
+        orders = orders.filter(order_date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        orders = orders.filter(order_date__lte=filters['date_to'])
+    if filters.get('status'):
+        orders = orders.filter(status=filters['status'])
+    return orders.order_by('order_date', 'pk')
+
+
+def _payments(filters, site_id):
+    payments = PurchasePayment.objects.filter(purchase_order__site_id=site_id)
+    if filters.get('supplier_id'):
+        payments = payments.filter(purchase_order__supplier_id=filters['supplier_id'])
+    if filters.get('date_from'):
+        payments = payments.filter(payment_date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        payments = payments.filter(payment_date__lte=filters['date_to'])
+    return payments.order_by('payment_date', 'pk')
+
+
+def _date(value):
+    return value.strftime('%Y-%m-%d') if value else ''
+
+
+def _datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def _choice(choices):
+    labels = dict(choices)
+    return lambda value: labels.get(value, value or '')
+
+
+def _text(value):
+    return value or ''
+
+
+# Per export: queryset builder and (header, field, formatter) columns
+EXPORTS = {
+    'invoices': (_invoices, (
+        ('Invoice Number', 'invoice_number', _text),
+        ('Customer', 'customer__full_name', _text),
+        ('Date', 'date', _date),
+        ('Subtotal', 'subtotal', None),
+        ('Tax', 'tax', None),
+        ('Discount', 'discount_amount', None),
+        ('Grand Total', 'grand_total', None),
+        ('Status', 'status', _choice(Invoice.INVOICE_STATUS)),
+        ('Payment Mode', 'payment_mode', _choice(Invoice.PAYMENT_MODES)),
+    )),
+    'purchase_orders': (_purchase_orders, (
+        ('PO Reference', 'reference', None),
+        ('Supplier', 'supplier__name', _text),
+        ('Order Date', 'order_date', _date),
+        ('Delivery Date', 'delivery_date', _date),
+        ('Total Amount', 'total', None),
+        ('Status', 'status', _choice(PurchaseOrder._meta.get_field('status').choices)),
+        ('Created At', 'created_at', _datetime),
+    )),
+    'payments': (_payments, (
+        ('Payment Date', 'payment_date', _date),
+        ('PO Reference', 'purchase_order__reference', _text),
+        ('Supplier', 'purchase_order__supplier__name', _text),
+        ('Amount', 'amount', None),
+        ('Payment Method', 'payment_method', _choice(PurchasePayment.PAYMENT_METHODS)),
+        ('Reference', 'reference', _text),
+        ('Notes', 'notes', _text),
+        ('Created At', 'created_at', _datetime),
+    )),
+}
+
+
+def export_queryset(export_type, filters, site_id=None):
+    """The filtered queryset behind ``export_type``, before projection"""
+    build, _ = EXPORTS[export_type]
+    return build(filters, site_id or settings.SITE_ID)
+
+
+def export_rows(export_type, filters, site_id=None, chunk_size=CHUNK_SIZE):
+    """Yield the header and then one list of cell values per record"""
+    _, columns = EXPORTS[export_type]
+    yield [header for header, _, _ in columns]
+
+    formatters = [formatter for _, _, formatter in columns]
+    rows = export_queryset(export_type, filters, site_id).values_list(*(field for _, field, _ in columns))
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield [formatter(value) if formatter else value for formatter, value in zip(formatters, row)]
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back to the csv writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Yield CSV encoded ``rows`` one line at a time"""
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(rows, target):
+    """Write ``rows`` as CSV to the text file ``target``; returns the number of data rows"""
+    writer = csv.writer(target)
+    count = -1
+    for count, row in enumerate(rows):
+        writer.writerow(row)
+    return max(count, 0)
+
+
+def write_xlsx(rows, target, sheet_name='Export'):
+    """
+    Write ``rows`` to the XLSX file ``target`` (a path or binary file) in
+    XlsxWriter's constant-memory mode, which flushes every row to disk as soon
+    as the next one starts. Returns the number of data rows.
+    """
+    if not XLSX_AVAILABLE:
+        raise RuntimeError('XLSX export requires the XlsxWriter package')
+
+    workbook = xlsxwriter.Workbook(target, {'constant_memory': True, 'in_memory': False})
+    try:
+        sheet = workbook.add_worksheet(sheet_name)
+        header = workbook.add_format({'bold': True})
+        count = -1
+        for count, row in enumerate(rows):
+            # XlsxWriter writes numbers as floats; Decimals would be written as text
+            cells = [float(value) if isinstance(value, Decimal) else value for value in row]
+            sheet.write_row(count, 0, cells, header if count == 0 else None)
+    finally:
+        workbook.close()
+    return max(count, 0)
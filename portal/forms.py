@@ -36,9 +36,9 @@ class InvoiceForm(forms.ModelForm):
         if invoice_number in [None, '', 'Auto-generated']:
             print("🔍 FORM: Returning None for auto-generation")
             return None  # Return None instead of 'Auto-generated'
-        if len(invoice_number) != 10 or not invoice_number.isdigit():
+        if len(invoice_number) < 10 or not invoice_number.isdigit():
             print(f"🔍 FORM: Invalid invoice number format: {invoice_number}")
-            raise forms.ValidationError("Invoice number must be 10 digits (YYYYMMDDNN)")
+            raise forms.ValidationError("Invoice number must be at least 10 digits (YYYYMMDDNN)")
         print(f"🔍 FORM: Valid invoice number: {invoice_number}")
         return invoice_number
 
@@ -0,0 +1,65 @@
+"""
+Streaming input helpers shared by the bulk import management commands
+"""
+import csv
+import json
+import sys
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.management.base import CommandError
+
+
+def resolve_site(value=None):
+    """Site for a ``--site`` option given as an ID or a domain (default: settings.SITE_ID)"""
+    if not value:
+        return Site.objects.get(pk=settings.SITE_ID)
+    lookup = {'pk': value} if str(value).isdigit() else {'domain': value}
+    try:
+        return Site.objects.get(**lookup)
+    except Site.DoesNotExist:
+        raise CommandError(f'Site {value} not found')
+
+
+def guess_format(path):
+    """``jsonl`` for .jsonl/.json files, ``csv`` for anything else"""
+    return 'jsonl' if path.endswith(('.jsonl', '.json')) else 'csv'
+
+
+@contextmanager
+def open_records(path, fmt=None):
+    """
+    Open ``path`` (``-`` for stdin) and yield an iterator of dict records.
+    CSV rows come from ``csv.DictReader``; JSONL files hold one object per line.
+    Records are read lazily so arbitrarily large files stream in constant memory.
+    """
+    fmt = fmt or guess_format(path)
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+    try:
+        yield _read_records(stream, fmt)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _read_records(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise CommandError(f'Invalid JSON on line {line_number}: {exc}')
@@ -0,0 +1,196 @@
+"""
+Batched invoice line ingestion shared by the invoice views and bulk importers,
+and the single pass over paid invoice lines shared by the sales ledgers
+"""
+import decimal
+import logging
+from contextlib import contextmanager
+from decimal import Decimal
+
+from .models import InvoiceItem, Product, SoldItem
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceLineError(ValueError):
+    """Raised for an invalid invoice line when ingesting in strict mode"""
+
+
+def parse_invoice_lines(items_data, strict=False):
+    """
+    Normalize the posted ``items`` JSON into line dicts.
+
+    Every referenced product is resolved with a single ``in_bulk`` query and the
+    lines are validated against that in-memory map. Invalid lines are skipped
+    with a warning, or raise ``InvoiceLineError`` when ``strict`` is set.
+    Each returned line has ``id``, ``product``, ``quantity`` and ``unit_price``.
+    """
+    candidates = []
+    for item in items_data:
+        raw_product_id = str(item.get('product') or '').strip()
+        try:
+            product_id = int(raw_product_id)
+        except (ValueError, TypeError):
+            if strict:
+                raise InvoiceLineError(f"Invalid product ID '{raw_product_id}'")
+            logger.warning(f"Skipping invoice line with invalid product ID: {item}")
+            continue
+        candidates.append((item, product_id))
+
+    products = Product.objects.in_bulk({product_id for _, product_id in candidates})
+
+    lines = []
+    for item, product_id in candidates:
+        product = products.get(product_id)
+        if product is None:
+            if strict:
+                raise InvoiceLineError(f"Product not found with ID: {product_id}")
+            logger.error(f"Product not found with ID: {product_id}")
+            continue
+
+        lines.append({
+            'id': _parse_item_id(item.get('id')),
+            'product': product,
+            'quantity': _parse_quantity(item.get('quantity', '1')),
+            'unit_price': _parse_unit_price(item, product),
+        })
+    return lines
+
+
+def lines_subtotal(lines):
+    """Subtotal of parsed lines, computed in the same pass as ingestion"""
+    return sum((Decimal(line['quantity']) * line['unit_price'] for line in lines), Decimal('0.00'))
+
+
+def add_invoice_items(invoice, lines):
+    """Insert all lines for a new invoice with one ``bulk_create``"""
+    items = [_build_item(invoice, line) for line in lines]
+    return InvoiceItem.objects.bulk_create(items)
+
+
+def sync_invoice_items(invoice, lines):
+    """
+    Apply an edited line set to an existing invoice: changed lines go through one
+    ``bulk_update``, removed lines through one ``delete`` and new lines through
+    one ``bulk_create``.
+    """
+    existing = {item.id: item for item in invoice.items.all()}
+    kept_ids = set()
+    changed = []
+    new_items = []
+
+    for line in lines:
+        if not line['id']:
+            new_items.append(_build_item(invoice, line))
+            continue
+
+        item = existing.get(line['id'])
+        if item is None:
+            logger.warning(f"Ignoring line {line['id']} which does not belong to invoice {invoice.pk}")
+            continue
+
+        kept_ids.add(item.id)
+        if (item.product_id, item.quantity, item.unit_price) != (line['product'].id, line['quantity'], line['unit_price']):
+            item.product = line['product']
+            item.quantity = line['quantity']
+            item.unit_price = line['unit_price']
+            changed.append(item)
+
+    removed_ids = set(existing) - kept_ids
+    if removed_ids:
+        invoice.items.filter(id__in=removed_ids).delete()
+    if changed:
+        InvoiceItem.objects.bulk_update(changed, ['product', 'quantity', 'unit_price'])
+    if new_items:
+        InvoiceItem.objects.bulk_create(new_items)
+
+    logger.info(
+        f"Invoice {invoice.invoice_number}: {len(new_items)} line(s) added, "
+        f"{len(changed)} updated, {len(removed_ids)} removed"
+    )
+
+
+def sales_lines(invoice_ids, chunk_size=2000):
+    """
+    Stream the lines of the given invoices with product and category joined in,
+    so SoldItem and finance rows can be built in one pass without per-line queries.
+    """
+    return (
+        InvoiceItem.all_objects.filter(invoice_id__in=invoice_ids)
+        .select_related('product__category')
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def build_sold_item(invoice, item, **fields):
+    """Unsaved SoldItem recording ``item`` of paid ``invoice``; ``fields`` override defaults"""
+    product = item.product
+    return SoldItem(
+        invoice_id=invoice.pk,
+        product=product,
+        product_name=product.name,
+        product_sku=product.sku,
+        category_name=product.category.name if product.category else '',
+        quantity=item.quantity,
+        unit_price=item.unit_price or product.unit_price,
+        unit_cost=product.cost_price,
+        site_id=invoice.site_id,
+        **fields,
+    )
+
+
+@contextmanager
+def keep_historic_dates(*fields):
+    """
+    Temporarily turn off ``auto_now_add`` on the given model fields so bulk loads
+    can write the original document dates, e.g.
+    ``keep_historic_dates(Invoice._meta.get_field('date'))``.
+
+    This patches shared field state, so only use it from management commands.
+    """
+    previous = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in previous:
+            field.auto_now_add = value
+
+
+def _build_item(invoice, line):
+    return InvoiceItem(
+        invoice=invoice,
+        site_id=invoice.site_id,
+        product=line['product'],
+        quantity=line['quantity'],
+        unit_price=line['unit_price'],
+    )
+
+
+def _parse_item_id(value):
+    try:
+        return int(value) if value else None
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_quantity(value):
+    try:
+        quantity = int(value)
+    except (ValueError, TypeError):
+        logger.warning(f"Invalid quantity '{value}', defaulting to 1")
+        return 1
+    return quantity if quantity > 0 else 1
+
+
+def _parse_unit_price(item, product):
+    # bulk_create skips InvoiceItem.save, so fall back to the product price here
+    raw_price = item.get('selling_price', item.get('unit_price'))
+    if raw_price in (None, ''):
+        return product.unit_price
+    try:
+        return Decimal(str(raw_price))
+    except (ValueError, TypeError, decimal.InvalidOperation):
+        logger.warning(f"Invalid price '{raw_price}', using product price")
+        return product.unit_price
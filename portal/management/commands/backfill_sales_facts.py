@@ -0,0 +1,78 @@
+"""
+Management command to (re)build the daily sales facts from sold items
+
+The migration that creates the facts fills them, and paid invoices keep them
+current; run this to repair a range after bulk changes that bypass signals.
+Facts are rebuilt one month at a time, each with one grouped query over the
+sold items of paid invoices and one bulk insert. Sold items recorded before
+unit costs were kept fall back to the product's current cost price.
+"""
+from datetime import date, datetime, timedelta
+
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from portal.import_utils import resolve_site
+from portal.models import Invoice
+from portal.sales_facts import rebuild_sales_facts
+
+
+class Command(BaseCommand):
+    help = 'Build the daily sales facts used by reports and dashboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            help='Only backfill this site (ID or domain; default: all sites)',
+        )
+        parser.add_argument(
+            '--from',
+            dest='start',
+            help='First day to backfill (YYYY-MM-DD; default: first paid invoice)',
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            help='Last day to backfill (YYYY-MM-DD, inclusive; default: last paid invoice)',
+        )
+
+    def handle(self, *args, **options):
+        sites = [resolve_site(options['site'])] if options['site'] else list(Site.objects.order_by('pk'))
+        start = self._parse_day(options['start'])
+        end = self._parse_day(options['end'])
+
+        self.stdout.write(self.style.HTTP_INFO('📊 Backfilling daily sales facts'))
+        self.stdout.write('-' * 50)
+
+        total = 0
+        for site in sites:
+            bounds = Invoice.all_objects.filter(site=site, status='paid').aggregate(first=Min('date'), last=Max('date'))
+            first = start or bounds['first']
+            last = end or bounds['last']
+            if not first or not last:
+                self.stdout.write(f'⏭️  {site.domain}: no paid invoices')
+                continue
+
+            facts = 0
+            month = first
+            while month <= last:
+                month_end = min(self._month_end(month), last)
+                facts += rebuild_sales_facts(site.pk, month, month_end)
+                month = month_end + timedelta(days=1)
+            total += facts
+            self.stdout.write(f'✅ {site.domain}: {facts} facts from {first} to {last}')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Backfill completed: {total} facts'))
+
+    def _month_end(self, day):
+        following = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+        return following - timedelta(days=1)
+
+    def _parse_day(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD")
@@ -0,0 +1,116 @@
+"""
+Management command to benchmark the customer typeahead
+
+Inserts a synthetic customer table (200,000 customers by default) inside a
+transaction, times uncached ``match_customers`` lookups for prefixes of the
+synthetic names, company names, customer IDs and phones as a user would type
+them, and rolls everything back. Run it against the production database
+engine: the prefix indexes only pay off on PostgreSQL with its statistics
+refreshed, which the command does before timing.
+"""
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from portal.import_utils import resolve_site
+from portal.models import Customer
+from portal.search import normalize_search_text
+from portal.typeahead import match_customers, phone_digits
+
+FIRST_NAMES = (
+    'Ahmed', 'Mohammed', 'Fatima', 'Aisha', 'Omar', 'Khalid', 'Mariam', 'Youssef', 'Hassan', 'Noura',
+    'Sara', 'Ali', 'Layla', 'Hamad', 'Rashid', 'Priya', 'Rahul', 'John', 'Maria', 'Anil',
+    'محمد', 'أحمد', 'فاطمة', 'عائشة', 'خالد',
+)
+LAST_NAMES = (
+    'Al Thani', 'Al Kuwari', 'Al Marri', 'Haddad', 'Khan', 'Nair', 'Sharma', 'Smith', 'Fernandes', 'Mansour',
+    'Saleh', 'Ibrahim', 'Yousef', 'Abdullah', 'Qasim', 'الكواري', 'المري', 'حداد',
+)
+COMPANY_WORDS = (
+    'Trading', 'Contracting', 'Electronics', 'Services', 'Technologies', 'Group', 'Supplies', 'Solutions',
+    'Gulf', 'Doha', 'Pearl', 'Falcon', 'Desert', 'Oasis', 'Star',
+)
+
+
+class Command(BaseCommand):
+    help = 'Time the customer typeahead against a synthetic customer table (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=200000, help='Synthetic customers to insert')
+        parser.add_argument('--queries', type=int, default=1000, help='Lookups to time')
+        parser.add_argument('--target-ms', type=float, default=10.0, help='p95 latency to check against')
+        parser.add_argument('--seed', type=int, default=2024, help='Random seed of the synthetic data')
+        parser.add_argument('--site', help='Site to insert into (ID or domain; default: the current site)')
+
+    def handle(self, *args, **options):
+        site_id = resolve_site(options['site']).pk if options['site'] else settings.SITE_ID
+        rng = random.Random(options['seed'])
+
+        self.stdout.write(self.style.HTTP_INFO('⏱️ Benchmarking the customer typeahead'))
+        self.stdout.write('-' * 50)
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            samples = self._populate(rng, site_id, options['customers'])
+            self.stdout.write(
+                f"Inserted {options['customers']} customers in {time.perf_counter() - started:.1f}s"
+            )
+
+            queries = [self._query(rng, samples) for _ in range(options['queries'])]
+            timings = []
+            for query in queries:
+                prefix = normalize_search_text(query)
+                digits = phone_digits(query) if query.isdigit() else ''
+                started = time.perf_counter()
+                match_customers(query, prefix, digits, site_id)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            transaction.set_rollback(True)
+
+        timings.sort()
+        percentile = statistics.quantiles(timings, n=100, method='inclusive')
+        p95 = percentile[94]
+        self.stdout.write(
+            f"{len(timings)} lookups: p50 {percentile[49]:.2f} ms, p95 {p95:.2f} ms, "
+            f"p99 {percentile[98]:.2f} ms, max {timings[-1]:.2f} ms ({connection.vendor})"
+        )
+        if p95 <= options['target_ms']:
+            self.stdout.write(self.style.SUCCESS(f"✅ p95 within {options['target_ms']} ms"))
+        else:
+            self.stdout.write(self.style.WARNING(f"⚠️  p95 above {options['target_ms']} ms"))
+
+    def _populate(self, rng, site_id, count, batch_size=5000):
+        """Insert ``count`` customers; returns a sample of them to draw queries from"""
+        samples = []
+        for start in range(0, count, batch_size):
+            batch = []
+            for _ in range(min(batch_size, count - start)):
+                company = None
+                if rng.random() < 0.3:
+                    company = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_WORDS)} W.L.L"
+                batch.append(Customer(
+                    site_id=site_id,
+                    full_name=f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    company_name=company,
+                    phone=f"+974 {rng.randint(3, 7)}{rng.randint(0, 9999999):07d}",
+                ))
+            Customer.bulk_create_with_ids(batch, batch_size=batch_size)
+            samples.extend(rng.sample(batch, min(20, len(batch))))
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Customer._meta.db_table}')
+        return samples
+
+    def _query(self, rng, samples):
+        """A 1 to 6 character prefix of a sample customer's name, company, ID or phone"""
+        customer = rng.choice(samples)
+        text = rng.choice([
+            customer.full_name, customer.company_name or customer.full_name,
+            customer.customer_id, phone_digits(customer.phone)[3:],
+        ])
+        return text[:rng.randint(1, 6)]
@@ -78,44 +78,23 @@ class Command(BaseCommand):
                 return
 
         self.stdout.write('\n🔄 Generating barcodes...')
-        
-        success_count = 0
-        error_count = 0
-        errors = []
 
-        for product in products:
-            if product.barcode and not options['force']:
-                continue
-                
-            self.stdout.write(f"  Generating for: {product.name}...", ending='')
-            
-            result = BarcodeGenerator.generate_barcode_for_product(product)
-            
-            if result['success']:
-                success_count += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f" ✅ {result['barcode_number']}")
-                )
-            else:
-                error_count += 1
-                error_msg = result.get('error', 'Unknown error')
-                errors.append(f"{product.name}: {error_msg}")
-                self.stdout.write(
-                    self.style.ERROR(f" ❌ {error_msg}")
-                )
+        # One reserved range and one bulk_update for the whole selection
+        try:
+            generated = BarcodeGenerator.assign_barcodes(products)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Failed: {e}'))
+            return
+
+        for product in generated:
+            self.stdout.write(f"  {product.name}: " + self.style.SUCCESS(f"✅ {product.barcode}"))
+        success_count = len(generated)
 
         # Summary
         self.stdout.write('\n' + '=' * 50)
         self.stdout.write(
             self.style.SUCCESS(f'✅ Successfully generated: {success_count} barcode(s)')
         )
-        
-        if error_count > 0:
-            self.stdout.write(
-                self.style.ERROR(f'❌ Failed: {error_count} barcode(s)')
-            )
-            for error in errors:
-                self.stdout.write(f"   - {error}")
 
         if success_count > 0:
             self.stdout.write(
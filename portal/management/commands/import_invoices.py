@@ -0,0 +1,312 @@
+"""
+Management command to bulk import historic invoices from CSV or JSONL
+
+Input is streamed and written in chunks: invoice numbers are reserved per day in
+blocks, invoices and their lines go through ``bulk_create`` (so the per-invoice
+post_save signals never fire), and the sales ledger is posted in one set-based
+pass at the end.
+
+CSV files have one row per invoice line; consecutive rows sharing ``ref`` form
+one invoice. JSONL files hold either the same flat rows or one invoice object
+per line with an ``items`` list. Recognised columns:
+
+    ref, date, due_date, status, payment_mode, customer_name, customer_phone,
+    tax, discount_type, discount_value, notes, sku, quantity, unit_price
+"""
+import decimal
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from finance.summaries import apply_contributions, invoice_contribution
+from portal.import_utils import chunked, open_records, resolve_site
+from portal.invoice_utils import keep_historic_dates
+from portal.models import Customer, DocumentSequence, Invoice, InvoiceItem, Product
+from portal.totals import invoice_totals
+
+HEADER_FIELDS = (
+    'date', 'due_date', 'status', 'payment_mode', 'customer_name', 'customer_phone',
+    'tax', 'discount_type', 'discount_value', 'notes',
+)
+
+
+class RowError(ValueError):
+    """Raised for an input row that cannot be imported"""
+
+
+class Command(BaseCommand):
+    help = 'Bulk import historic invoices from a CSV or JSONL file without per-invoice signals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - for stdin')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format (default: guessed from the file extension)',
+        )
+        parser.add_argument(
+            '--site',
+            help='Site ID or domain to import into (default: settings.SITE_ID)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Invoices written per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--skip-ledger',
+            action='store_true',
+            help='Do not build SoldItem/finance rows for paid invoices',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the input without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        self.site = resolve_site(options['site'])
+        self.dry_run = options['dry_run']
+        batch_size = max(options['batch_size'], 1)
+
+        self.stdout.write(self.style.HTTP_INFO(f'📥 Importing invoices into {self.site.domain}'))
+        self.stdout.write('-' * 50)
+
+        self.products = {}
+        self.customers = {}
+        self.walk_in_customer = None
+        self.stats = defaultdict(int)
+        self.paid_invoice_ids = []
+
+        with open_records(options['path'], options['format']) as records:
+            for batch in chunked(_group_invoices(records), batch_size):
+                self._import_batch(batch)
+
+        self.stdout.write(
+            f"Invoices: {self.stats['invoices']}  Lines: {self.stats['lines']}  "
+            f"Skipped rows: {self.stats['skipped']}"
+        )
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('🔍 Dry run - nothing was written'))
+            return
+
+        if self.paid_invoice_ids and not options['skip_ledger']:
+            from finance.ledger import post_sales_ledger
+
+            self.stdout.write(f'📒 Posting ledger for {len(self.paid_invoice_ids)} paid invoice(s)...')
+            counts = post_sales_ledger(self.paid_invoice_ids, self.site, batch_size=batch_size * 2)
+            self.stdout.write(
+                f"   Sold items: {counts['sold_items']}  Finance transactions: {counts['finance_transactions']}  "
+                f"Inventory transactions: {counts['inventory_transactions']}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('✅ Import completed'))
+
+    def _import_batch(self, records):
+        self._resolve_products(records)
+
+        parsed = []
+        for record in records:
+            try:
+                parsed.append(self._parse_invoice(record))
+            except RowError as exc:
+                self.stats['skipped'] += max(len(record['items']), 1)
+                self.stderr.write(f"⚠️  ref {record['ref']}: {exc}")
+
+        self.stats['invoices'] += len(parsed)
+        self.stats['lines'] += sum(len(invoice['lines']) for invoice in parsed)
+        if self.dry_run or not parsed:
+            return
+
+        self._resolve_customers(parsed)
+        self._assign_numbers(parsed)
+
+        date_field = Invoice._meta.get_field('date')
+        with transaction.atomic(), keep_historic_dates(date_field):
+            invoices = Invoice.all_objects.bulk_create([self._build_invoice(invoice) for invoice in parsed])
+            self._fill_missing_pks(invoices)
+
+            items = []
+            for invoice, data in zip(invoices, parsed):
+                for product_id, quantity, unit_price in data['lines']:
+                    items.append(InvoiceItem(
+                        invoice_id=invoice.pk,
+                        product_id=product_id,
+                        quantity=quantity,
+                        unit_price=unit_price,
+                        site=self.site,
+                    ))
+            InvoiceItem.all_objects.bulk_create(items, batch_size=5000)
+            # bulk_create skips the summary signals that count paid invoices
+            apply_contributions(invoice_contribution(invoice) for invoice in invoices)
+
+        self.paid_invoice_ids.extend(invoice.pk for invoice in invoices if invoice.status == 'paid')
+        self.stdout.write(f"📦 {self.stats['invoices']} invoices / {self.stats['lines']} lines imported")
+
+    def _resolve_products(self, records):
+        skus = {str(item.get('sku', '')).strip() for record in records for item in record['items']}
+        missing = {sku for sku in skus if sku and sku not in self.products}
+        if missing:
+            for product_id, sku, unit_price in Product.all_objects.filter(
+                site=self.site, sku__in=missing
+            ).values_list('id', 'sku', 'unit_price'):
+                self.products[sku] = (product_id, unit_price)
+
+    def _resolve_customers(self, invoices):
+        phones = {invoice['customer_phone'] for invoice in invoices if invoice['customer_phone']}
+        missing = phones - set(self.customers)
+        if missing:
+            self.customers.update(
+                Customer.all_objects.filter(site=self.site, phone__in=missing).values_list('phone', 'id')
+            )
+        new_customers = {}
+        for invoice in invoices:
+            phone = invoice['customer_phone']
+            if phone and phone not in self.customers and phone not in new_customers:
+                new_customers[phone] = Customer(site=self.site, full_name=invoice['customer_name'] or phone, phone=phone)
+        if new_customers:
+            Customer.bulk_create_with_ids(new_customers.values())
+            self.customers.update(
+                Customer.all_objects.filter(site=self.site, phone__in=new_customers).values_list('phone', 'id')
+            )
+
+        for invoice in invoices:
+            phone = invoice['customer_phone']
+            invoice['customer_id'] = self.customers[phone] if phone else self._walk_in_customer_id()
+
+    def _walk_in_customer_id(self):
+        if self.walk_in_customer is None:
+            self.walk_in_customer, _ = Customer.all_objects.get_or_create(
+                site=self.site, full_name='Walk-in Customer', defaults={'phone': '', 'address': ''}
+            )
+        return self.walk_in_customer.id
+
+    def _assign_numbers(self, invoices):
+        by_day = defaultdict(list)
+        for invoice in invoices:
+            by_day[invoice['date']].append(invoice)
+        for day, day_invoices in by_day.items():
+            numbers = DocumentSequence.reserve_numbers('invoice', len(day_invoices), day=day)
+            for invoice, number in zip(day_invoices, numbers):
+                invoice['invoice_number'] = number
+
+    def _parse_invoice(self, record):
+        header = record['header']
+        invoice_date = _parse_date(header.get('date'), 'date')
+        status = (header.get('status') or 'paid').strip().lower()
+        if status not in dict(Invoice.INVOICE_STATUS):
+            raise RowError(f"unknown status '{status}'")
+        payment_mode = (header.get('payment_mode') or 'cash').strip().lower()
+        if payment_mode not in dict(Invoice.PAYMENT_MODES):
+            raise RowError(f"unknown payment mode '{payment_mode}'")
+        discount_type = (header.get('discount_type') or 'amount').strip().lower()
+        if discount_type not in ('percent', 'amount'):
+            raise RowError(f"unknown discount type '{discount_type}'")
+
+        lines = []
+        for item in record['items']:
+            sku = str(item.get('sku', '')).strip()
+            if sku not in self.products:
+                raise RowError(f"unknown SKU '{sku}'")
+            product_id, product_price = self.products[sku]
+            quantity = _parse_decimal(item.get('quantity') or '1', 'quantity')
+            if quantity != quantity.to_integral_value() or quantity <= 0:
+                raise RowError(f"invalid quantity '{item.get('quantity')}'")
+            unit_price = _parse_decimal(item.get('unit_price'), 'unit_price', default=product_price)
+            lines.append((product_id, int(quantity), unit_price))
+        if not lines:
+            raise RowError('invoice has no lines')
+
+        tax = _parse_decimal(header.get('tax'), 'tax', default=Decimal('0'))
+        discount_value = _parse_decimal(header.get('discount_value'), 'discount_value', default=Decimal('0'))
+        subtotal = sum((quantity * unit_price for _, quantity, unit_price in lines), Decimal('0'))
+        notes = str(header.get('notes') or '').strip()
+        return {
+            'ref': record['ref'],
+            'date': invoice_date,
+            'due_date': _parse_date(header.get('due_date'), 'due_date') if header.get('due_date') else invoice_date,
+            'status': status,
+            'payment_mode': payment_mode,
+            'customer_name': str(header.get('customer_name') or '').strip(),
+            'customer_phone': str(header.get('customer_phone') or '').strip(),
+            'tax': tax,
+            'discount_type': discount_type,
+            'discount_value': discount_value,
+            'notes': f"{notes}\nImported from ref {record['ref']}".strip(),
+            'lines': lines,
+            'totals': invoice_totals(subtotal, tax, discount_type, discount_value),
+        }
+
+    def _build_invoice(self, data):
+        return Invoice(
+            site=self.site,
+            invoice_number=data['invoice_number'],
+            customer_id=data['customer_id'],
+            date=data['date'],
+            due_date=data['due_date'],
+            status=data['status'],
+            payment_mode=data['payment_mode'],
+            tax=data['tax'],
+            discount_type=data['discount_type'],
+            discount_value=data['discount_value'],
+            notes=data['notes'],
+            **data['totals'],
+        )
+
+    def _fill_missing_pks(self, invoices):
+        # Backends without RETURNING support leave pk unset after bulk_create
+        missing = [invoice for invoice in invoices if invoice.pk is None]
+        if missing:
+            pks = dict(
+                Invoice.all_objects.filter(invoice_number__in=[invoice.invoice_number for invoice in missing])
+                .values_list('invoice_number', 'pk')
+            )
+            for invoice in missing:
+                invoice.pk = pks[invoice.invoice_number]
+
+
+def _group_invoices(records):
+    """Fold flat line rows into invoices; consecutive rows with the same ref belong together"""
+    ref, rows = None, []
+    for record in records:
+        if isinstance(record.get('items'), list):
+            if rows:
+                yield _invoice_from_rows(ref, rows)
+                ref, rows = None, []
+            yield {'ref': str(record.get('ref', '')).strip(), 'header': record, 'items': record['items']}
+            continue
+        record_ref = str(record.get('ref', '')).strip()
+        if rows and record_ref != ref:
+            yield _invoice_from_rows(ref, rows)
+            rows = []
+        ref = record_ref
+        rows.append(record)
+    if rows:
+        yield _invoice_from_rows(ref, rows)
+
+
+def _invoice_from_rows(ref, rows):
+    return {'ref': ref, 'header': {field: rows[0].get(field) for field in HEADER_FIELDS}, 'items': rows}
+
+
+def _parse_decimal(value, field, default=None):
+    if value in (None, ''):
+        if default is None:
+            raise RowError(f'{field} is required')
+        return default
+    try:
+        return Decimal(str(value).strip())
+    except decimal.InvalidOperation:
+        raise RowError(f"invalid {field} '{value}'")
+
+
+def _parse_date(value, field):
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except (TypeError, ValueError):
+        raise RowError(f"invalid {field} '{value}'")
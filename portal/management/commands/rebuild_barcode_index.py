@@ -0,0 +1,62 @@
+"""
+Management command to rebuild the shared barcode/SKU index
+
+Product changes only mark the index stale (lookups verify their misses against
+the database meanwhile); this command writes the new file. Run it with
+``--watch`` as a long-lived worker next to the web workers to rebuild whenever
+codes changed, or without it after deploying with ``BARCODE_INDEX_PATH`` set
+for the first time and after bulk product changes that bypass model signals
+(``QuerySet.update``, ``bulk_create``, imports).
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from portal.barcode_index import build_barcode_index, index_path, needs_rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the memory-mapped barcode/SKU index shared by the web workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Write the index here instead of settings.BARCODE_INDEX_PATH',
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep running and rebuild whenever product codes changed',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds between staleness checks with --watch (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or index_path()
+        if not path:
+            raise CommandError('Set BARCODE_INDEX_PATH or pass --path')
+
+        self.stdout.write(self.style.HTTP_INFO(f'🏷️ Rebuilding barcode index at {path}'))
+        self.stdout.write('-' * 50)
+
+        if not options['watch']:
+            self._rebuild(path)
+            return
+
+        try:
+            while True:
+                if needs_rebuild(path):
+                    self._rebuild(path)
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⏹️  Watcher stopped'))
+
+    def _rebuild(self, path):
+        stamp, keys = build_barcode_index(path)
+        self.stdout.write(self.style.SUCCESS(f'✅ {keys} codes indexed (version {stamp})'))
@@ -0,0 +1,102 @@
+"""
+Management command to regenerate the auto-generated finance ledger from source
+
+Replaces the FinanceTransaction and InventoryTransaction rows derived from paid
+invoices, received purchase orders and purchase payments, and the
+FinancialSummary rows, for a range of months without replaying any signals.
+Months are rebuilt in parallel worker processes.
+"""
+import os
+import time
+from datetime import date
+
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from finance.rebuild import month_range, rebuild_ledger
+from portal.import_utils import resolve_site
+
+
+class Command(BaseCommand):
+    help = 'Regenerate finance transactions, inventory transactions and summaries for a range of months'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            help='Only rebuild this site (ID or domain; default: all sites)',
+        )
+        parser.add_argument(
+            '--from',
+            dest='start',
+            required=True,
+            help='First month to rebuild (YYYY-MM)',
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            required=True,
+            help='Last month to rebuild (YYYY-MM, inclusive)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Worker processes (default: one per CPU; always 1 on SQLite)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the difference with the stored ledger without changing it',
+        )
+
+    def handle(self, *args, **options):
+        start = self._parse_month(options['start'])
+        end = self._parse_month(options['end'])
+        if end < start:
+            raise CommandError('--to must not be before --from')
+
+        sites = [resolve_site(options['site'])] if options['site'] else list(Site.objects.order_by('pk'))
+        partitions = [(site.pk, month) for site in sites for month in month_range(start, end)]
+        workers = options['workers'] or os.cpu_count() or 1
+        if connection.vendor == 'sqlite':
+            # SQLite allows a single writer at a time
+            workers = 1
+        workers = max(1, min(workers, len(partitions)))
+
+        self.stdout.write(self.style.HTTP_INFO(
+            f'🔧 Rebuilding finance ledger for {len(partitions)} site-month(s) with {workers} worker(s)'
+        ))
+        self.stdout.write('-' * 50)
+
+        started = time.monotonic()
+        totals = {'missing': 0, 'extra': 0, 'changed': 0, 'summary': 0}
+        for (site_id, month), diff in rebuild_ledger(partitions, dry_run=options['dry_run'], workers=workers):
+            finance, inventory = diff['finance'], diff['inventory']
+            totals['missing'] += finance['missing'] + inventory['missing']
+            totals['extra'] += finance['extra'] + inventory['extra']
+            totals['changed'] += finance['changed']
+            totals['summary'] += diff['summary']
+            if any(finance.values()) or any(inventory.values()) or diff['summary']:
+                self.stdout.write(self.style.WARNING(
+                    f"⚠️  site {site_id} {month:%Y-%m}: "
+                    f"finance +{finance['missing']} -{finance['extra']} ~{finance['changed']}  "
+                    f"inventory +{inventory['missing']} -{inventory['extra']}  "
+                    f"summary values {diff['summary']}"
+                ))
+
+        self.stdout.write(
+            f"Missing rows: {totals['missing']}  Extra rows: {totals['extra']}  "
+            f"Changed rows: {totals['changed']}  Summary values: {totals['summary']}  "
+            f"({time.monotonic() - started:.1f}s)"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('🔍 Dry run - nothing was changed'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Finance ledger rebuilt'))
+
+    def _parse_month(self, value):
+        try:
+            year, month = value.split('-')
+            return date(int(year), int(month), 1)
+        except ValueError:
+            raise CommandError(f"Invalid month '{value}', expected YYYY-MM")
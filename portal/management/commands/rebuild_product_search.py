@@ -0,0 +1,33 @@
+"""
+Management command to rebuild the product search documents
+
+Product and category saves keep the documents current; run this after bulk
+product changes that bypass model signals (``QuerySet.update``,
+``bulk_create``, imports) or after changing the normalization rules.
+"""
+from django.core.management.base import BaseCommand
+
+from portal.import_utils import resolve_site
+from portal.models import Product
+from portal.search import rebuild_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Recompute the normalized search documents of the products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            help='Only rebuild this site (ID or domain; default: all sites)',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.all_objects.all()
+        if options['site']:
+            products = products.filter(site=resolve_site(options['site']))
+
+        self.stdout.write(self.style.HTTP_INFO('🔎 Rebuilding product search documents'))
+        self.stdout.write('-' * 50)
+
+        written = rebuild_search_documents(products)
+        self.stdout.write(self.style.SUCCESS(f'✅ {written} search documents rebuilt'))
@@ -0,0 +1,73 @@
+"""
+Management command to check FinancialSummary rows against their source tables
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.summaries import reconcile_summaries
+from portal.import_utils import resolve_site
+
+
+class Command(BaseCommand):
+    help = 'Recompute financial summaries from source, report drift and fix it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            help='Only reconcile this site (ID or domain)',
+        )
+        parser.add_argument(
+            '--from',
+            dest='start',
+            help='First month to reconcile (YYYY-MM)',
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            help='Last month to reconcile (YYYY-MM, inclusive)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without changing any summary',
+        )
+
+    def handle(self, *args, **options):
+        site = resolve_site(options['site']) if options['site'] else None
+        start = self._parse_month(options['start'])
+        end = self._parse_month(options['end'])
+        if end:
+            end = date(end.year + end.month // 12, end.month % 12 + 1, 1)
+
+        self.stdout.write(self.style.HTTP_INFO('📊 Reconciling financial summaries'))
+        self.stdout.write('-' * 50)
+
+        drift, missing = reconcile_summaries(site=site, start=start, end=end, fix=not options['dry_run'])
+
+        for site_id, year, month, field, stored, expected in drift:
+            self.stdout.write(
+                self.style.WARNING(f"⚠️  site {site_id} {year}-{month:02d} {field}: stored {stored}, expected {expected}")
+            )
+        for summary in missing:
+            self.stdout.write(f"➕ site {summary.site_id} {summary.year}-{summary.month:02d}: summary missing")
+
+        months = {(site_id, year, month) for site_id, year, month, *_ in drift}
+        self.stdout.write(
+            f"Drifting values: {len(drift)} in {len(months)} month(s)  Missing months: {len(missing)}"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('🔍 Dry run - no summaries were changed'))
+        elif drift or missing:
+            self.stdout.write(self.style.SUCCESS('✅ Summaries reconciled'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Summaries already match their sources'))
+
+    def _parse_month(self, value):
+        if not value:
+            return None
+        try:
+            year, month = value.split('-')
+            return date(int(year), int(month), 1)
+        except ValueError:
+            raise CommandError(f"Invalid month '{value}', expected YYYY-MM")
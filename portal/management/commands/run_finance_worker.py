@@ -0,0 +1,85 @@
+"""
+Management command to drain the finance outbox
+
+Runs until interrupted, processing queued invoices, purchase orders and
+purchase payments in batches and sleeping while the outbox is empty. Use
+``--once`` from cron to drain and exit, or ``--stats`` to print the lag metrics.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from finance.outbox import drain_outbox, outbox_lag, purge_processed
+
+
+class Command(BaseCommand):
+    help = 'Process pending finance synchronisation from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Outbox entries processed per transaction (default: 200)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep while the outbox is empty (default: 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox once and exit',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print the outbox lag metrics and exit',
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=7,
+            help='Delete processed entries older than this many days (default: 7)',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self._write_lag()
+            return
+
+        batch_size = max(options['batch_size'], 1)
+        self.stdout.write(self.style.HTTP_INFO('💰 Finance outbox worker started'))
+        self.stdout.write('-' * 50)
+        self._write_lag()
+
+        try:
+            while True:
+                processed = drain_outbox(batch_size)
+                if processed:
+                    self.stdout.write(f'📦 {processed} outbox entries processed')
+                    self._write_lag()
+                if options['once']:
+                    break
+                purge_processed(options['keep_days'])
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⏹️  Worker stopped'))
+            return
+
+        purged = purge_processed(options['keep_days'])
+        if purged:
+            self.stdout.write(f'🧹 {purged} processed entries purged')
+        self.stdout.write(self.style.SUCCESS('✅ Outbox drained'))
+
+    def _write_lag(self):
+        lag = outbox_lag()
+        style = self.style.WARNING if lag['failed'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"Pending: {lag['pending']}  Failed: {lag['failed']}  "
+            f"Oldest pending: {lag['oldest_pending_seconds']:.0f}s"
+        ))
@@ -0,0 +1,61 @@
+"""
+Management command to run queued background report jobs
+
+Runs until interrupted, claiming queued report and export jobs oldest first,
+writing their result files to the media storage and deleting expired jobs
+between runs. Use ``--once`` from cron to run the queue and exit. Several
+workers may run side by side on databases that support ``SKIP LOCKED``.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from portal.report_jobs import claim_next_job, expire_report_jobs, run_report_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background report and export jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep while the queue is empty (default: 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the queued jobs once and exit',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.HTTP_INFO('📊 Report job worker started'))
+        self.stdout.write('-' * 50)
+
+        try:
+            while True:
+                expired = expire_report_jobs()
+                if expired:
+                    self.stdout.write(f'🧹 {expired} expired jobs deleted')
+
+                job = claim_next_job()
+                if job is not None:
+                    self.stdout.write(f'⏳ Running {job.kind} job #{job.pk}')
+                    job = run_report_job(job)
+                    if job.status == 'done':
+                        self.stdout.write(self.style.SUCCESS(f'✅ Job #{job.pk} done: {job.result.name}'))
+                    else:
+                        self.stdout.write(self.style.ERROR(f'❌ Job #{job.pk} failed: {job.error}'))
+                    continue
+
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⏹️  Worker stopped'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('✅ Report job queue empty'))
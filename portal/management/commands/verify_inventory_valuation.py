@@ -0,0 +1,50 @@
+"""
+Management command to check the inventory valuation counters against the products
+
+Recomputes every counter from scratch with one grouped query over the products
+and reports the values that drifted. The migration that creates the counters
+seeds them; run this with ``--fix`` after bulk product changes that bypass
+model signals.
+"""
+from django.core.management.base import BaseCommand
+
+from portal.import_utils import resolve_site
+from portal.valuation import reconcile_valuation
+
+
+class Command(BaseCommand):
+    help = 'Recompute inventory valuation counters from the products and report (or fix) drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--site',
+            help='Only verify this site (ID or domain; default: all sites)',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rewrite drifting counters with the recomputed values',
+        )
+
+    def handle(self, *args, **options):
+        site = resolve_site(options['site']) if options['site'] else None
+
+        self.stdout.write(self.style.HTTP_INFO('📦 Verifying inventory valuation counters'))
+        self.stdout.write('-' * 50)
+
+        drift = reconcile_valuation(site_id=site.pk if site else None, fix=options['fix'])
+
+        for site_id, category_id, field, stored, expected in drift:
+            scope = f'category {category_id}' if category_id else 'site total'
+            self.stdout.write(
+                self.style.WARNING(f"⚠️  site {site_id} {scope} {field}: stored {stored}, expected {expected}")
+            )
+
+        rows = {(site_id, category_id) for site_id, category_id, *_ in drift}
+        self.stdout.write(f"Drifting values: {len(drift)} in {len(rows)} row(s)")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('✅ Counters match the products'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS('✅ Counters fixed'))
+        else:
+            self.stdout.write(self.style.WARNING('🔍 Run with --fix to rewrite the drifting counters'))
@@ -5,6 +5,8 @@ from django.conf import settings
 from django.http import Http404
 from threading import local
 
+from .reference_data import get_site, get_site_by_domain
+
 _thread_locals = local()
 
 class MultiTenantMiddleware:
@@ -21,10 +23,9 @@ class MultiTenantMiddleware:
             host = request.META.get('HTTP_HOST', '')
             domain = host.split(':')[0]  # Remove port if present
             
-            # Try to find the site by domain
-            try:
-                current_site = Site.objects.get(domain=domain)
-            except Site.DoesNotExist:
+            # Try to find the site by domain (memoized, see portal.reference_data)
+            current_site = get_site_by_domain(domain)
+            if current_site is None:
                 # Try to find by full host (with port)
                 current_site = get_current_site(request)
             
@@ -48,7 +49,7 @@ class MultiTenantMiddleware:
         except Site.DoesNotExist:
             # If site doesn't exist, default to site 1
             settings.SITE_ID = 1
-            request.current_site = Site.objects.get(id=1)
+            request.current_site = get_site(1)
             request.company_name = "TRENDZ Trading & Services"
             request.company_short = "TRENDZ"
 
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0025_customer_id_sequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentsequence',
+            name='document_type',
+            field=models.CharField(choices=[('invoice', 'Invoice'), ('quotation', 'Quotation'), ('receipt', 'Payment Receipt'), ('customer', 'Customer ID'), ('barcode', 'Product Barcode')], max_length=20),
+        ),
+    ]
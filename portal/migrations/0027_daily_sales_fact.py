@@ -0,0 +1,84 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:22
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+MONEY = models.DecimalField(max_digits=14, decimal_places=2)
+
+
+def fill_sales_facts(apps, schema_editor):
+    """Facts for every paid sale so far, grouped like portal.sales_facts.rebuild_sales_facts"""
+    SoldItem = apps.get_model('portal', 'SoldItem')
+    DailySalesFact = apps.get_model('portal', 'DailySalesFact')
+    # No sold item has a recorded unit cost yet; they are costed at the current cost price
+    unit_cost = Coalesce('product__cost_price', Value(Decimal('0')), output_field=MONEY)
+    rows = (
+        SoldItem.objects.filter(invoice__status='paid')
+        .values('site_id', 'invoice__date', 'product_id', 'product__category_id', 'invoice__payment_mode')
+        .annotate(
+            line_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('quantity') * F('unit_price'), output_field=MONEY),
+            total_cost=Sum(F('quantity') * unit_cost, output_field=MONEY),
+        )
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=1000):
+        batch.append(DailySalesFact(
+            site_id=row['site_id'],
+            date=row['invoice__date'],
+            product_id=row['product_id'],
+            category_id=row['product__category_id'],
+            payment_mode=row['invoice__payment_mode'],
+            lines=row['line_count'],
+            quantity=row['total_quantity'],
+            revenue=row['total_revenue'] or 0,
+            cost=row['total_cost'] or 0,
+        ))
+        if len(batch) >= 1000:
+            DailySalesFact.objects.bulk_create(batch)
+            batch = []
+    DailySalesFact.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0026_barcode_sequence'),
+        ('sites', '0002_alter_domain_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solditem',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Product cost price at time of sale', max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailySalesFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_mode', models.CharField(max_length=10)),
+                ('lines', models.PositiveIntegerField(default=0, help_text='Number of invoice lines')),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='portal.category')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='portal.product')),
+                ('site', models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, to='sites.site')),
+            ],
+            options={
+                'verbose_name': 'Daily Sales Fact',
+                'verbose_name_plural': 'Daily Sales Facts',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['site', 'date'], name='salesfact_site_date_idx'), models.Index(fields=['site', 'product', 'date'], name='salesfact_site_product_idx'), models.Index(fields=['site', 'category', 'date'], name='salesfact_site_category_idx')],
+            },
+        ),
+        migrations.RunPython(fill_sales_facts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:31
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+MONEY = models.DecimalField(max_digits=16, decimal_places=2)
+COUNTER_FIELDS = (
+    'product_count', 'active_count', 'stock_units', 'cost_value', 'selling_value',
+    'cost_price_sum', 'unit_price_sum', 'stock_cost_value',
+)
+MONEY_FIELDS = ('cost_value', 'selling_value', 'cost_price_sum', 'unit_price_sum', 'stock_cost_value')
+
+
+def fill_valuations(apps, schema_editor):
+    """Counters of every category and site, as portal.valuation.expected_valuation computes them"""
+    Product = apps.get_model('portal', 'Product')
+    InventoryValuation = apps.get_model('portal', 'InventoryValuation')
+    active = Q(is_active=True)
+    zero = Decimal('0')
+    rows = (
+        Product.objects.values('site_id', 'category_id')
+        .annotate(
+            product_count=Count('id'),
+            active_count=Count('id', filter=active),
+            stock_units=Coalesce(Sum('stock', filter=active), 0),
+            cost_value=Coalesce(Sum(F('cost_price') * F('stock'), filter=active, output_field=MONEY), zero),
+            selling_value=Coalesce(Sum(F('unit_price') * F('stock'), filter=active, output_field=MONEY), zero),
+            cost_price_sum=Coalesce(Sum('cost_price', filter=active, output_field=MONEY), zero),
+            unit_price_sum=Coalesce(Sum('unit_price', filter=active, output_field=MONEY), zero),
+            stock_cost_value=Coalesce(Sum(F('cost_price') * F('stock'), output_field=MONEY), zero),
+        )
+        .order_by()
+    )
+    counters = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    for row in rows:
+        for key in ((row['site_id'], row['category_id']), (row['site_id'], None)):
+            for field in COUNTER_FIELDS:
+                counters[key][field] += row[field]
+    InventoryValuation.objects.bulk_create([
+        InventoryValuation(site_id=site_id, category_id=category_id, **{
+            field: Decimal(value).quantize(Decimal('0.01')) if field in MONEY_FIELDS else value
+            for field, value in values.items()
+        })
+        for (site_id, category_id), values in counters.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0027_daily_sales_fact'),
+        ('sites', '0002_alter_domain_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.IntegerField(default=0)),
+                ('active_count', models.IntegerField(default=0)),
+                ('stock_units', models.BigIntegerField(default=0)),
+                ('cost_value', models.DecimalField(decimal_places=2, default=0, help_text='Cost price x stock', max_digits=16)),
+                ('selling_value', models.DecimalField(decimal_places=2, default=0, help_text='Unit price x stock', max_digits=16)),
+                ('cost_price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('unit_price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('stock_cost_value', models.DecimalField(decimal_places=2, default=0, help_text='Cost price x stock of all products', max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='portal.category')),
+                ('site', models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, to='sites.site')),
+            ],
+            options={
+                'verbose_name': 'Inventory Valuation',
+                'verbose_name_plural': 'Inventory Valuations',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('site', 'category'), name='unique_valuation_per_category'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('site',), name='unique_valuation_per_site')],
+            },
+        ),
+        migrations.RunPython(fill_valuations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:45
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = 'portal_productsearch_fts'
+DOCUMENT_TABLE = 'portal_productsearchdocument'
+
+# Frozen copy of portal.search.normalize_search_text as of this migration
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_NON_WORD = re.compile(r'[\W_]+')
+_ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و',
+    'ة': 'ه',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+
+
+def normalize_search_text(text):
+    if not text:
+        return ''
+    text = _ARABIC_MARKS.sub('', str(text)).translate(_ARABIC_FOLDING)
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    text = text.casefold()
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def create_search_index(apps, schema_editor):
+    """tsvector and trigram GIN indexes on PostgreSQL, a trigger-synced FTS5 table on SQLite"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex, OpClass
+        from django.contrib.postgres.search import SearchVector
+
+        document = apps.get_model('portal', 'ProductSearchDocument')
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.add_index(document, GinIndex(SearchVector('document', config='simple'), name='product_search_vector_idx'))
+        schema_editor.add_index(document, GinIndex(OpClass('document', name='gin_trgm_ops'), name='product_search_trgm_idx'))
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(document, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {DOCUMENT_TABLE} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.product_id, new.document); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN "
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = old.product_id; "
+            f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (new.product_id, new.document); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {DOCUMENT_TABLE} BEGIN "
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = old.product_id; END"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for trigger in ('insert', 'update', 'delete'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    # The PostgreSQL indexes go with the table
+
+
+def build_documents(apps, schema_editor):
+    Product = apps.get_model('portal', 'Product')
+    ProductSearchDocument = apps.get_model('portal', 'ProductSearchDocument')
+    batch = []
+    for product in Product.objects.select_related('category').order_by('pk').iterator(chunk_size=500):
+        parts = (
+            product.name, product.name_ar, product.sku, product.barcode, product.category.name,
+            product.description, product.description_ar,
+        )
+        document = normalize_search_text(' '.join(part for part in parts if part))
+        batch.append(ProductSearchDocument(product_id=product.pk, document=document))
+        if len(batch) >= 500:
+            ProductSearchDocument.objects.bulk_create(batch)
+            batch = []
+    ProductSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0029_report_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='portal.product')),
+                ('document', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Product Search Document',
+                'verbose_name_plural': 'Product Search Documents',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
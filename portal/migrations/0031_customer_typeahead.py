@@ -0,0 +1,101 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:52
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+CUSTOMER_TABLE = 'portal_customer'
+
+# Index name per column matched by the customer typeahead
+PREFIX_INDEXES = {
+    'search_name': 'customer_typeahead_name_idx',
+    'search_company': 'customer_typeahead_company_idx',
+    'search_phone': 'customer_typeahead_phone_idx',
+    'customer_id': 'customer_typeahead_id_idx',
+}
+
+# Frozen copy of portal.search.normalize_search_text and
+# portal.typeahead.customer_search_fields as of this migration
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_NON_WORD = re.compile(r'[\W_]+')
+_ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و',
+    'ة': 'ه',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+
+
+def normalize_search_text(text):
+    if not text:
+        return ''
+    text = _ARABIC_MARKS.sub('', str(text)).translate(_ARABIC_FOLDING)
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    text = text.casefold()
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def customer_search_fields(customer):
+    phone = ''.join(char for char in normalize_search_text(customer.phone) if char.isdigit())
+    return (
+        normalize_search_text(customer.full_name)[:200],
+        normalize_search_text(customer.company_name)[:200],
+        phone[:20],
+    )
+
+
+def fill_search_fields(apps, schema_editor):
+    Customer = apps.get_model('portal', 'Customer')
+    batch = []
+    for customer in Customer.objects.order_by('pk').iterator(chunk_size=1000):
+        customer.search_name, customer.search_company, customer.search_phone = customer_search_fields(customer)
+        batch.append(customer)
+        if len(batch) >= 1000:
+            Customer.objects.bulk_update(batch, ['search_name', 'search_company', 'search_phone'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['search_name', 'search_company', 'search_phone'])
+
+
+def create_prefix_indexes(apps, schema_editor):
+    """(site_id, column) indexes in byte order: "C" collated expressions on PostgreSQL, BINARY elsewhere"""
+    if schema_editor.connection.vendor == 'postgresql':
+        template = '(site_id, ({column} COLLATE "C"))'
+    else:
+        template = '(site_id, {column})'
+    for column, name in PREFIX_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX {name} ON {CUSTOMER_TABLE} {template.format(column=column)}')
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    for name in PREFIX_INDEXES.values():
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0030_product_search'),
+        ('sites', '0002_alter_domain_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='search_company',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='search_phone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:10
+
+from django.db import migrations
+from django.db.models import Max
+
+SHARED_SITE = 1
+
+
+def merge_site_sequences(apps, schema_editor):
+    """Fold per-site counters into the shared row, continuing from the highest value of any site"""
+    DocumentSequence = apps.get_model('portal', 'DocumentSequence')
+    groups = (
+        DocumentSequence.objects.values('document_type', 'day')
+        .annotate(highest=Max('last_value'))
+    )
+    for group in groups:
+        rows = DocumentSequence.objects.filter(document_type=group['document_type'], day=group['day'])
+        shared = rows.filter(site_id=SHARED_SITE).first() or rows.first()
+        rows.exclude(pk=shared.pk).delete()
+        shared.site_id = SHARED_SITE
+        shared.last_value = group['highest']
+        shared.save(update_fields=['site', 'last_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0031_customer_typeahead'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_site_sequences, migrations.RunPython.noop),
+    ]
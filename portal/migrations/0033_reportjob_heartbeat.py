@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+def backfill_heartbeats(apps, schema_editor):
+    """Jobs running at upgrade time count as alive when they started"""
+    ReportJob = apps.get_model('portal', 'ReportJob')
+    ReportJob.objects.filter(status='running').update(heartbeat_at=models.F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0032_shared_document_sequences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life from the worker', null=True),
+        ),
+        migrations.RunPython(backfill_heartbeats, migrations.RunPython.noop),
+    ]
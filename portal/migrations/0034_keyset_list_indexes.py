@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0033_reportjob_heartbeat'),
+        ('sites', '0002_alter_domain_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['site', '-date', '-id'], name='invoice_site_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreceipt',
+            index=models.Index(fields=['site', '-payment_date', '-id'], name='receipt_site_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quotation',
+            index=models.Index(fields=['site', '-date', '-id'], name='quotation_site_date_id_idx'),
+        ),
+    ]
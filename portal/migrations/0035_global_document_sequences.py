@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0034_keyset_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='documentsequence',
+            unique_together={('document_type', 'day')},
+        ),
+        migrations.RemoveField(
+            model_name='documentsequence',
+            name='site',
+        ),
+    ]
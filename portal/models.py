@@ -1,5 +1,6 @@
 # models.py
 from datetime import timezone
+import datetime
 from django.db import models, transaction
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.sites.models import Site
@@ -9,7 +10,6 @@ from django.core.exceptions import ValidationError
 from django.db.models import Sum
 import uuid
 from django.utils import timezone
-import random   
 import string
 from django.utils.text import gettext_lazy as _
 from django.contrib.auth.tokens import default_token_generator
@@ -141,6 +141,174 @@ class UserEmailVerification(models.Model):
         return f"Portal verification for {self.email} at {self.created_at}"
 
 
+# =============================================================================
+# DOCUMENT NUMBER SEQUENCES
+# =============================================================================
+
+class DocumentSequence(models.Model):
+    """
+    Per-day counter that hands out invoice, quotation and receipt numbers.
+    Numbers are claimed with a single atomic UPDATE on the counter row instead of
+    scanning the document table for the last number used today.
+
+    Customer IDs use the same table with one counter per month (``day`` is the
+    first of the month) and product barcodes with a single counter (``day`` is
+    fixed at ``BARCODE_EPOCH``). Document numbers, customer IDs and barcodes
+    are all unique across sites, so the counters are global: one row per type
+    and period, shared by every site.
+    """
+    DOCUMENT_TYPES = [
+        ('invoice', 'Invoice'),
+        ('quotation', 'Quotation'),
+        ('receipt', 'Payment Receipt'),
+        ('customer', 'Customer ID'),
+        ('barcode', 'Product Barcode'),
+    ]
+
+    # document_type -> (number prefix, minimum sequence width)
+    NUMBER_FORMATS = {
+        'invoice': ('', 2),      # YYYYMMDDNN
+        'quotation': ('QT-', 2),  # QT-YYYYMMDDNN
+        'receipt': ('RC-', 2),    # RC-YYYYMMDDNN
+    }
+
+    # Customer IDs are YYMM + 4 digits + 2 letters. Random legacy IDs put the
+    # letters first, so the two shapes can never collide.
+    CUSTOMER_ID_LETTERS = string.ascii_uppercase
+    CUSTOMER_ID_CAPACITY = 10000 * 26 * 26
+
+    BARCODE_EPOCH = datetime.date(2000, 1, 1)
+
+    document_type = models.CharField(max_length=20, choices=DOCUMENT_TYPES)
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['document_type', 'day']
+        verbose_name = 'Document Sequence'
+        verbose_name_plural = 'Document Sequences'
+
+    def __str__(self):
+        return f"{self.get_document_type_display()} {self.day}: {self.last_value}"
+
+    @classmethod
+    def next_number(cls, document_type, day=None):
+        """Allocate and format the next document number for today"""
+        return cls.reserve_numbers(document_type, 1, day=day)[0]
+
+    @classmethod
+    def reserve_numbers(cls, document_type, count, day=None):
+        """
+        Reserve ``count`` consecutive numbers in one statement and return them
+        formatted. Sequences widen past the minimum width (e.g. ``YYYYMMDD100``)
+        instead of capping the daily volume.
+        """
+        if count < 1:
+            return []
+        day = cls._period_start(document_type, day or timezone.now().date())
+        first = cls.allocate(document_type, count, day=day)
+        return [cls.format_number(document_type, day, value) for value in range(first, first + count)]
+
+    @classmethod
+    def allocate(cls, document_type, count=1, day=None):
+        """
+        Atomically bump the counter by ``count`` and return the first value of the
+        reserved block. The row lock is held until the surrounding transaction
+        commits, so a rolled back document also rolls back its number.
+        """
+        from django.db import IntegrityError
+        from django.db.models import F
+
+        if document_type not in dict(cls.DOCUMENT_TYPES):
+            raise ValueError(f"Unknown document type: {document_type}")
+
+        day = cls._period_start(document_type, day or timezone.now().date())
+        lookup = {'document_type': document_type, 'day': day}
+
+        with transaction.atomic():
+            updated = cls.objects.filter(**lookup).update(last_value=F('last_value') + count)
+            if not updated:
+                # First document of the day: seed from numbers issued before the
+                # sequence table existed so we never hand out a duplicate.
+                seed = cls._existing_max(document_type, day)
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(last_value=seed + count, **lookup)
+                except IntegrityError:
+                    # Another worker created the row first; take our block from it
+                    cls.objects.filter(**lookup).update(last_value=F('last_value') + count)
+            last_value = cls.objects.filter(**lookup).values_list('last_value', flat=True).get()
+
+        return last_value - count + 1
+
+    @classmethod
+    def format_number(cls, document_type, day, value):
+        if document_type == 'customer':
+            return cls.format_customer_id(day, value)
+        prefix, width = cls.NUMBER_FORMATS[document_type]
+        return f"{prefix}{day.strftime('%Y%m%d')}{value:0{width}d}"
+
+    @classmethod
+    def format_customer_id(cls, month, value):
+        """Encode the monthly counter as YYMM + 4 digits + 2 letters, in counter order"""
+        if not 0 < value < cls.CUSTOMER_ID_CAPACITY:
+            raise ValueError(f"Customer ID sequence exhausted for {month:%Y-%m}")
+        digits, letters = divmod(value, 26 * 26)
+        first, second = divmod(letters, 26)
+        return (
+            f"{month.strftime('%y%m')}{digits:04d}"
+            f"{cls.CUSTOMER_ID_LETTERS[first]}{cls.CUSTOMER_ID_LETTERS[second]}"
+        )
+
+    @classmethod
+    def parse_customer_id(cls, customer_id):
+        """Counter value of an ID issued by ``format_customer_id``, or None for legacy IDs"""
+        if len(customer_id) != 10 or not customer_id[:8].isdigit():
+            return None
+        first, second = customer_id[8], customer_id[9]
+        if first not in cls.CUSTOMER_ID_LETTERS or second not in cls.CUSTOMER_ID_LETTERS:
+            return None
+        letters = cls.CUSTOMER_ID_LETTERS.index(first) * 26 + cls.CUSTOMER_ID_LETTERS.index(second)
+        return int(customer_id[4:8]) * 26 * 26 + letters
+
+    @staticmethod
+    def _period_start(document_type, day):
+        if document_type == 'customer':
+            return day.replace(day=1)
+        if document_type == 'barcode':
+            return DocumentSequence.BARCODE_EPOCH
+        return day
+
+    @classmethod
+    def _existing_max(cls, document_type, day):
+        """Highest sequence already used for the day in the document table, on any site"""
+        if document_type == 'customer':
+            ids = Customer.all_objects.filter(
+                customer_id__startswith=day.strftime('%y%m')
+            ).values_list('customer_id', flat=True)
+            return max(filter(None, map(cls.parse_customer_id, ids)), default=0)
+        if document_type == 'barcode':
+            from .barcode_utils import BarcodeGenerator
+            return BarcodeGenerator.existing_max_sequence()
+
+        model, field = {
+            'invoice': (Invoice, 'invoice_number'),
+            'quotation': (Quotation, 'quotation_number'),
+            'receipt': (PaymentReceipt, 'receipt_number'),
+        }[document_type]
+        prefix = f"{cls.NUMBER_FORMATS[document_type][0]}{day.strftime('%Y%m%d')}"
+
+        highest = 0
+        numbers = model.all_objects.filter(**{f'{field}__startswith': prefix}).values_list(field, flat=True)
+        for number in numbers:
+            # Legacy fallback numbers carry an 'F' suffix
+            sequence = number[len(prefix):].rstrip('F')
+            if sequence.isdigit():
+                highest = max(highest, int(sequence))
+        return highest
+
+
 class Customer(SiteModel):
     customer_id = models.CharField(
         max_length=10,
@@ -159,25 +327,53 @@ class Customer(SiteModel):
         choices=[('email', 'Email'), ('phone', 'Phone'), ('whatsapp', 'WhatsApp')],
         default='phone'
     )
+    # Normalized copies matched by the invoice customer typeahead (see portal.typeahead)
+    search_name = models.CharField(max_length=200, blank=True, default='', editable=False)
+    search_company = models.CharField(max_length=200, blank=True, default='', editable=False)
+    search_phone = models.CharField(max_length=20, blank=True, default='', editable=False)
+
+    SEARCH_FIELDS = ('search_name', 'search_company', 'search_phone')
 
     def save(self, *args, **kwargs):
         if not self.customer_id:
             self.customer_id = self.generate_customer_id()
+        self.set_search_fields()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *self.SEARCH_FIELDS}
         super().save(*args, **kwargs)
 
+    def set_search_fields(self):
+        from .typeahead import customer_search_fields
+        self.search_name, self.search_company, self.search_phone = customer_search_fields(self)
+
     @classmethod
     def generate_customer_id(cls):
-        """Generate ID in format: YYMMXXXXXX"""
-        now = timezone.now()
-        date_part = f"{now.strftime('%y')}{now.strftime('%m')}"
-        
-        # Generate until unique
-        while True:
-            letters_part = ''.join(random.choices(string.ascii_uppercase, k=2))
-            numbers_part = ''.join(random.choices(string.digits, k=4))
-            customer_id = f"{date_part}{letters_part}{numbers_part}"
-            if not cls.objects.filter(customer_id=customer_id).exists():
-                return customer_id
+        """Generate ID in format: YYMMNNNNLL from the monthly customer counter"""
+        return cls.reserve_customer_ids(1)[0]
+
+    @classmethod
+    def reserve_customer_ids(cls, count, month=None):
+        """Reserve ``count`` customer IDs for the month in a single counter update"""
+        return DocumentSequence.reserve_numbers('customer', count, day=month)
+
+    @classmethod
+    def bulk_create_with_ids(cls, customers, batch_size=1000):
+        """
+        Insert unsaved customers with ``bulk_create``. Customers without an ID get
+        one from a single reserved block, so no per-row queries are issued.
+        """
+        from .typeahead import invalidate_customer_search
+
+        customers = list(customers)
+        pending = [customer for customer in customers if not customer.customer_id]
+        for customer, customer_id in zip(pending, cls.reserve_customer_ids(len(pending))):
+            customer.customer_id = customer_id
+        for customer in customers:
+            customer.set_search_fields()
+        created = cls.all_objects.bulk_create(customers, batch_size=batch_size)
+        for site_id in {customer.site_id for customer in customers}:
+            invalidate_customer_search(site_id)
+        return created
     
     def __str__(self):
 
@@ -294,81 +490,36 @@ class Invoice(SiteModel):
 
     def save(self, *args, **kwargs):
         if not self.invoice_number or self.invoice_number in ['Auto-generated', '']:
-            print(f"🔍 MODEL SAVE: Generating invoice number (current: {self.invoice_number})")
-            # Define date_part at the start
-            date_part = timezone.now().strftime('%Y%m%d')  # YYYYMMDD format
-        
-            try:
-                with transaction.atomic():
-                    # Get the highest invoice number for today
-                    today_invoices = Invoice.objects.filter(
-                        invoice_number__startswith=date_part
-                    ).order_by('-invoice_number')
-                
-                    if today_invoices.exists():
-                        last_num = int(today_invoices.first().invoice_number[-2:])  # Get last 2 digits
-                        next_num = last_num + 1
-                    else:
-                        next_num = 1
-                
-                    # Ensure we don't exceed 99 invoices per day
-                    if next_num > 99:
-                        raise ValueError("Maximum daily invoice limit (99) reached")
-                
-                    self.invoice_number = f"{date_part}{next_num:02d}"
-                    print(f"🔍 MODEL SAVE: Generated invoice number: {self.invoice_number}")
-                
-            except Exception as e:
-                # Fallback mechanism - ensure date_part is available
-                fallback_num = random.randint(1, 99)
-                self.invoice_number = f"{date_part}{fallback_num:02d}F"  # F for fallback
-                print(f"⚠️ Used fallback invoice number: {self.invoice_number}")
-            
+            self.invoice_number = DocumentSequence.next_number('invoice')
+
+        # Ensure discount_value is never null
+        if self.discount_value is None:
+            self.discount_value = 0
+
+        # Totals are maintained by portal.totals, not recalculated on every save
         super().save(*args, **kwargs)
-        self.update_totals()
 
 
     def update_totals(self):
-        from decimal import Decimal
-        # Calculate subtotal from items
-        subtotal_amount = Decimal('0.00')
-        for item in self.items.all():
-            subtotal_amount += item.subtotal()
-        
-        self.subtotal = subtotal_amount
-        
-        # Calculate total before discount
-        self.total = self.subtotal + self.tax
-        
-        # Calculate discount
-        if self.discount_type == 'percent':
-            self.discount_amount = (self.subtotal + self.tax) * (self.discount_value / 100)
-        else:
-            self.discount_amount = min(self.discount_value, self.subtotal + self.tax)
-        
-        # Calculate grand total
-        self.grand_total = (self.subtotal + self.tax) - self.discount_amount
-        
-        # Update only the calculated fields
-        update_fields = ['subtotal', 'total', 'discount_amount', 'grand_total']
-        if self.pk:  # Only update if already saved
-            Invoice.objects.filter(pk=self.pk).update(
-                **{field: getattr(self, field) for field in update_fields}
-            )
+        """
+        Recalculate subtotal, discount and grand total from the items right away
+        (one aggregate query plus one UPDATE) and load them onto this instance.
+        Code that edits items should prefer ``portal.totals.schedule_totals``.
+        """
+        from .totals import recalculate_totals
+        totals = recalculate_totals(Invoice, [self.pk], using=self._state.db).get(self.pk, {})
+        for field, value in totals.items():
+            setattr(self, field, value)
 
     def __str__(self):
         return f"Invoice #{self.invoice_number} - {self.customer}"
 
     def clean(self):
-        print(f"🔍 MODEL: clean() called with invoice_number: {repr(self.invoice_number)}")
         if self.invoice_number and self.invoice_number not in ['Auto-generated', '']:
-            if len(self.invoice_number) not in (10, 11):  # 10 for normal, 11 for fallback (with 'F')
-                print(f"🔍 MODEL: Invalid length - {len(self.invoice_number)}")
-                raise ValidationError("Invoice number must be 10 digits (YYYYMMDDNN)")
+            if len(self.invoice_number) < 10:  # YYYYMMDD + at least 2 sequence digits
+                raise ValidationError("Invoice number must be at least 10 digits (YYYYMMDDNN)")
             if not self.invoice_number[:8].isdigit():
-                print(f"🔍 MODEL: First 8 chars not digits - {self.invoice_number[:8]}")
                 raise ValidationError("First 8 characters must be digits (YYYYMMDD)")
-        print(f"🔍 MODEL: Validation passed")
 
     class Meta:
         constraints = [
@@ -377,20 +528,11 @@ class Invoice(SiteModel):
                 name='unique_invoice_number'
             )
         ]
+        indexes = [
+            # Keyset pagination of the invoice list
+            models.Index(fields=['site', '-date', '-id'], name='invoice_site_date_id_idx'),
+        ]
 
-    def save(self, *args, **kwargs):
-        print(f"Model save - incoming status: {self.status}")
-        
-        # Ensure discount_value is never null
-        if self.discount_value is None:
-            self.discount_value = 0
-            print(f"DEBUG: Set discount_value from None to 0")
-        
-        super().save(*args, **kwargs)
-        print(f"Model save - after save status: {self.status}")
-
-    
-   
 
 class InvoiceItem(SiteModel):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='items')
@@ -433,6 +575,8 @@ class SoldItem(SiteModel):
     # Additional fields for better tracking
     product_sku = models.CharField(max_length=100, blank=True, null=True)
     category_name = models.CharField(max_length=100, blank=True, null=True)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True,
+                                    help_text="Product cost price at time of sale")
     
     class Meta:
         ordering = ['-date_sold']
@@ -447,6 +591,36 @@ class SoldItem(SiteModel):
         return f"{self.product_name} - {self.quantity} units sold on {self.date_sold.strftime('%Y-%m-%d')}"
 
 
+class DailySalesFact(SiteModel):
+    """
+    Paid sales per day, product, category and payment mode, with the cost taken
+    from the sold items at the time of sale. Maintained from SoldItem rows by
+    ``portal.sales_facts``; reports and dashboards aggregate this table instead
+    of joining invoice lines, products and categories.
+    """
+    date = models.DateField()
+    product = models.ForeignKey('Product', on_delete=models.SET_NULL, null=True, blank=True)
+    category = models.ForeignKey('Category', on_delete=models.SET_NULL, null=True, blank=True)
+    payment_mode = models.CharField(max_length=10)
+    lines = models.PositiveIntegerField(default=0, help_text="Number of invoice lines")
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['site', 'date'], name='salesfact_site_date_idx'),
+            models.Index(fields=['site', 'product', 'date'], name='salesfact_site_product_idx'),
+            models.Index(fields=['site', 'category', 'date'], name='salesfact_site_category_idx'),
+        ]
+        verbose_name = "Daily Sales Fact"
+        verbose_name_plural = "Daily Sales Facts"
+
+    def __str__(self):
+        return f"{self.date}: {self.product_id} x {self.quantity} ({self.payment_mode})"
+
+
 class Category(SiteModel):
     ICON_CHOICES = [
         ('fa-desktop', 'Computer Hardware'),
@@ -532,10 +706,145 @@ class Product(SiteModel):
                 'unit_price': "Unit price is required"
             })
         
+    def save(self, *args, **kwargs):
+        # Keep the inventory valuation counters in the same transaction as the row
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} ({self.sku}) - {self.category.name}"
 
 
+class ProductSearchDocument(models.Model):
+    """
+    Normalized search text of a product (names and descriptions in both
+    languages, SKU, barcode and category), maintained by ``portal.search``.
+    Indexed with a tsvector and a trigram GIN index on PostgreSQL and mirrored
+    into an FTS5 table on SQLite.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='search_document',
+    )
+    document = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Product Search Document"
+        verbose_name_plural = "Product Search Documents"
+
+    def __str__(self):
+        return f"Search document of product {self.product_id}"
+
+
+class InventoryValuation(SiteModel):
+    """
+    Running inventory counters of one site and category; the row without a
+    category holds the totals of the whole site. Maintained incrementally by
+    ``portal.valuation`` whenever a product is saved or deleted, so dashboards
+    read the valuation without scanning the products. Values of active products
+    only, except ``product_count`` and ``stock_cost_value`` which cover all.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True)
+    product_count = models.IntegerField(default=0)
+    active_count = models.IntegerField(default=0)
+    stock_units = models.BigIntegerField(default=0)
+    cost_value = models.DecimalField(max_digits=16, decimal_places=2, default=0, help_text="Cost price x stock")
+    selling_value = models.DecimalField(max_digits=16, decimal_places=2, default=0, help_text="Unit price x stock")
+    cost_price_sum = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    unit_price_sum = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    stock_cost_value = models.DecimalField(
+        max_digits=16, decimal_places=2, default=0, help_text="Cost price x stock of all products",
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['site', 'category'],
+                condition=models.Q(category__isnull=False),
+                name='unique_valuation_per_category',
+            ),
+            models.UniqueConstraint(
+                fields=['site'],
+                condition=models.Q(category__isnull=True),
+                name='unique_valuation_per_site',
+            ),
+        ]
+        verbose_name = "Inventory Valuation"
+        verbose_name_plural = "Inventory Valuations"
+
+    @property
+    def potential_profit(self):
+        return self.selling_value - self.cost_value
+
+    @property
+    def avg_cost_price(self):
+        return self.cost_price_sum / self.active_count if self.active_count else 0
+
+    @property
+    def avg_unit_price(self):
+        return self.unit_price_sum / self.active_count if self.active_count else 0
+
+    def __str__(self):
+        return f"Valuation of {self.category or 'all products'} (site {self.site_id})"
+
+
+class ReportJob(SiteModel):
+    """
+    A report or export run in the background by ``manage.py run_report_jobs``.
+
+    ``params_hash`` covers the normalized parameters and the site's data
+    version, so identical requests share one queued or running job (enforced by
+    a conditional unique constraint) and reuse its result until it expires.
+    """
+    KINDS = [
+        ('export', 'Export'),
+        ('report', 'Report'),
+    ]
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    params = models.JSONField(default=dict)
+    params_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent complete")
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.FileField(upload_to='report_jobs/', blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the worker")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['site', 'params_hash'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_report_job',
+            ),
+        ]
+        indexes = [models.Index(fields=['status', 'created_at'], name='report_job_queue_idx')]
+        verbose_name = "Report Job"
+        verbose_name_plural = "Report Jobs"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job #{self.pk} ({self.status})"
+
+
 class Cart(SiteModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True, help_text="For anonymous users")
@@ -742,22 +1051,14 @@ class Quotation(SiteModel):
     @classmethod
     def generate_quotation_number(cls):
         """Generate quotation number in format: QT-YYYYMMDDNN"""
-        from django.utils import timezone
-        now = timezone.now()
-        date_part = now.strftime('%Y%m%d')
-        
-        # Find the highest number for today
-        today_quotes = cls.objects.filter(
-            quotation_number__startswith=f'QT-{date_part}'
-        ).order_by('-quotation_number')
-        
-        if today_quotes.exists():
-            last_number = today_quotes.first().quotation_number
-            sequence = int(last_number.split('-')[1][-2:]) + 1
-        else:
-            sequence = 1
-            
-        return f'QT-{date_part}{sequence:02d}'
+        return DocumentSequence.next_number('quotation')
+
+    def update_totals(self):
+        """Recalculate subtotal, tax and total from the items right away"""
+        from .totals import recalculate_totals
+        totals = recalculate_totals(Quotation, [self.pk], using=self._state.db).get(self.pk, {})
+        for field, value in totals.items():
+            setattr(self, field, value)
     
     def __str__(self):
         customer_name = self.customer.full_name if self.customer else "Walk-in Customer"
@@ -765,6 +1066,10 @@ class Quotation(SiteModel):
     
     class Meta:
         ordering = ['-date']
+        indexes = [
+            # Keyset pagination of the quotation list
+            models.Index(fields=['site', '-date', '-id'], name='quotation_site_date_id_idx'),
+        ]
 
 
 class QuotationItem(SiteModel):
@@ -870,22 +1175,7 @@ class PaymentReceipt(SiteModel):
     @classmethod
     def generate_receipt_number(cls):
         """Generate receipt number in format: RC-YYYYMMDDNN"""
-        from django.utils import timezone
-        now = timezone.now()
-        date_part = now.strftime('%Y%m%d')
-        
-        # Find the highest number for today
-        today_receipts = cls.objects.filter(
-            receipt_number__startswith=f'RC-{date_part}'
-        ).order_by('-receipt_number')
-        
-        if today_receipts.exists():
-            last_number = today_receipts.first().receipt_number
-            sequence = int(last_number.split('-')[1][-2:]) + 1
-        else:
-            sequence = 1
-            
-        return f'RC-{date_part}{sequence:02d}'
+        return DocumentSequence.next_number('receipt')
     
     def __str__(self):
         customer_name = self.customer.full_name if self.customer else "Walk-in Customer"
@@ -893,4 +1183,8 @@ class PaymentReceipt(SiteModel):
     
     class Meta:
         ordering = ['-payment_date']
+        indexes = [
+            # Keyset pagination of the payment list
+            models.Index(fields=['site', '-payment_date', '-id'], name='receipt_site_date_id_idx'),
+        ]
 
@@ -0,0 +1,212 @@
+"""
+Keyset (cursor) pagination for the list views
+
+Django's ``Paginator`` counts the whole result and skips to a page with
+``OFFSET``, so deep pages of a large table get slower the further back they
+are. ``KeysetPaginator`` instead orders by a unique key such as
+``('-date', '-id')`` and fetches the rows before or after the edge of the
+current page with a range condition on that key, which the index answers in
+the same time for every page. Each keyset-paginated list has a matching
+``(site, <date>, id)`` index in its model's ``Meta.indexes``, so the site
+filter and the ordering are served by one index range scan. Pages are
+addressed by opaque cursors (the direction and the key of the edge row, JSON
+and base64 encoded), and the total is only computed when a template asks for
+``paginator.count`` — as a planner estimate on PostgreSQL.
+
+``KeysetPaginationMixin`` plugs the paginator into a ``ListView``; the list
+templates render ``portal/_keyset_pagination.html``.
+"""
+import base64
+import binascii
+import datetime
+import json
+import logging
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    """Keeps the microseconds DjangoJSONEncoder drops, as keys must match exactly"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbours"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self.object_list)} rows>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def first_cursor(self):
+        return None
+
+    @property
+    def last_cursor(self):
+        return self.paginator.encode_cursor('prev', None)
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering``, a sequence of non-null field names
+    (``-`` for descending) ending in a unique one such as ``id``.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-id',), approximate_count=True):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.approximate_count = approximate_count
+        self.keys = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def page(self, cursor=None):
+        """The page addressed by ``cursor``; the first page without one"""
+        direction, values = self.decode_cursor(cursor) if cursor else ('next', None)
+
+        if direction == 'next':
+            rows = self.queryset.order_by(*self.ordering)
+            if values is not None:
+                rows = rows.filter(self._beyond(values, forward=True))
+            rows = list(rows[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = values is not None
+        else:
+            rows = self.queryset.order_by(*self._reversed_ordering())
+            if values is not None:
+                rows = rows.filter(self._beyond(values, forward=False))
+            rows = list(rows[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            # Without a key this is the last page
+            has_next = values is not None
+
+        next_cursor = self.encode_cursor('next', self._key(rows[-1])) if rows and has_next else None
+        previous_cursor = self.encode_cursor('prev', self._key(rows[0])) if rows and has_previous else None
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    @cached_property
+    def count(self):
+        """Rows in the queryset: the planner's estimate on PostgreSQL, else an exact count"""
+        connection = connections[self.queryset.db]
+        if self.approximate_count and connection.vendor == 'postgresql':
+            try:
+                plan = json.loads(self.queryset.order_by().explain(format='json'))
+                return int(plan[0]['Plan']['Plan Rows'])
+            except (ValueError, KeyError, IndexError, TypeError):
+                logger.warning('Could not read the row estimate, counting instead', exc_info=True)
+        return self.queryset.count()
+
+    # =========================================================================
+    # CURSORS
+    # =========================================================================
+
+    def encode_cursor(self, direction, values):
+        payload = json.dumps([direction, values], cls=_CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """``(direction, key values)`` of a cursor; raises InvalidCursor"""
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(payload)
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise InvalidCursor(f"Malformed cursor '{cursor}'")
+        if direction not in ('next', 'prev'):
+            raise InvalidCursor(f"Unknown cursor direction '{direction}'")
+        if values is None:
+            return direction, None
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise InvalidCursor('Cursor does not match the ordering')
+
+        model = self.queryset.model
+        try:
+            values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(self.keys, values)]
+        except ValidationError:
+            raise InvalidCursor('Cursor holds an invalid value')
+        return direction, values
+
+    # =========================================================================
+    # QUERIES
+    # =========================================================================
+
+    def _key(self, row):
+        return [getattr(row, name) for name, _ in self.keys]
+
+    def _reversed_ordering(self):
+        return tuple(name if descending else f'-{name}' for name, descending in self.keys)
+
+    def _beyond(self, values, forward):
+        """
+        Rows past ``values`` in the ordering (``forward``) or before them:
+        ``a < x OR (a = x AND b < y) ...`` for a descending ``(a, b)`` key.
+        """
+        condition = Q()
+        for position, (name, descending) in enumerate(self.keys):
+            lookup = 'lt' if descending == forward else 'gt'
+            equal = {key: value for (key, _), value in zip(self.keys[:position], values[:position])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[position]})
+        return condition
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin paginating with ``KeysetPaginator`` over
+    ``keyset_ordering``; the page comes from the ``cursor`` GET parameter and
+    ``pagination_query`` holds the other parameters for the page links.
+    """
+    keyset_ordering = ('-id',)
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.keyset_ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        params = self.request.GET.copy()
+        params.pop(self.cursor_kwarg, None)
+        params.pop('page', None)
+        kwargs.setdefault('pagination_query', params.urlencode())
+        return super().get_context_data(**kwargs)
@@ -0,0 +1,170 @@
+"""
+Process-wide cache for reference data
+
+Sites, finance categories, site roles and the finance system user change a few
+times a year but are read on every request or finance sync. Lookups here are
+memoized per process and dropped whenever one of those tables is written: the
+post_save/post_delete receivers at the bottom clear the local entries and bump
+a version counter in the shared cache, and every process compares its copy of
+the counter (at most once per ``VERSION_CHECK_INTERVAL`` seconds) before
+trusting its memo. Cross-worker invalidation therefore needs a shared cache
+backend (Redis, Memcached or the database cache); with the default local
+memory cache each process only sees its own writes.
+
+Values loaded inside a transaction are only memoized once it commits, and
+cached instances are shared between requests; treat them as read-only and load
+a fresh row before editing one.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'reference_data:version'
+VERSION_CHECK_INTERVAL = 1.0
+
+SYSTEM_USERNAME = 'system_finance'
+
+_lock = threading.Lock()
+_entries = {}
+_state = {'version': None, 'checked_at': 0.0}
+
+
+def remember(key, loader):
+    """Return the memoized value for ``key``, calling ``loader()`` on a miss"""
+    _sync_version()
+    try:
+        return _entries[key]
+    except KeyError:
+        pass
+    version = _state['version']
+    value = loader()
+    if connection.in_atomic_block:
+        # A row read or created inside a transaction may still be rolled back
+        transaction.on_commit(lambda: _store(key, value, version))
+    else:
+        _store(key, value, version)
+    return value
+
+
+def invalidate():
+    """Drop every memoized entry here and, through the version counter, in other processes"""
+    with _lock:
+        _entries.clear()
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            version = 1
+            cache.set(VERSION_KEY, version, None)
+        _state.update(version=version, checked_at=time.monotonic())
+
+
+def _store(key, value, version):
+    with _lock:
+        # Skip values loaded before an invalidation that happened meanwhile
+        if _state['version'] == version:
+            _entries[key] = value
+
+
+def _sync_version():
+    now = time.monotonic()
+    if now - _state['checked_at'] < VERSION_CHECK_INTERVAL:
+        return
+    version = cache.get(VERSION_KEY)
+    with _lock:
+        if version != _state['version']:
+            _entries.clear()
+            _state['version'] = version
+        _state['checked_at'] = now
+
+
+# =============================================================================
+# LOOKUPS
+# =============================================================================
+
+def get_site(site_id):
+    """Site by primary key, or None"""
+    from django.contrib.sites.models import Site
+    return remember(('site', int(site_id)), lambda: Site.objects.filter(pk=site_id).first())
+
+
+def get_site_by_domain(domain):
+    """Site by domain, or None"""
+    from django.contrib.sites.models import Site
+    return remember(('site_domain', domain), lambda: Site.objects.filter(domain=domain).first())
+
+
+def get_site_role(role_id):
+    """rbac SiteRole by primary key, or None"""
+    from rbac.models import SiteRole
+    if role_id is None:
+        return None
+    return remember(('site_role', role_id), lambda: SiteRole.objects.filter(pk=role_id).first())
+
+
+def get_finance_category(name, transaction_type, site):
+    """Finance category of ``site``, created on first use"""
+    from finance.models import Category
+
+    site_id = getattr(site, 'pk', site)
+
+    def load():
+        category, _ = Category.all_objects.get_or_create(
+            name=name,
+            type=transaction_type,
+            site_id=site_id,
+            defaults={'description': f'Auto-created category for {transaction_type}'},
+        )
+        return category
+
+    return remember(('finance_category', site_id, name, transaction_type), load)
+
+
+def get_system_user():
+    """User that owns auto-generated finance transactions, created on first use"""
+    from django.contrib.auth.models import User
+
+    def load():
+        user, _ = User.objects.get_or_create(
+            username=SYSTEM_USERNAME,
+            defaults={
+                'first_name': 'System',
+                'last_name': 'Finance',
+                'email': 'system@finance.local',
+                'is_active': True,
+            },
+        )
+        return user
+
+    return remember(('system_user',), load)
+
+
+# =============================================================================
+# INVALIDATION
+# =============================================================================
+
+def invalidate_reference_data(sender, **kwargs):
+    invalidate()
+    if connection.in_atomic_block:
+        # Other processes may have reloaded the old row before the write commits
+        transaction.on_commit(invalidate)
+
+
+def _invalidate_system_user(sender, instance, **kwargs):
+    # Users are saved on every login; only the finance system user is cached
+    if instance.username == SYSTEM_USERNAME:
+        invalidate_reference_data(sender)
+
+
+for _model in ('sites.Site', 'finance.Category', 'rbac.SiteRole'):
+    post_save.connect(invalidate_reference_data, sender=_model, dispatch_uid=f'reference_data_save_{_model}')
+    post_delete.connect(invalidate_reference_data, sender=_model, dispatch_uid=f'reference_data_delete_{_model}')
+post_save.connect(_invalidate_system_user, sender='auth.User', dispatch_uid='reference_data_save_auth.User')
+post_delete.connect(_invalidate_system_user, sender='auth.User', dispatch_uid='reference_data_delete_auth.User')
+# flush and migrate rewrite the tables without model signals
+post_migrate.connect(invalidate_reference_data, dispatch_uid='reference_data_post_migrate')
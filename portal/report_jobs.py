@@ -0,0 +1,266 @@
+"""
+Background report jobs
+
+Large date ranges of ``report_view`` and ``export_reports`` can outlast the
+web workers' request timeout. ``submit_report_job`` records the normalized
+parameters as a queued ``ReportJob`` and returns at once; ``manage.py
+run_report_jobs`` claims queued jobs, writes the result file to the default
+storage (``MEDIA_ROOT/report_jobs/``) and updates the progress as rows are
+written, so the page can poll the job and download the file when it is done.
+
+The job hash covers the parameters and the site's data version (see
+``portal.dashboard``, which also explains why the cache must be shared).
+Identical requests while a job is queued or running coalesce onto it, and a
+finished job is reused until it expires or the underlying data changes.
+``expire_report_jobs`` deletes expired jobs with their files and fails
+running jobs whose worker has not touched ``heartbeat_at`` for
+``REPORT_JOB_TIMEOUT`` seconds (default 900); the worker touches it on claim
+and with every progress update. A worker only records its outcome while the
+job is still running, so a job failed as stalled stays failed even if its
+worker turns out to be alive.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .dashboard import data_version
+from .exports import CHUNK_SIZE, EXPORTS, XLSX_AVAILABLE, export_queryset, export_rows, write_csv, write_xlsx
+from .models import ReportJob
+from .reports import ReportEngine, parse_report_filters
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Attempts to queue a job while identical jobs keep being queued and finishing concurrently
+SUBMIT_ATTEMPTS = 3
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+
+def _result_ttl():
+    return timedelta(seconds=getattr(settings, 'REPORT_JOB_TTL', 24 * 3600))
+
+
+def _run_timeout():
+    return timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 900))
+
+
+def job_params(kind, params):
+    """
+    The normalized parameters of a job from request parameters; raises
+    ValueError for an unknown kind, export or format.
+    """
+    filters = parse_report_filters(params)
+    if kind == 'export':
+        export_type = params.get('export', 'invoices')
+        if export_type not in EXPORTS:
+            raise ValueError(f"Unknown export '{export_type}'")
+        export_format = params.get('format') or 'csv'
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown format '{export_format}'")
+        if export_format == 'xlsx' and not XLSX_AVAILABLE:
+            raise ValueError('XLSX export requires the XlsxWriter package')
+        return {'export': export_type, 'format': export_format, 'filters': filters}
+    if kind == 'report':
+        report_type = 'purchase_order' if params.get('report_type') == 'purchase_order' else 'invoice'
+        return {'report_type': report_type, 'filters': filters}
+    raise ValueError(f"Unknown job kind '{kind}'")
+
+
+def job_hash(kind, params, site_id):
+    key = json.dumps({'kind': kind, 'params': params, 'version': data_version(site_id)}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def submit_report_job(kind, params, user=None, site_id=None):
+    """
+    Queue a job for ``params`` (as from ``job_params``), or return the job that
+    already covers them. Returns ``(job, created)``.
+    """
+    site_id = site_id or settings.SITE_ID
+    params_hash = job_hash(kind, params, site_id)
+    jobs = ReportJob.all_objects.filter(site_id=site_id, params_hash=params_hash)
+
+    for attempt in range(SUBMIT_ATTEMPTS):
+        existing = (
+            jobs.filter(status__in=ACTIVE_STATUSES).first()
+            or jobs.filter(status='done', expires_at__gt=timezone.now()).first()
+        )
+        if existing:
+            return existing, False
+        try:
+            with transaction.atomic():
+                job = ReportJob.all_objects.create(
+                    site_id=site_id, kind=kind, params=params, params_hash=params_hash, requested_by=user,
+                )
+        except IntegrityError:
+            # An identical job was queued concurrently; it may already have
+            # finished or failed by now, so look again from the top
+            if attempt == SUBMIT_ATTEMPTS - 1:
+                raise
+            continue
+        logger.info(f"Queued {kind} job #{job.pk} on site {site_id}: {params}")
+        return job, True
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def claim_next_job():
+    """
+    Mark the oldest queued job as running and return it, or None when the queue
+    is empty. On databases with ``SELECT ... FOR UPDATE SKIP LOCKED`` several
+    workers never claim the same job.
+    """
+    features = connection.features
+    with transaction.atomic():
+        queued = ReportJob.all_objects.filter(status='queued').order_by('created_at', 'pk')
+        if features.has_select_for_update:
+            queued = queued.select_for_update(skip_locked=features.has_select_for_update_skip_locked)
+        job = queued.first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+    return job
+
+
+def run_report_job(job):
+    """Run a claimed job to completion; failures are recorded on the job"""
+    try:
+        name, path = RUNNERS[job.kind](job)
+        try:
+            with open(path, 'rb') as result:
+                job.result.save(name, File(result), save=False)
+        finally:
+            os.remove(path)
+    except Exception as exc:
+        logger.exception(f"Report job #{job.pk} failed")
+        job.status = 'failed'
+        job.error = str(exc)
+    else:
+        job.status = 'done'
+        job.progress = 100
+        logger.info(f"Report job #{job.pk} done: {job.result.name}")
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + _result_ttl()
+    finished = ReportJob.all_objects.filter(pk=job.pk, status='running').update(
+        status=job.status, progress=job.progress, result=job.result.name, error=job.error,
+        finished_at=job.finished_at, expires_at=job.expires_at,
+    )
+    if not finished:
+        # expire_report_jobs gave up on the job meanwhile; keep its verdict
+        logger.warning(f"Report job #{job.pk} finished after it was failed as stalled; result discarded")
+        if job.result:
+            job.result.delete(save=False)
+        job.refresh_from_db()
+    return job
+
+
+def run_pending_jobs(limit=None):
+    """Claim and run queued jobs until the queue is empty; returns the number run"""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_report_job(job)
+        count += 1
+    return count
+
+
+def expire_report_jobs(now=None):
+    """
+    Delete finished jobs past their expiry together with their result files,
+    and fail running jobs whose worker stopped reporting. Returns the number
+    of jobs deleted.
+    """
+    now = now or timezone.now()
+    stalled = ReportJob.all_objects.filter(status='running', heartbeat_at__lt=now - _run_timeout())
+    stalled.update(status='failed', error='Worker stopped before the job finished', finished_at=now,
+                   expires_at=now + _result_ttl())
+
+    expired = list(ReportJob.all_objects.filter(status__in=('done', 'failed'), expires_at__lte=now))
+    for job in expired:
+        if job.result:
+            job.result.delete(save=False)
+    ReportJob.all_objects.filter(pk__in=[job.pk for job in expired]).delete()
+    return len(expired)
+
+
+# =============================================================================
+# RUNNERS
+# =============================================================================
+
+def _temporary_path(suffix):
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    os.close(handle)
+    return path
+
+
+def _tracked(job, rows):
+    """Pass ``rows`` through, saving the job's progress after every chunk"""
+    count = 0
+    for count, row in enumerate(rows):
+        # The first row is the header
+        if count and count % CHUNK_SIZE == 0:
+            _save_progress(job, count)
+        yield row
+    _save_progress(job, count)
+
+
+def _save_progress(job, rows_done):
+    job.rows_done = rows_done
+    if job.rows_total:
+        job.progress = min(99, rows_done * 100 // job.rows_total)
+    _heartbeat(job, rows_done=job.rows_done, progress=job.progress)
+
+
+def _heartbeat(job, **fields):
+    """Record that the worker is alive, together with ``fields``"""
+    job.heartbeat_at = timezone.now()
+    ReportJob.all_objects.filter(pk=job.pk).update(heartbeat_at=job.heartbeat_at, **fields)
+
+
+def run_export(job):
+    params = job.params
+    job.rows_total = export_queryset(params['export'], params['filters'], job.site_id).count()
+    _heartbeat(job, rows_total=job.rows_total)
+
+    rows = _tracked(job, export_rows(params['export'], params['filters'], job.site_id))
+    path = _temporary_path(f".{params['format']}")
+    if params['format'] == 'xlsx':
+        write_xlsx(rows, path)
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as target:
+            write_csv(rows, target)
+    return f"{params['export']}_export_{job.pk}.{params['format']}", path
+
+
+def run_report(job):
+    params = job.params
+    engine = ReportEngine(params['filters'], params['report_type'], job.site_id)
+    # Also warms the report cache for report_view
+    report = engine.run()
+    _heartbeat(job)
+    path = _temporary_path('.json')
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump({'params': params, 'report': report}, target, cls=DjangoJSONEncoder)
+    return f"{params['report_type']}_report_{job.pk}.json", path
+
+
+RUNNERS = {
+    'export': run_export,
+    'report': run_report,
+}
@@ -0,0 +1,315 @@
+"""
+Report engine behind report_view
+
+``ReportEngine`` turns the report filters into the smallest set of grouped
+queries and runs each of them once:
+
+* one aggregate over the filtered invoices (count, total, average and paid
+  revenue) and one over the filtered purchase orders,
+* the status breakdown of the requested report type,
+* one grouped query per sales dimension (category, product, day) over the daily
+  sales facts, or over the invoice lines when a customer filter is set since
+  facts carry no customer; the sales cost total is summed from the category
+  rows and the monthly breakdown is rolled up from the daily rows,
+* the customers offered in the filter dropdown.
+
+Results are cached under a hash of the normalized filters and the site's data
+version (see ``portal.dashboard``, including its shared cache requirement),
+so any write to the underlying tables retires them. Every run records how
+long each query took in ``timings``.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Q, Sum
+
+from procurement.models import PurchaseOrder
+
+from .dashboard import data_version
+from .models import Customer, DailySalesFact, Invoice, InvoiceItem
+
+logger = logging.getLogger(__name__)
+
+REPORT_KEY = 'reports:{site_id}:{version}:{filter_hash}'
+
+# Customers offered in the filter dropdown, by paid revenue in the period
+CUSTOMER_CHOICES = 100
+
+FILTER_FIELDS = ('customer_id', 'supplier_id', 'status', 'date_from', 'date_to')
+
+
+def _cache_timeout():
+    return getattr(settings, 'REPORT_CACHE_TIMEOUT', 600)
+
+
+def parse_report_filters(params):
+    """
+    The valid filters of a request's GET parameters as strings, keyed like the
+    report template expects; unparseable dates are dropped.
+    """
+    filters = {}
+    for field in FILTER_FIELDS:
+        value = (params.get(field) or '').strip()
+        if not value:
+            continue
+        if field in ('date_from', 'date_to'):
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                continue
+        filters[field] = value
+    return filters
+
+
+class ReportEngine:
+    """Compiled, cached report for one filter set"""
+
+    def __init__(self, filters, report_type='invoice', site_id=None):
+        self.filters = filters
+        self.report_type = 'purchase_order' if report_type == 'purchase_order' else 'invoice'
+        self.site_id = site_id or settings.SITE_ID
+        self.timings = OrderedDict()
+
+    @property
+    def filter_hash(self):
+        key = json.dumps({'filters': self.filters, 'report_type': self.report_type}, sort_keys=True)
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def run(self):
+        """
+        The report results. ``timings`` holds the milliseconds each query took
+        in the run that computed them, ``cached`` tells whether this run was
+        served from the cache and ``elapsed`` how long it took.
+        """
+        started = time.perf_counter()
+        key = REPORT_KEY.format(site_id=self.site_id, version=data_version(self.site_id), filter_hash=self.filter_hash)
+        results = cache.get(key)
+        cached = results is not None
+        if not cached:
+            results = self.compute()
+            results['timings'] = dict(self.timings)
+            cache.set(key, results, _cache_timeout())
+        elapsed = (time.perf_counter() - started) * 1000
+        logger.debug(f"Report {self.filter_hash} {'cached' if cached else 'computed'} in {elapsed:.1f}ms: {self.timings}")
+        return dict(results, cached=cached, elapsed=elapsed)
+
+    # =========================================================================
+    # QUERYSETS
+    # =========================================================================
+
+    def invoices(self):
+        invoices = Invoice.all_objects.filter(site_id=self.site_id)
+        if 'customer_id' in self.filters:
+            invoices = invoices.filter(customer_id=self.filters['customer_id'])
+        if 'status' in self.filters:
+            invoices = invoices.filter(status=self.filters['status'])
+        if 'date_from' in self.filters:
+            invoices = invoices.filter(date__gte=self.filters['date_from'])
+        if 'date_to' in self.filters:
+            invoices = invoices.filter(date__lte=self.filters['date_to'])
+        return invoices
+
+    def purchase_orders(self):
+        orders = PurchaseOrder.all_objects.filter(site_id=self.site_id)
+        if 'supplier_id' in self.filters:
+            orders = orders.filter(supplier_id=self.filters['supplier_id'])
+        if 'status' in self.filters:
+            orders = orders.filter(status=self.filters['status'])
+        if 'date_from' in self.filters:
+            orders = orders.filter(order_date__gte=self.filters['date_from'])
+        if 'date_to' in self.filters:
+            orders = orders.filter(order_date__lte=self.filters['date_to'])
+        return orders
+
+    def sales(self):
+        """
+        Paid sales in the filtered period and the expressions to group them by:
+        daily facts, or the invoice lines when filtering on a customer.
+        """
+        if 'customer_id' in self.filters:
+            lines = InvoiceItem.objects.filter(invoice__in=self.invoices().filter(status='paid'))
+            return lines, {
+                'date': 'invoice__date',
+                'category': 'product__category__name',
+                'lines': Count('id'),
+                'cost': F('quantity') * F('product__cost_price'),
+                'revenue': F('quantity') * F('unit_price'),
+            }
+
+        facts = DailySalesFact.all_objects.filter(site_id=self.site_id)
+        if self.filters.get('status', 'paid') != 'paid':
+            facts = facts.none()
+        if 'date_from' in self.filters:
+            facts = facts.filter(date__gte=self.filters['date_from'])
+        if 'date_to' in self.filters:
+            facts = facts.filter(date__lte=self.filters['date_to'])
+        return facts, {
+            'date': 'date',
+            'category': 'category__name',
+            'lines': Sum('lines'),
+            'cost': F('cost'),
+            'revenue': F('revenue'),
+        }
+
+    # =========================================================================
+    # COMPILED QUERIES
+    # =========================================================================
+
+    def _timed(self, name, query):
+        started = time.perf_counter()
+        result = query()
+        self.timings[name] = (time.perf_counter() - started) * 1000
+        return result
+
+    def compute(self):
+        invoices = self.invoices()
+        orders = self.purchase_orders()
+        sales, fields = self.sales()
+
+        invoice_summary = self._timed('invoice_summary', lambda: invoices.aggregate(
+            count=Count('id'),
+            total_amount=Sum('grand_total'),
+            avg_amount=Avg('grand_total'),
+            paid_revenue=Sum('grand_total', filter=Q(status='paid')),
+        ))
+        po_summary = self._timed('po_summary', lambda: orders.aggregate(
+            count=Count('id'),
+            total_amount=Sum('total'),
+            avg_amount=Avg('total'),
+        ))
+        if self.report_type == 'purchase_order':
+            summary = po_summary
+            status_breakdown = self._timed('status_breakdown', lambda: list(
+                orders.values('status').annotate(count=Count('id'), total_amount=Sum('total')).order_by('status')
+            ))
+        else:
+            summary = invoice_summary
+            status_breakdown = self._timed('status_breakdown', lambda: list(
+                invoices.values('status').annotate(count=Count('id'), total_amount=Sum('grand_total')).order_by('status')
+            ))
+
+        categories = self._timed('categories', lambda: list(
+            sales.values(category_name=F(fields['category'])).annotate(
+                count=fields['lines'],
+                total_qty=Sum('quantity'),
+                total_cost=Sum(fields['cost']),
+                total_revenue=Sum(fields['revenue']),
+            ).order_by('-total_revenue')
+        ))
+        top_products = self._timed('top_products', lambda: list(
+            sales.values('product__name', 'product__cost_price').annotate(
+                total_qty=Sum('quantity'),
+                total_revenue=Sum(fields['revenue']),
+                total_cost=Sum(fields['cost']),
+            ).order_by('-total_revenue')[:10]
+        ))
+        days = self._timed('daily', lambda: list(
+            sales.values(day=F(fields['date'])).annotate(
+                sales_value=Sum(fields['revenue']),
+                cost_value=Sum(fields['cost']),
+            ).order_by('day')
+        ))
+        customers = self._timed('customers', self.customer_choices)
+
+        total_revenue = invoice_summary['paid_revenue'] or 0
+        total_cost_value = sum((row['total_cost'] or 0 for row in categories), Decimal('0'))
+        gross_profit = total_revenue - total_cost_value
+        gross_margin = (gross_profit / total_revenue) * 100 if total_revenue > 0 else 0
+
+        category_analysis = [_category_row(row) for row in categories[:10]]
+        avg_margin = 0
+        if category_analysis:
+            avg_margin = sum(row['margin'] for row in category_analysis) / len(category_analysis)
+
+        return {
+            'stats': {
+                'total_count': summary['count'],
+                'total_amount': summary['total_amount'] or 0,
+                'avg_amount': summary['avg_amount'] or 0,
+                'status_breakdown': status_breakdown,
+            },
+            'invoice_totals': {'count': invoice_summary['count'], 'total_amount': invoice_summary['total_amount'] or 0},
+            'po_totals': {'count': po_summary['count'], 'total_amount': po_summary['total_amount'] or 0},
+            'total_revenue': total_revenue,
+            'total_cost_value': total_cost_value,
+            'gross_profit': gross_profit,
+            'gross_margin': gross_margin,
+            'avg_margin': avg_margin,
+            'category_analysis': category_analysis,
+            'top_products': [_product_row(row) for row in top_products],
+            'daily_profit_breakdown': [
+                _profit_row('date', row['day'], row['sales_value'], row['cost_value']) for row in days
+            ],
+            'monthly_profit_breakdown': _monthly_rows(days),
+            'customers': customers,
+        }
+
+    def customer_choices(self):
+        """Top customers by paid revenue in the period, plus the selected one"""
+        ranked = list(
+            self.invoices().filter(status='paid', customer__isnull=False)
+            .values('customer_id')
+            .annotate(revenue=Sum('grand_total'))
+            .order_by('-revenue')
+            .values_list('customer_id', flat=True)[:CUSTOMER_CHOICES]
+        )
+        if 'customer_id' in self.filters:
+            ranked.append(self.filters['customer_id'])
+        choices = Customer.all_objects.filter(site_id=self.site_id, pk__in=ranked)
+        return list(choices.order_by('full_name').values('id', 'full_name'))
+
+
+# =============================================================================
+# ROWS
+# =============================================================================
+
+def _percent(part, whole):
+    return (part / whole) * 100 if whole else 0
+
+
+def _category_row(row):
+    total_cost = row['total_cost'] or 0
+    total_revenue = row['total_revenue'] or 0
+    return {
+        **row,
+        'total_selling': total_revenue,
+        'margin': _percent(total_revenue - total_cost, total_cost) if total_cost > 0 else 0,
+    }
+
+
+def _product_row(row):
+    total_profit = (row['total_revenue'] or 0) - (row['total_cost'] or 0)
+    return {
+        **row,
+        'total_profit': total_profit,
+        'margin': _percent(total_profit, row['total_revenue']) if (row['total_revenue'] or 0) > 0 else 0,
+    }
+
+
+def _profit_row(period_name, period, sales_value, cost_value):
+    sales_value = sales_value or 0
+    cost_value = cost_value or 0
+    gross_profit = sales_value - cost_value
+    return {
+        period_name: period,
+        'sales_value': sales_value,
+        'cost_value': cost_value,
+        'gross_profit': gross_profit,
+        'margin': _percent(gross_profit, sales_value) if sales_value > 0 else 0,
+    }
+
+
+def _monthly_rows(days):
+    months = OrderedDict()
+    for row in days:
+        month = row['day'].replace(day=1)
+        sales_value, cost_value = months.get(month, (0, 0))
+        months[month] = (sales_value + (row['sales_value'] or 0), cost_value + (row['cost_value'] or 0))
+    return [_profit_row('month', month, *values) for month, values in months.items()]
@@ -0,0 +1,89 @@
+"""
+Daily sales fact maintenance
+
+``DailySalesFact`` holds paid sales grouped by site, day, product, category and
+payment mode. A day is always rebuilt as a whole from its SoldItem rows (one
+grouped query, one DELETE and one bulk INSERT), so facts are self-healing and
+keep the cost recorded on the sold items instead of the product's current cost
+price. Invoice status changes and sales ledger postings queue their days with
+``schedule_sales_facts``; all days queued in one transaction are rebuilt once
+when it commits (see ``portal.coalescing``).
+
+Recomputing the day rather than applying a per-invoice delta makes a payment
+cost one grouped query over that day's sold items of the site, i.e. it grows
+with the day's sales volume (a few hundred lines for a busy branch), runs after
+the commit instead of inside the request's transaction, and is shared by every
+invoice paid in the same transaction. In exchange the facts never drift: an
+edited line, a changed payment mode or a sold item written in bulk is picked
+up by the next rebuild of its day without tracking old contributions.
+"""
+import logging
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .coalescing import pending_batch
+from .dashboard import invalidate_dashboard
+from .models import DailySalesFact, SoldItem
+
+logger = logging.getLogger(__name__)
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def rebuild_sales_facts(site_id, start, end=None, using=DEFAULT_DB_ALIAS):
+    """Recompute the facts of ``site_id`` for the days ``start`` to ``end`` (inclusive)"""
+    end = end or start
+    # Sold items recorded before unit costs were kept fall back to the current cost price
+    unit_cost = Coalesce('unit_cost', 'product__cost_price', Value(Decimal('0')), output_field=MONEY)
+    rows = (
+        SoldItem.all_objects.using(using)
+        .filter(site_id=site_id, invoice__status='paid', invoice__date__gte=start, invoice__date__lte=end)
+        .values('invoice__date', 'product_id', 'product__category_id', 'invoice__payment_mode')
+        .annotate(
+            line_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(F('quantity') * F('unit_price'), output_field=MONEY),
+            total_cost=Sum(F('quantity') * unit_cost, output_field=MONEY),
+        )
+        .order_by()
+    )
+    facts = [
+        DailySalesFact(
+            site_id=site_id,
+            date=row['invoice__date'],
+            product_id=row['product_id'],
+            category_id=row['product__category_id'],
+            payment_mode=row['invoice__payment_mode'],
+            lines=row['line_count'],
+            quantity=row['total_quantity'],
+            revenue=row['total_revenue'] or 0,
+            cost=row['total_cost'] or 0,
+        )
+        for row in rows
+    ]
+    with transaction.atomic(using=using):
+        DailySalesFact.all_objects.using(using).filter(site_id=site_id, date__gte=start, date__lte=end).delete()
+        DailySalesFact.all_objects.using(using).bulk_create(facts, batch_size=1000)
+    # Bulk writes send no model signals
+    invalidate_dashboard(site_id)
+    logger.debug(f"Rebuilt {len(facts)} sales fact(s) for site {site_id} from {start} to {end}")
+    return len(facts)
+
+
+def _rebuild_queued(days_by_site, using):
+    for site_id, days in days_by_site.items():
+        for day in sorted(days):
+            rebuild_sales_facts(site_id, day, using=using)
+
+
+def schedule_sales_facts(site_id, day, using=DEFAULT_DB_ALIAS):
+    """Queue one day of a site for a fact rebuild when the current transaction commits"""
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        rebuild_sales_facts(site_id, day, using=using)
+        return
+
+    pending_batch('sales_facts', _rebuild_queued, using)[site_id].add(day)
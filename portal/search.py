@@ -0,0 +1,189 @@
+"""
+Ranked product search
+
+Every product has a ``ProductSearchDocument``: its name, Arabic name, SKU,
+barcode, category and both descriptions, run through ``normalize_search_text``
+(case folding, diacritics and tatweel stripped, alef/ya/ta marbuta
+variants folded, Arabic-Indic digits mapped to ASCII). Queries get the same
+normalization, so "أحمر" finds "احمر" and "١٢٣" finds "123".
+
+``search_products`` is the one entry point for the product search views and
+endpoints. It narrows a product queryset to the matches and orders them by
+``search_rank``:
+
+* PostgreSQL: prefix ``tsquery`` against a GIN index on the ``simple``
+  tsvector of the document, plus trigram word similarity (GIN ``gin_trgm_ops``)
+  for misspellings; rank is ``ts_rank`` plus the similarity.
+* SQLite (development and tests): an FTS5 table kept in sync with the
+  documents by triggers, ranked by ``bm25``.
+
+Exact SKU or barcode hits always rank first. The documents follow product and
+category saves; ``manage.py rebuild_product_search`` rebuilds them after bulk
+changes that bypass signals.
+"""
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+
+from .models import Category, Product, ProductSearchDocument
+
+FTS_TABLE = 'portal_productsearch_fts'
+
+# Share of the trigram word similarity in the PostgreSQL rank
+TRIGRAM_WEIGHT = 0.5
+
+# Exact SKU or barcode matches rank above any text match
+EXACT_MATCH_BOOST = 10.0
+
+# Harakat, Quranic marks, superscript alef and tatweel
+_ARABIC_MARKS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_NON_WORD = re.compile(r'[\W_]+')
+_ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و',
+    'ة': 'ه',
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06f0 + digit): str(digit) for digit in range(10)},
+})
+
+
+def normalize_search_text(text):
+    """Search form of ``text``: folded, unaccented words separated by single spaces"""
+    if not text:
+        return ''
+    text = _ARABIC_MARKS.sub('', str(text)).translate(_ARABIC_FOLDING)
+    # Compatibility decomposition also unfolds Arabic presentation forms and ligatures
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    text = text.casefold()
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def search_document(product, category_name=None):
+    """The normalized search text of ``product``"""
+    if category_name is None:
+        category_name = product.category.name if product.category_id else ''
+    parts = (
+        product.name, product.name_ar, product.sku, product.barcode, category_name,
+        product.description, product.description_ar,
+    )
+    return normalize_search_text(' '.join(part for part in parts if part))
+
+
+# =============================================================================
+# SEARCHING
+# =============================================================================
+
+def search_products(query, queryset=None):
+    """
+    The products of ``queryset`` (default: the current site's) matching
+    ``query``, annotated with ``search_rank`` and ordered best first. An empty
+    query matches nothing.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    terms = normalize_search_text(query).split()
+    if not terms:
+        return queryset.none()
+
+    raw = query.strip()
+    exact = Q(sku__iexact=raw) | Q(barcode=raw)
+    boost = Case(When(exact, then=Value(EXACT_MATCH_BOOST)), default=Value(0.0), output_field=FloatField())
+
+    if connections[queryset.db].vendor == 'postgresql':
+        queryset, matched, rank = _postgres_match(queryset, terms)
+    else:
+        queryset, matched, rank = _fts5_match(queryset, terms)
+    return queryset.filter(matched | exact).annotate(search_rank=rank + boost).order_by('-search_rank', '-id')
+
+
+def _postgres_match(queryset, terms):
+    from django.contrib.postgres.lookups import TrigramWordSimilar
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+
+    ProductSearchDocument._meta.get_field('document').register_lookup(TrigramWordSimilar)
+
+    text = ' '.join(terms)
+    # Terms are word characters only, so they are safe in a raw tsquery
+    search_query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config='simple')
+    queryset = queryset.annotate(
+        # Same expression as the GIN index of the 0030 migration
+        search_vector=SearchVector('search_document__document', config='simple'),
+        search_similarity=TrigramWordSimilarity(text, 'search_document__document'),
+    )
+    matched = Q(search_vector=search_query) | Q(search_document__document__trigram_word_similar=text)
+    rank = SearchRank(F('search_vector'), search_query) + F('search_similarity') * TRIGRAM_WEIGHT
+    return queryset, matched, Coalesce(rank, Value(0.0), output_field=FloatField())
+
+
+def _fts5_match(queryset, terms):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    matched = Q(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,)))
+    # bm25 is lower for better matches; exact SKU or barcode hits may have no FTS row
+    rank = RawSQL(
+        f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "{Product._meta.db_table}"."id"',
+        (match,),
+        output_field=FloatField(),
+    )
+    return queryset, matched, Coalesce(rank, Value(0.0), output_field=FloatField())
+
+
+# =============================================================================
+# MAINTENANCE
+# =============================================================================
+
+def index_product(product):
+    """Create or refresh the search document of one product"""
+    ProductSearchDocument.objects.update_or_create(product=product, defaults={'document': search_document(product)})
+
+
+def rebuild_search_documents(products=None, batch_size=500):
+    """
+    Recompute the search documents of ``products`` (default: every product of
+    every site) in batches; returns the number of documents written.
+    """
+    if products is None:
+        products = Product.all_objects.all()
+    products = products.select_related('category').order_by('pk')
+
+    written = 0
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(ProductSearchDocument(product=product, document=search_document(product)))
+        if len(batch) >= batch_size:
+            written += _write_documents(batch)
+            batch = []
+    if batch:
+        written += _write_documents(batch)
+    return written
+
+
+def _write_documents(documents):
+    existing = set(
+        ProductSearchDocument.objects.filter(product__in=[doc.product_id for doc in documents])
+        .values_list('product_id', flat=True)
+    )
+    ProductSearchDocument.objects.bulk_create([doc for doc in documents if doc.product_id not in existing])
+    ProductSearchDocument.objects.bulk_update([doc for doc in documents if doc.product_id in existing], ['document'])
+    return len(documents)
+
+
+def update_product_search(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_product(instance)
+
+
+def update_category_search(sender, instance, created=False, raw=False, **kwargs):
+    """The category name is part of its products' documents"""
+    if raw or created:
+        return
+    rebuild_search_documents(Product.all_objects.filter(category=instance))
+
+
+post_save.connect(update_product_search, sender=Product, dispatch_uid='search_post_save_Product')
+post_save.connect(update_category_search, sender=Category, dispatch_uid='search_post_save_Category')
@@ -1,7 +1,10 @@
 # portal/signals.py
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import Invoice, InvoiceItem, SoldItem
+from .models import Invoice, InvoiceItem, Quotation, QuotationItem, SoldItem
+from .invoice_utils import build_sold_item, sales_lines
+from .sales_facts import schedule_sales_facts
+from .totals import schedule_totals
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,32 +27,24 @@ def handle_invoice_status_change(sender, instance, created, **kwargs):
             else:
                 logger.info(f"📦 Invoice {instance.invoice_number} already has sold items recorded")
 
+        # A paid invoice's lines are grouped into the facts of its site, day and
+        # payment mode, so changing any of those (or the status) moves them
+        previous = getattr(instance, '_previous_fact_key', None)
+        current = _sales_fact_key(instance)
+        if previous != current:
+            for status, site_id, day, _ in filter(None, (previous, current)):
+                if status == 'paid':
+                    schedule_sales_facts(site_id, day)
+
 def create_sold_items_from_invoice(invoice):
     """
     Create SoldItem records from an invoice's items.
-    This tracks what was sold without affecting product stock.
+    This tracks what was sold without affecting product stock. The lines are
+    read with their products in one query and written with one bulk insert.
     """
-    sold_items_created = 0
-    
-    for item in invoice.items.all():
-        try:
-            sold_item = SoldItem.objects.create(
-                invoice=invoice,
-                product_name=item.product.name,
-                quantity=item.quantity,
-                unit_price=item.unit_price or item.product.unit_price,
-                product=item.product,
-                product_sku=item.product.sku if hasattr(item.product, 'sku') else '',
-                category_name=item.product.category.name if item.product.category else '',
-                date_sold=invoice.date
-            )
-            sold_items_created += 1
-            logger.info(f"✅ Created sold item: {sold_item.product_name} x {sold_item.quantity}")
-            
-        except Exception as e:
-            logger.error(f"❌ Error creating sold item for {item.product.name}: {str(e)}")
-    
-    logger.info(f"📈 Total sold items created for invoice {invoice.invoice_number}: {sold_items_created}")
+    sold_items = [build_sold_item(invoice, item) for item in sales_lines([invoice.pk])]
+    SoldItem.all_objects.bulk_create(sold_items)
+    logger.info(f"📈 Total sold items created for invoice {invoice.invoice_number}: {len(sold_items)}")
 
 @receiver(pre_save, sender=Invoice)
 def track_invoice_status_change(sender, instance, **kwargs):
@@ -59,7 +54,52 @@ def track_invoice_status_change(sender, instance, **kwargs):
     if instance.pk:  # Only for existing instances
         try:
             old_instance = Invoice.objects.get(pk=instance.pk)
+            instance._previous_status = old_instance.status
+            instance._previous_fact_key = _sales_fact_key(old_instance)
             if old_instance.status != instance.status:
                 logger.info(f"🔄 Invoice {instance.invoice_number} status changing from '{old_instance.status}' to '{instance.status}'")
         except Invoice.DoesNotExist:
-            pass
\ No newline at end of file
+            pass
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_sales_facts(sender, instance, **kwargs):
+    """A deleted paid invoice takes its sold items out of the day's sales facts"""
+    if instance.status == 'paid':
+        schedule_sales_facts(instance.site_id, instance.date)
+
+
+@receiver(post_save, sender=SoldItem)
+@receiver(post_delete, sender=SoldItem)
+def schedule_sold_item_sales_facts(sender, instance, raw=False, **kwargs):
+    """
+    Sold items edited one at a time (e.g. in the admin) change their day's facts;
+    the bulk inserts of the ledger passes send no signals and schedule their days.
+    """
+    if raw:
+        return
+    invoice = Invoice.all_objects.filter(pk=instance.invoice_id, status='paid').values('site_id', 'date').first()
+    if invoice:
+        schedule_sales_facts(invoice['site_id'], invoice['date'])
+
+
+def _sales_fact_key(invoice):
+    """The invoice fields that place its sold items in the sales facts"""
+    return (invoice.status, invoice.site_id, invoice.date, invoice.payment_mode)
+
+
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+def schedule_invoice_totals(sender, instance, **kwargs):
+    """
+    Recalculate the parent invoice's totals once the transaction commits.
+    Any number of item saves in one transaction collapse into one recalculation.
+    """
+    schedule_totals(Invoice(pk=instance.invoice_id))
+
+
+@receiver(post_save, sender=QuotationItem)
+@receiver(post_delete, sender=QuotationItem)
+def schedule_quotation_totals(sender, instance, **kwargs):
+    """Same as ``schedule_invoice_totals`` for quotation lines"""
+    schedule_totals(Quotation(pk=instance.quotation_id))
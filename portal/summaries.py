@@ -0,0 +1,17 @@
+"""
+Summary statistics for the list views
+
+The list pages show a handful of counts and totals over the rows they list.
+``summarize`` computes all of them with one conditional aggregate (filtered
+``Count``/``Sum``) over the view's already filtered queryset, instead of one
+``count()`` or ``aggregate()`` scan per figure.
+"""
+
+
+def summarize(queryset, **aggregates):
+    """
+    Evaluate the named ``aggregates`` over ``queryset`` in one query. Sums over
+    no rows come back as 0 rather than None.
+    """
+    results = queryset.order_by().aggregate(**aggregates)
+    return {name: 0 if value is None else value for name, value in results.items()}
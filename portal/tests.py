@@ -1,3 +1,1308 @@
-from django.test import TestCase
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from finance.models import FinancialSummary, FinanceTransaction, InventoryTransaction
+
+from portal import ajax_views, reference_data, views
+from portal.barcode_index import build_barcode_index, get_by_code, get_index, needs_rebuild
+from portal.barcode_utils import BarcodeGenerator
+from portal.checks import check_shared_cache
+from portal.dashboard import TILES, DashboardMetrics, revenue_series
+from portal.exports import XLSX_AVAILABLE, export_rows, write_xlsx
+from portal.invoice_utils import (
+    InvoiceLineError, add_invoice_items, lines_subtotal, parse_invoice_lines, sync_invoice_items,
+)
+from portal.models import (
+    Category, Customer, DailySalesFact, DocumentSequence, InventoryValuation, Invoice, InvoiceItem, Product, Quotation,
+    QuotationItem, ReportJob, SoldItem,
+)
+from portal.pagination import InvalidCursor, KeysetPaginator
+from portal.report_jobs import expire_report_jobs, job_params, run_pending_jobs, submit_report_job
+from portal.reports import ReportEngine, parse_report_filters
+from portal.search import normalize_search_text, rebuild_search_documents, search_products
+from portal.totals import recalculate_totals
+from portal.typeahead import search_customers
+from portal.valuation import reconcile_valuation
+
+from procurement.models import PurchaseItem, PurchaseOrder, PurchasePayment, Supplier
+
+PRODUCT_DEFAULTS = {
+    'description': '', 'cost_price': Decimal('10.00'), 'unit_price': Decimal('25.00'), 'stock': 5,
+    'warranty_period': 12,
+}
+
+
+def create_product(category, sku, **fields):
+    """A product named after ``sku`` with the test defaults; ``category`` may be the name of a category"""
+    if isinstance(category, str):
+        category = Category.objects.get_or_create(name=category)[0]
+    return Product.objects.create(category=category, sku=sku, **{'name': sku, **PRODUCT_DEFAULTS, **fields})
+
+
+class DocumentSequenceTests(TestCase):
+    def test_numbers_keep_existing_formats(self):
+        day = date(2025, 1, 15)
+        self.assertEqual(DocumentSequence.next_number('invoice', day=day), '2025011501')
+        self.assertEqual(DocumentSequence.next_number('quotation', day=day), 'QT-2025011501')
+        self.assertEqual(DocumentSequence.next_number('receipt', day=day), 'RC-2025011501')
+        self.assertEqual(DocumentSequence.next_number('invoice', day=day), '2025011502')
+
+    def test_sequence_widens_past_99(self):
+        day = date(2025, 1, 15)
+        numbers = DocumentSequence.reserve_numbers('invoice', 120, day=day)
+        self.assertEqual(numbers[98], '2025011599')
+        self.assertEqual(numbers[99], '20250115100')
+        self.assertEqual(len(set(numbers)), 120)
+
+    def test_sequences_are_per_day_and_type(self):
+        DocumentSequence.reserve_numbers('invoice', 5, day=date(2025, 1, 15))
+        self.assertEqual(DocumentSequence.next_number('invoice', day=date(2025, 1, 16)), '2025011601')
+        self.assertEqual(DocumentSequence.next_number('quotation', day=date(2025, 1, 15)), 'QT-2025011501')
+
+    def test_numbers_are_unique_across_sites(self):
+        other_site = Site.objects.create(domain='branch.example.com', name='Branch')
+        today = timezone.now().date()
+        first = Invoice.objects.create(due_date=today, status='draft')
+        second = Invoice.all_objects.create(site=other_site, due_date=today, status='draft')
+        self.assertEqual(first.invoice_number, DocumentSequence.format_number('invoice', today, 1))
+        self.assertEqual(second.invoice_number, DocumentSequence.format_number('invoice', today, 2))
+        self.assertEqual(DocumentSequence.objects.filter(document_type='invoice').count(), 1)
+
+
+class CustomerIdTests(TestCase):
+    def test_ids_are_sequential_per_month(self):
+        month = date(2025, 10, 1)
+        ids = Customer.reserve_customer_ids(3, month=date(2025, 10, 17))
+        self.assertEqual(ids, ['25100000AB', '25100000AC', '25100000AD'])
+        self.assertEqual(DocumentSequence.format_customer_id(month, 26 * 26), '25100001AA')
+        self.assertEqual([DocumentSequence.parse_customer_id(value) for value in ids], [1, 2, 3])
+        # Legacy random IDs put the letters first and are never decoded as counter values
+        self.assertIsNone(DocumentSequence.parse_customer_id('2510AB1234'))
+
+    def test_bulk_create_assigns_ids_from_one_block(self):
+        customers = [Customer(full_name=f'Customer {i}', phone=f'5550{i:04d}') for i in range(250)]
+        Customer.bulk_create_with_ids(customers)
+        ids = list(Customer.objects.values_list('customer_id', flat=True))
+        self.assertEqual(len(ids), 250)
+        self.assertEqual(len(set(ids)), 250)
+        next_id = Customer.objects.create(full_name='Next', phone='1').customer_id
+        self.assertEqual(DocumentSequence.parse_customer_id(next_id), 251)
+
+
+class BarcodeRangeTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Cables')
+
+    def _products(self, count, **extra):
+        return Product.objects.bulk_create([
+            Product(
+                category=self.category, name=f'Cable {i}', sku=f'CB-{i}', description='',
+                cost_price=Decimal('1.00'), unit_price=Decimal('2.00'), stock=0, warranty_period=0, **extra,
+            )
+            for i in range(count)
+        ])
+
+    def test_reserved_barcodes_are_sequential_ean13(self):
+        codes = BarcodeGenerator.reserve_barcodes(3)
+        self.assertEqual([code[:12] for code in codes], ['291000000001', '291000000002', '291000000003'])
+        for code in codes:
+            self.assertEqual(code[12], BarcodeGenerator.calculate_ean13_check_digit(code[:12]))
+
+    def test_sequence_is_seeded_above_existing_codes(self):
+        product = self._products(1)[0]
+        product.barcode = '2910000004205'
+        product.save(update_fields=['barcode'])
+        self.assertEqual(BarcodeGenerator.generate_unique_barcode()[:12], '291000000421')
+
+    def test_assign_uses_constant_queries(self):
+        self._products(300)
+        with CaptureQueriesContext(connection) as queries:
+            products = BarcodeGenerator.assign_barcodes(Product.objects.filter(barcode__isnull=True))
+        # Product fetch, counter allocation (incl. first-use seeding and savepoints), one bulk UPDATE
+        # and one batch of search documents
+        self.assertLessEqual(len(queries), 16)
+        self.assertEqual(len({product.barcode for product in products}), 300)
+        self.assertFalse(Product.objects.filter(barcode__isnull=True).exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class DocumentSequenceConcurrencyTests(TransactionTestCase):
+    """Needs row locks: SQLite serializes writers by locking the whole database"""
+    workers = 8
+    allocations_per_worker = 25
+
+    def test_concurrent_allocation_hands_out_unique_numbers(self):
+        day = date(2025, 1, 15)
+        results = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(self.allocations_per_worker):
+                    number = DocumentSequence.next_number('invoice', day=day)
+                    with lock:
+                        results.append(number)
+            except Exception as exc:  # surfaced through the assertion below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        total = self.workers * self.allocations_per_worker
+        self.assertEqual(len(results), total)
+        self.assertEqual(len(set(results)), total)
+        expected = {DocumentSequence.format_number('invoice', day, value) for value in range(1, total + 1)}
+        self.assertEqual(set(results), expected)
+
+
+class InvoiceLineIngestionTests(TestCase):
+    def setUp(self):
+        self.products = [
+            create_product('Networking', f'SW-{i}', name=f'Switch {i}', unit_price=Decimal('15.00'))
+            for i in range(3)
+        ]
+        self.invoice = Invoice.objects.create(invoice_number='2025011501', due_date=date(2025, 1, 15), status='draft')
+
+    def test_create_path_uses_constant_queries(self):
+        items_data = [
+            {'product': str(product.id), 'quantity': '2', 'unit_price': '20.00'}
+            for product in self.products * 50
+        ]
+        with self.assertNumQueries(2):
+            lines = parse_invoice_lines(items_data)
+            add_invoice_items(self.invoice, lines)
+        self.assertEqual(self.invoice.items.count(), 150)
+        self.assertEqual(lines_subtotal(lines), Decimal('6000.00'))
+
+    def test_invalid_lines_are_skipped_or_rejected(self):
+        items_data = [{'product': ''}, {'product': '999999'}, {'product': str(self.products[0].id), 'quantity': 'x'}]
+        lines = parse_invoice_lines(items_data)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['quantity'], 1)
+        self.assertEqual(lines[0]['unit_price'], Decimal('15.00'))
+        with self.assertRaises(InvoiceLineError):
+            parse_invoice_lines(items_data, strict=True)
+
+    def test_sync_updates_creates_and_deletes(self):
+        add_invoice_items(self.invoice, parse_invoice_lines([
+            {'product': str(self.products[0].id), 'quantity': '1'},
+            {'product': str(self.products[1].id), 'quantity': '1'},
+        ]))
+        first, second = self.invoice.items.order_by('id')
+        sync_invoice_items(self.invoice, parse_invoice_lines([
+            {'id': first.id, 'product': str(self.products[0].id), 'quantity': '4', 'unit_price': '15.00'},
+            {'product': str(self.products[2].id), 'quantity': '2'},
+        ], strict=True))
+        items = {item.product_id: item for item in self.invoice.items.all()}
+        self.assertEqual(set(items), {self.products[0].id, self.products[2].id})
+        self.assertEqual(items[self.products[0].id].quantity, 4)
+
+
+class DocumentTotalsTests(TestCase):
+    def setUp(self):
+        self.product = create_product('Networking', 'RT-1', name='Router')
+
+    def test_item_saves_coalesce_into_one_recalculation(self):
+        invoice = Invoice.objects.create(
+            invoice_number='2025011501', due_date=date(2025, 1, 15), status='draft',
+            tax=Decimal('5.00'), discount_type='percent', discount_value=Decimal('10'),
+        )
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for _ in range(20):
+                InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=2, unit_price=Decimal('12.50'))
+            InvoiceItem.objects.filter(invoice=invoice).first().delete()
+
+        self.assertEqual(len(callbacks), 1)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.subtotal, Decimal('475.00'))
+        self.assertEqual(invoice.total, Decimal('480.00'))
+        self.assertEqual(invoice.discount_amount, Decimal('48.00'))
+        self.assertEqual(invoice.grand_total, Decimal('432.00'))
+
+    def test_recalculation_is_one_aggregate_and_one_update(self):
+        invoice = Invoice.objects.create(
+            invoice_number='2025011502', due_date=date(2025, 1, 15), status='draft',
+            discount_type='amount', discount_value=Decimal('1000'),
+        )
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(invoice=invoice, product=self.product, quantity=1, unit_price=Decimal('30.00'))
+            for _ in range(3)
+        ])
+        with self.assertNumQueries(2):
+            totals = recalculate_totals(Invoice, [invoice.pk])
+        # A fixed discount never takes the invoice below zero
+        self.assertEqual(totals[invoice.pk]['discount_amount'], Decimal('90.00'))
+        self.assertEqual(totals[invoice.pk]['grand_total'], Decimal('0.00'))
+
+    def test_quotation_totals(self):
+        quotation = Quotation.objects.create(
+            valid_until=date(2025, 2, 15), tax_rate=Decimal('5'),
+            discount_type='amount', discount_value=Decimal('10'),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            QuotationItem.objects.create(quotation=quotation, product=self.product, quantity=4)
+        quotation.refresh_from_db()
+        self.assertEqual(quotation.subtotal, Decimal('100.00'))
+        self.assertEqual(quotation.tax, Decimal('5.00'))
+        self.assertEqual(quotation.total, Decimal('95.00'))
+
+
+class SoldItemLedgerTests(TestCase):
+    def setUp(self):
+        self.products = [create_product('Networking', f'RT-{n}', name=f'Router {n}') for n in range(8)]
+
+    def _mark_paid(self, number, line_count):
+        invoice = Invoice.objects.create(invoice_number=number, due_date=date(2025, 1, 15), status='draft')
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(invoice=invoice, product=product, quantity=1, unit_price=Decimal('25.00'))
+            for product in self.products[:line_count]
+        ])
+        invoice.status = 'paid'
+        with CaptureQueriesContext(connection) as queries:
+            invoice.save()
+        return invoice, len(queries)
+
+    def test_marking_paid_costs_the_same_queries_for_any_line_count(self):
+        self._mark_paid('2025011500', 1)  # creates this month's financial summary row
+        small, small_queries = self._mark_paid('2025011501', 1)
+        large, large_queries = self._mark_paid('2025011502', 8)
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(SoldItem.objects.filter(invoice=large).count(), 8)
+        sold = SoldItem.objects.filter(invoice=small).get()
+        self.assertEqual((sold.product_sku, sold.category_name), ('RT-0', 'Networking'))
+
+
+class DailySalesFactTests(TestCase):
+    def setUp(self):
+        self.product = create_product('Networking', 'RT-1', name='Router')
+        self.category = self.product.category
+
+    def _invoice(self, number, quantity):
+        invoice = Invoice.objects.create(invoice_number=number, due_date=date(2025, 1, 15), status='draft')
+        InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=quantity, unit_price=Decimal('25.00'))
+        return invoice
+
+    def _set_status(self, invoice, status):
+        invoice.status = status
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+
+    def test_paid_invoices_feed_the_facts_with_cost_at_sale(self):
+        first = self._invoice('2025011501', 2)
+        second = self._invoice('2025011502', 3)
+        self._set_status(first, 'paid')
+        self._set_status(second, 'paid')
+
+        fact = DailySalesFact.objects.get()
+        self.assertEqual((fact.lines, fact.quantity), (2, 5))
+        self.assertEqual((fact.revenue, fact.cost), (Decimal('125.00'), Decimal('50.00')))
+        self.assertEqual((fact.category, fact.payment_mode), (self.category, first.payment_mode))
+
+        # Later cost changes do not rewrite history
+        Product.objects.filter(pk=self.product.pk).update(cost_price=Decimal('20.00'))
+        call_command('backfill_sales_facts', stdout=StringIO())
+        self.assertEqual(DailySalesFact.objects.get().cost, Decimal('50.00'))
+
+        self._set_status(second, 'cancelled')
+        fact = DailySalesFact.objects.get()
+        self.assertEqual((fact.quantity, fact.revenue), (2, Decimal('50.00')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertFalse(DailySalesFact.objects.exists())
+
+    def test_fact_fields_of_paid_invoices_move_their_lines(self):
+        invoice = self._invoice('2025011501', 2)
+        self._set_status(invoice, 'paid')
+        self.assertEqual(DailySalesFact.objects.get().payment_mode, invoice.payment_mode)
+
+        invoice.payment_mode = 'pos'
+        invoice.date = date(2025, 1, 20)
+        with self.captureOnCommitCallbacks(execute=True):
+            invoice.save()
+        fact = DailySalesFact.objects.get()
+        self.assertEqual((fact.date, fact.payment_mode, fact.quantity), (date(2025, 1, 20), 'pos', 2))
+
+        sold_item = SoldItem.objects.get(invoice=invoice)
+        sold_item.quantity = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            sold_item.save()
+        self.assertEqual(DailySalesFact.objects.get().quantity, 3)
+
+
+class DashboardMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser('dash', 'dash@example.com', 'secret')
+        self.product = create_product(
+            'Storage', 'DSK-1', name='Disk', cost_price=Decimal('40.00'), unit_price=Decimal('60.00'), stock=4,
+        )
+        invoice = Invoice.objects.create(invoice_number='2025020101', due_date=date(2025, 2, 1), status='draft')
+        InvoiceItem.objects.create(invoice=invoice, product=self.product, quantity=2, unit_price=Decimal('60.00'))
+
+    def _render_dashboard(self):
+        request = RequestFactory().get('/dashboard/')
+        request.user = self.user
+        with mock.patch.object(views, 'render', return_value=HttpResponse()) as render:
+            views.dashboard_view(request)
+        return render.call_args[0][2]
+
+    def test_one_aggregate_query_per_table(self):
+        metrics = DashboardMetrics()
+        with self.assertNumQueries(1):
+            figures = metrics.product_figures()
+        self.assertEqual(figures['active_products'], 1)
+        self.assertEqual(figures['potential_profit'], Decimal('80.00'))
+        with self.assertNumQueries(1):
+            self.assertEqual(metrics.invoice_figures()['pending_invoices'], 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(metrics.purchase_order_figures()['total_purchase_orders'], 0)
+
+    def test_dashboard_query_budget(self):
+        DailySalesFact.objects.create(
+            date=timezone.now().date(), product=self.product, category=self.product.category, payment_mode='cash',
+            lines=1, quantity=3, revenue=Decimal('180.00'), cost=Decimal('120.00'),
+        )
+        with CaptureQueriesContext(connection) as cold:
+            context = self._render_dashboard()
+        # One query per table; the lists come with their table's figures
+        self.assertLessEqual(len(cold), 6)
+        self.assertEqual(context['total_customers'], 0)
+        self.assertEqual(context['pending_invoices'], 1)
+        self.assertEqual(len(context['recent_invoices']), 1)
+        self.assertEqual([product.name for product in context['low_stock_products']], ['Disk'])
+        self.assertEqual(
+            context['top_products'], [{'product__name': 'Disk', 'total_qty': 3, 'total_revenue': Decimal('180.00')}],
+        )
+
+        with CaptureQueriesContext(connection) as warm:
+            self._render_dashboard()
+        self.assertLess(len(warm), 6)
+
+    def test_writes_invalidate_the_cached_metrics(self):
+        self.assertEqual(DashboardMetrics().get()['total_customers'], 0)
+        Customer.objects.create(full_name='New Customer', phone='55501111')
+        self.assertEqual(DashboardMetrics().get()['total_customers'], 1)
+
+        self.assertEqual(DashboardMetrics().get()['total_inventory_value'], Decimal('240.00'))
+        self.product.stock = 0
+        self.product.save()
+        self.assertEqual(DashboardMetrics().get()['total_inventory_value'], 0)
+
+    def test_revenue_series_fills_gaps_and_compares_periods(self):
+        for number, day, total in (
+            ('2025020102', date(2025, 2, 3), '100.00'),
+            ('2025020103', date(2025, 2, 3), '50.00'),
+            ('2025020104', date(2025, 2, 5), '30.00'),
+            ('2025020105', date(2025, 1, 30), '90.00'),
+        ):
+            invoice = Invoice.objects.create(invoice_number=number, due_date=day)
+            Invoice.objects.filter(pk=invoice.pk).update(status='paid', date=day, grand_total=Decimal(total))
+
+        with self.assertNumQueries(1):
+            series = revenue_series(date(2025, 2, 2), date(2025, 2, 6))
+        self.assertEqual(
+            [(point['date'].day, point['revenue'], point['invoices']) for point in series['current']],
+            [(2, 0, 0), (3, Decimal('150.00'), 2), (4, 0, 0), (5, Decimal('30.00'), 1), (6, 0, 0)],
+        )
+        self.assertEqual([point['date'] for point in series['previous']][0], date(2025, 1, 28))
+        self.assertEqual(series['totals']['previous'], Decimal('90.00'))
+        self.assertEqual(series['totals']['change'], 100.0)
+
+        weekly = revenue_series(date(2025, 2, 1), date(2025, 2, 14), 'week')
+        self.assertEqual(
+            [point['date'] for point in weekly['current']], [date(2025, 1, 27), date(2025, 2, 3), date(2025, 2, 10)],
+        )
+        self.assertEqual([point['revenue'] for point in weekly['current']], [0, Decimal('180.00'), 0])
+
+    def test_analytics_api_defaults_to_the_last_30_days(self):
+        request = RequestFactory().get('/api/analytics/')
+        request.user = self.user
+        trend = json.loads(views.analytics_api(request).content)['revenue_trend']
+        today = timezone.now().date()
+        self.assertEqual(len(trend), 30)
+        self.assertEqual((trend[0]['date'], trend[-1]['date']), (f'{today - timedelta(days=29)}', f'{today}'))
+
+    def test_analytics_api_answers_polls_with_not_modified(self):
+        request = RequestFactory().get('/api/analytics/', {'period': 'quarter'})
+        request.user = self.user
+        response = views.analytics_api(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['bucket'], 'week')
+
+        request = RequestFactory().get('/api/analytics/', {'period': 'quarter'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        request.user = self.user
+        self.assertEqual(views.analytics_api(request).status_code, 304)
+
+        Invoice.objects.create(invoice_number='2025020106', due_date=date(2025, 2, 1))
+        self.assertEqual(views.analytics_api(request).status_code, 200)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['portal.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_tiles_are_cached_on_their_own(self):
+        metrics = DashboardMetrics()
+        with self.assertNumQueries(1):
+            self.assertEqual(metrics.tile('inventory')['active_products'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            tiles = metrics.tiles(list(TILES))
+        # Only the four tiles not cached yet hit the database, and the
+        # categories reuse the valuation rows read for the inventory tile
+        self.assertEqual(len(queries), 5)
+        self.assertEqual(tiles['revenue']['pending_invoices'], 1)
+        self.assertEqual([product.name for product in tiles['high_value_products']['high_value_products']], ['Disk'])
+        with self.assertNumQueries(0):
+            metrics.tiles(list(TILES))
+
+
+class DashboardTileConcurrencyTests(TransactionTestCase):
+    def test_tiles_are_computed_on_a_thread_pool(self):
+        cache.clear()
+        create_product('Storage', 'DSK-1', name='Disk', cost_price=Decimal('40.00'), unit_price=Decimal('60.00'), stock=4)
+        Customer.objects.create(full_name='Tile Customer', phone='55502222')
+
+        threads = set()
+        compute_tile = DashboardMetrics.compute_tile
+
+        def record_thread(metrics, name):
+            threads.add(threading.get_ident())
+            return compute_tile(metrics, name)
+
+        with mock.patch.object(DashboardMetrics, 'compute_tile', record_thread):
+            tiles = DashboardMetrics().tiles(list(TILES), workers=3)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(tiles['revenue']['total_customers'], 1)
+        self.assertEqual(tiles['inventory']['potential_profit'], Decimal('80.00'))
+        self.assertEqual(tiles['categories']['products_by_category'][0]['category__name'], 'Storage')
+
+
+class InventoryValuationTests(TestCase):
+    def setUp(self):
+        self.storage = Category.objects.create(name='Storage')
+        self.network = Category.objects.create(name='Networking')
+
+    def _product(self, sku, stock, category=None, **extra):
+        return create_product(
+            category or self.storage, sku, stock=stock, unit_price=Decimal('15.00'), warranty_period=0, **extra,
+        )
+
+    def _counters(self, category=None):
+        rows = InventoryValuation.objects.filter(category=category, category__isnull=category is None)
+        return rows.values('product_count', 'active_count', 'stock_units', 'cost_value', 'selling_value').get()
+
+    def test_counters_follow_product_changes(self):
+        disk = self._product('DSK-1', 4)
+        self._product('DSK-2', 2, is_active=False)
+        switch = self._product('SW-1', 1, category=self.network)
+        self.assertEqual(self._counters(), {
+            'product_count': 3, 'active_count': 2, 'stock_units': 5,
+            'cost_value': Decimal('50.00'), 'selling_value': Decimal('75.00'),
+        })
+
+        disk.stock = 10
+        disk.unit_price = Decimal('20.00')
+        disk.save()
+        switch.category = self.storage
+        switch.save()
+        self.assertEqual(self._counters(self.storage)['selling_value'], Decimal('215.00'))
+        self.assertEqual(self._counters(self.network)['product_count'], 0)
+
+        disk.is_active = False
+        disk.save()
+        switch.delete()
+        self.assertEqual(self._counters()['active_count'], 0)
+        self.assertEqual(self._counters()['cost_value'], 0)
+        self.assertEqual(reconcile_valuation(fix=False), [])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(DashboardMetrics().product_figures()['active_products'], 0)
+
+    def test_receiving_purchase_items_moves_the_counters(self):
+        disk = self._product('DSK-1', 4)
+        supplier = Supplier.objects.create(name='Parts Co', phone='55500000')
+        order = PurchaseOrder.objects.create(
+            supplier=supplier, order_date=date(2025, 2, 1), delivery_date=date(2025, 2, 3),
+            reference='PO-VAL-1', status='received',
+        )
+        PurchaseItem.objects.create(purchase_order=order, product=disk, quantity=6, unit_cost=Decimal('12.00'))
+
+        disk.refresh_from_db()
+        self.assertEqual((disk.stock, disk.cost_price), (10, Decimal('12.00')))
+        self.assertEqual(self._counters()['cost_value'], Decimal('120.00'))
+        self.assertEqual(reconcile_valuation(fix=False), [])
+
+    def test_verify_command_fixes_bulk_changes(self):
+        disk = self._product('DSK-1', 4)
+        Product.objects.filter(pk=disk.pk).update(stock=8)
+
+        out = StringIO()
+        call_command('verify_inventory_valuation', stdout=out)
+        self.assertIn('Drifting values: 8 in 2 row(s)', out.getvalue())
+        self.assertEqual(self._counters()['stock_units'], 4)
+
+        call_command('verify_inventory_valuation', fix=True, stdout=StringIO())
+        self.assertEqual(self._counters()['stock_units'], 8)
+        self.assertEqual(reconcile_valuation(fix=False), [])
+
+
+class ReportEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product('Networking', 'RT-1', name='Router')
+        self.category = self.product.category
+        for day, quantity in ((date(2025, 1, 30), 1), (date(2025, 2, 3), 2), (date(2025, 2, 20), 4)):
+            DailySalesFact.objects.create(
+                date=day, product=self.product, category=self.category, payment_mode='cash', lines=1,
+                quantity=quantity, revenue=Decimal('25.00') * quantity, cost=Decimal('10.00') * quantity,
+            )
+            invoice = Invoice.objects.create(invoice_number=f'{day:%Y%m%d}01', due_date=day)
+            Invoice.objects.filter(pk=invoice.pk).update(
+                status='paid', date=day, grand_total=Decimal('25.00') * quantity,
+            )
+
+    def test_report_respects_filters_and_is_cached(self):
+        engine = ReportEngine({'date_from': '2025-02-01', 'date_to': '2025-02-28'})
+        # No customer has paid invoices yet, so the dropdown needs no second query
+        with self.assertNumQueries(7):
+            report = engine.run()
+        self.assertFalse(report['cached'])
+        self.assertEqual(set(report['timings']), {
+            'invoice_summary', 'po_summary', 'status_breakdown', 'categories', 'top_products', 'daily', 'customers',
+        })
+        self.assertEqual(report['invoice_totals'], {'count': 2, 'total_amount': Decimal('150.00')})
+        self.assertEqual((report['total_revenue'], report['total_cost_value']), (Decimal('150.00'), Decimal('60.00')))
+        self.assertEqual([row['date'] for row in report['daily_profit_breakdown']], [date(2025, 2, 3), date(2025, 2, 20)])
+        self.assertEqual(len(report['monthly_profit_breakdown']), 1)
+        self.assertEqual(report['monthly_profit_breakdown'][0]['gross_profit'], Decimal('90.00'))
+        self.assertEqual(report['top_products'][0]['total_qty'], 6)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(ReportEngine({'date_from': '2025-02-01', 'date_to': '2025-02-28'}).run()['cached'])
+
+        Customer.objects.create(full_name='New Customer', phone='55503333')
+        self.assertFalse(ReportEngine({'date_from': '2025-02-01', 'date_to': '2025-02-28'}).run()['cached'])
+
+    def test_non_paid_status_has_no_sales(self):
+        report = ReportEngine(parse_report_filters({'status': 'draft', 'date_from': 'not-a-date'})).run()
+        self.assertEqual(report['invoice_totals']['count'], 0)
+        self.assertEqual(report['daily_profit_breakdown'], [])
+        self.assertEqual(report['total_cost_value'], 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_superuser('exporter', 'exporter@example.com', 'pw')
+        self.customer = Customer.objects.create(full_name='Export Customer', phone='55504444')
+
+    def _invoices(self, count, start=0):
+        for number in range(start, start + count):
+            Invoice.objects.create(invoice_number=f'EXP{number:04d}', customer=self.customer, due_date=date(2025, 3, 1))
+
+    def _export(self, **params):
+        request = self.factory.get('/reports/export/', params)
+        request.user = self.user
+        return views.export_reports(request)
+
+    def test_csv_streams_in_constant_queries(self):
+        self._invoices(3)
+        with self.assertNumQueries(1):
+            response = self._export(export='invoices')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="invoices_export_', response['Content-Disposition'])
+        self.assertEqual(lines[0].split(',')[:2], ['Invoice Number', 'Customer'])
+        self.assertEqual(len(lines), 4)
+        self.assertIn('Export Customer', lines[1])
+
+        # More rows, more chunks, same single query
+        self._invoices(20, start=3)
+        with self.assertNumQueries(1):
+            rows = list(export_rows('invoices', {}, chunk_size=5))
+        self.assertEqual(len(rows), 24)
+
+    def test_unknown_export_is_not_found(self):
+        with self.assertRaises(Http404):
+            self._export(export='payroll')
+
+    def test_purchase_orders_and_payments_export(self):
+        supplier = Supplier.objects.create(name='Export Supplier', phone='55505555')
+        order = PurchaseOrder.objects.create(
+            supplier=supplier, order_date=date(2025, 3, 1), delivery_date=date(2025, 3, 5), reference='PO-EXP-1',
+        )
+        PurchasePayment.objects.create(purchase_order=order, amount=Decimal('40.00'), payment_date=date(2025, 3, 2))
+        orders = list(export_rows('purchase_orders', {}))
+        payments = list(export_rows('payments', parse_report_filters({'date_from': '2025-03-01'})))
+        self.assertEqual(orders[1][1], 'Export Supplier')
+        self.assertEqual(payments[1][2], 'Export Supplier')
+        self.assertEqual(payments[1][3], Decimal('40.00'))
+        self.assertEqual(list(export_rows('payments', {'date_from': '2025-03-03'}))[1:], [])
+
+    @mock.patch('portal.report_jobs.XLSX_AVAILABLE', False)
+    def test_xlsx_without_xlsxwriter_is_rejected(self):
+        response = self._export(export='invoices', format='xlsx')
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(XLSX_AVAILABLE, 'XlsxWriter is not installed')
+    @override_settings(ROOT_URLCONF='trendzportal.urls')
+    def test_xlsx_export_runs_as_a_job(self):
+        self._invoices(2)
+        response = self._export(export='invoices', format='xlsx')
+        self.assertEqual(response.status_code, 202)
+        job = ReportJob.objects.get(pk=json.loads(response.content)['job']['id'])
+        self.assertEqual(job.params['format'], 'xlsx')
+
+    @skipUnless(XLSX_AVAILABLE, 'XlsxWriter is not installed')
+    def test_write_xlsx_writes_a_workbook(self):
+        self._invoices(2)
+        handle, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        self.assertEqual(write_xlsx(export_rows('invoices', {}), path), 2)
+        with zipfile.ZipFile(path) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('Invoice Number', sheet)
+        self.assertIn('Export Customer', sheet)
+        self.assertIn('EXP0001', sheet)
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_superuser('jobs', 'jobs@example.com', 'pw')
+        customer = Customer.objects.create(full_name='Job Customer', phone='55506666')
+        for number in range(3):
+            Invoice.objects.create(invoice_number=f'JOB{number}', customer=customer, due_date=date(2025, 3, 1))
+
+    def test_identical_requests_share_a_job(self):
+        params = job_params('export', {'export': 'invoices', 'date_from': '2025-01-01'})
+        job, created = submit_report_job('export', params, user=self.user)
+        self.assertTrue(created)
+        self.assertEqual(submit_report_job('export', dict(params), user=self.user), (job, False))
+
+        run_pending_jobs()
+        # Finished results are reused until the data changes
+        self.assertEqual(submit_report_job('export', params)[0], job)
+        Customer.objects.create(full_name='Another Customer', phone='55507777')
+        self.assertNotEqual(submit_report_job('export', params)[0], job)
+
+    def test_losing_a_submit_race_looks_the_job_up_again(self):
+        params = job_params('export', {'export': 'invoices'})
+        create = ReportJob.all_objects.create
+
+        def race(status):
+            """The competing job was queued first and has already left the active statuses"""
+            races = []
+
+            def create_or_conflict(**fields):
+                if races:
+                    return create(**fields)
+                races.append(create(**fields, status=status, expires_at=timezone.now() + timedelta(hours=1)))
+                raise IntegrityError('unique_active_report_job')
+            return create_or_conflict
+
+        # Without the savepoint the competitor's row survives the conflict, as if committed elsewhere
+        with mock.patch('portal.report_jobs.transaction', mock.Mock(atomic=contextlib.nullcontext)):
+            with mock.patch.object(ReportJob.all_objects, 'create', side_effect=race('done')):
+                job, created = submit_report_job('export', params)
+            self.assertEqual((job.status, created), ('done', False))
+
+            ReportJob.objects.all().delete()
+            with mock.patch.object(ReportJob.all_objects, 'create', side_effect=race('failed')):
+                job, created = submit_report_job('export', params)
+            self.assertEqual((job.status, created), ('queued', True))
+
+    def test_worker_writes_result_and_progress(self):
+        job, _ = submit_report_job('export', job_params('export', {'export': 'invoices'}))
+        self.assertEqual(run_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.rows_done, job.rows_total), ('done', 100, 3, 3))
+        with job.result.open('r') as result:
+            lines = result.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('Invoice Number,Customer'))
+
+        report, _ = submit_report_job('report', job_params('report', {'report_type': 'invoice'}))
+        run_pending_jobs()
+        report.refresh_from_db()
+        with report.result.open('r') as result:
+            self.assertEqual(json.load(result)['report']['invoice_totals']['count'], 3)
+
+    def test_expired_and_stalled_jobs(self):
+        job, _ = submit_report_job('export', job_params('export', {'export': 'invoices'}))
+        run_pending_jobs()
+        job.refresh_from_db()
+        path = job.result.path
+        self.assertTrue(os.path.exists(path))
+
+        stalled, _ = submit_report_job('export', job_params('export', {'export': 'payments'}))
+        alive, _ = submit_report_job('export', job_params('export', {'export': 'purchase_orders'}))
+        started = timezone.now() - timedelta(days=1)
+        ReportJob.objects.filter(pk=stalled.pk).update(status='running', started_at=started, heartbeat_at=started)
+        # A long job is only stalled once its worker stops reporting progress
+        ReportJob.objects.filter(pk=alive.pk).update(status='running', started_at=started, heartbeat_at=timezone.now())
+
+        self.assertEqual(expire_report_jobs(), 0)
+        stalled.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((stalled.status, alive.status), ('failed', 'running'))
+
+        ReportJob.objects.filter(pk=alive.pk).delete()
+        self.assertEqual(expire_report_jobs(now=timezone.now() + timedelta(days=2)), 2)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_late_worker_keeps_the_stalled_verdict(self):
+        job, _ = submit_report_job('export', job_params('export', {'export': 'invoices'}))
+
+        def fail_midway(job, rows_done):
+            ReportJob.all_objects.filter(pk=job.pk).update(status='failed', error='Worker stopped responding')
+
+        with mock.patch('portal.report_jobs._save_progress', fail_midway):
+            run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'Worker stopped responding'))
+        self.assertFalse(job.result)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'report_jobs')), [])
+
+    @override_settings(ROOT_URLCONF='trendzportal.urls')
+    def test_job_endpoints(self):
+        factory = RequestFactory()
+        request = factory.post('/reports/jobs/', {'kind': 'export', 'export': 'purchase_orders'})
+        request.user = self.user
+        response = views.report_job_submit(request)
+        self.assertEqual(response.status_code, 202)
+        job_id = json.loads(response.content)['job']['id']
+
+        request = factory.post('/reports/jobs/', {'kind': 'export', 'export': 'payroll'})
+        request.user = self.user
+        self.assertEqual(views.report_job_submit(request).status_code, 400)
+
+        run_pending_jobs()
+        request = factory.get(f'/reports/jobs/{job_id}/')
+        request.user = self.user
+        job = json.loads(views.report_job_status(request, job_id).content)['job']
+        self.assertEqual(job['status'], 'done')
+        self.assertTrue(job['download_url'])
+        response = views.report_job_download(request, job_id)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PO Reference,Supplier'))
+        # Not response.close(): it would fire request_finished and close the test connection
+        response.file_to_stream.close()
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        # Several invoices share a date, so the id breaks the ties
+        for number, day in enumerate([date(2025, 1, 1)] * 3 + [date(2025, 1, 2)] * 2 + [date(2025, 1, 3)] * 2):
+            invoice = Invoice.objects.create(invoice_number=f'KEY{number}', due_date=day)
+            Invoice.objects.filter(pk=invoice.pk).update(date=day)
+        self.expected = list(Invoice.objects.order_by('-date', '-id').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(Invoice.objects.all(), 3, ('-date', '-id'))
+
+    def _ids(self, page):
+        return [invoice.pk for invoice in page]
+
+    def test_pages_forward_and_back(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            with self.assertNumQueries(1):
+                pages.append(self.paginator.page(pages[-1].next_cursor))
+        self.assertEqual([pk for page in pages for pk in self._ids(page)], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous())
+
+        with self.assertNumQueries(1):
+            back = self.paginator.page(pages[2].previous_cursor)
+        self.assertEqual(self._ids(back), self._ids(pages[1]))
+        first = self.paginator.page(back.previous_cursor)
+        self.assertEqual(self._ids(first), self.expected[:3])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_last_page_and_invalid_cursors(self):
+        last = self.paginator.page(self.paginator.page().last_cursor)
+        self.assertEqual(self._ids(last), self.expected[-3:])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+        for cursor in ('not-a-cursor', self.paginator.encode_cursor('next', ['nope', 1]),
+                       self.paginator.encode_cursor('sideways', None)):
+            with self.assertRaises(InvalidCursor):
+                self.paginator.page(cursor)
+        self.assertEqual(self.paginator.count, 7)
+
+    def test_list_view_keeps_filters_in_page_links(self):
+        request = RequestFactory().get('/invoices/', {'date_from': '2025-01-01', 'cursor': '', 'date_to': '2025-01-31'})
+        request.user = User.objects.create_superuser('pager', 'pager@example.com', 'pw')
+        view = views.InvoiceListView()
+        view.setup(request)
+        view.object_list = view.get_queryset()
+        Invoice.objects.filter(invoice_number__in=['KEY0', 'KEY1']).update(status='paid', grand_total=Decimal('10.00'))
+        # One query for the page and one for all the summary figures
+        with self.assertNumQueries(2):
+            context = view.get_context_data()
+        self.assertEqual(len(context['page_obj']), 7)
+        self.assertEqual((context['total_invoices'], context['paid_invoices']), (7, 2))
+        self.assertEqual((context['paid_amount'], context['pending_amount']), (Decimal('20.00'), 0))
+        self.assertFalse(context['is_paginated'])
+        self.assertEqual(context['pagination_query'], 'date_from=2025-01-01&date_to=2025-01-31')
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Networking')
+        self.router = self._product('Wireless Router', 'NET-100', name_ar='راوتر لاسلكي', description='Dual band router')
+        self.switch = self._product('Gigabit Switch', 'NET-200', description='Switch for router uplinks', barcode='6281000000017')
+        self._product('Desk Lamp', 'LMP-1', name_ar='مصباح مكتب', description='LED lamp', category=Category.objects.create(name='Home'))
+
+    def _product(self, name, sku, category=None, **fields):
+        return create_product(category or self.category, sku, name=name, unit_price=Decimal('20.00'), **fields)
+
+    def _names(self, query, queryset=None):
+        return [product.name for product in search_products(query, queryset)]
+
+    def test_normalization_folds_arabic_variants(self):
+        self.assertEqual(normalize_search_text('أَحْمَـــر إبريق مدرسة على ١٢٣'), 'احمر ابريق مدرسه علي 123')
+        self.assertEqual(normalize_search_text('Café  RT-1'), 'cafe rt 1')
+        self.assertEqual(normalize_search_text(None), '')
+
+    def test_ranked_matches(self):
+        # Prefix matches on any field; the product that names it ranks higher
+        self.assertEqual(self._names('rout'), ['Wireless Router', 'Gigabit Switch'])
+        self.assertEqual(self._names('wireless router'), ['Wireless Router'])
+        # Exact codes rank first
+        self.assertEqual(self._names('NET-200')[0], 'Gigabit Switch')
+        self.assertEqual(self._names('6281000000017'), ['Gigabit Switch'])
+        self.assertEqual(self._names('networking'), ['Gigabit Switch', 'Wireless Router'])
+        self.assertEqual(self._names('!!'), [])
+        self.assertEqual(self._names('router', Product.objects.filter(stock=0)), [])
+
+    def test_arabic_queries_and_document_maintenance(self):
+        self.assertEqual(self._names('رَاوتر'), ['Wireless Router'])
+        self.assertEqual(self._names('مصباح'), ['Desk Lamp'])
+
+        self.router.name_ar = 'موجه إنترنت'
+        self.router.save()
+        self.assertEqual(self._names('انترنت'), ['Wireless Router'])
+        self.assertEqual(self._names('راوتر'), [])
+
+        self.category.name = 'Connectivity'
+        self.category.save()
+        self.assertEqual(len(self._names('connectivity')), 2)
+
+        Product.objects.filter(pk=self.switch.pk).update(name='Managed Switch')
+        self.assertEqual(self._names('managed'), [])
+        self.assertEqual(rebuild_search_documents(), 3)
+        self.assertEqual(self._names('managed'), ['Managed Switch'])
+
+    def test_assigned_barcodes_are_searchable(self):
+        products = BarcodeGenerator.assign_barcodes(Product.objects.filter(pk=self.router.pk))
+        self.assertEqual(self._names(products[0].barcode), ['Wireless Router'])
+
+    def test_search_endpoint_uses_ranked_search(self):
+        request = RequestFactory().get('/ajax/product-search/', {'q': 'router'})
+        response = ajax_views.product_search_public(request)
+        names = [product['name'] for product in json.loads(response.content)['products']]
+        self.assertEqual(names, ['Wireless Router', 'Gigabit Switch'])
+
+
+class BarcodeIndexTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'barcodes.bin')
+        settings_override = override_settings(BARCODE_INDEX_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        cache.clear()
+        self.category = Category.objects.create(name='Scanners')
+        self.products = [
+            create_product(
+                self.category, f'SKU-{number}', name=f'Item {number}', barcode=f'62810000{number:05d}',
+                cost_price=Decimal('1.00'), unit_price=Decimal('2.00'), stock=number % 3, warranty_period=0,
+            )
+            for number in range(1, 41)
+        ]
+        self.assertTrue(needs_rebuild())
+        build_barcode_index()
+
+    def test_binary_search_over_both_fields(self):
+        index = get_index()
+        self.assertEqual(len(index), 80)
+        for product in self.products:
+            self.assertEqual(index.lookup(product.barcode), product.pk)
+            self.assertEqual(index.lookup(product.sku, 'sku'), product.pk)
+        self.assertIsNone(index.lookup('SKU-1'))
+        self.assertIsNone(index.lookup('0000000000000'))
+        self.assertIsNone(index.lookup('62810000000405'))
+
+    def test_misses_skip_the_database(self):
+        with self.assertNumQueries(0):
+            with self.assertRaises(Product.DoesNotExist):
+                get_by_code(Product.objects.all(), '9999999999999')
+        with self.assertNumQueries(1):
+            self.assertEqual(get_by_code(Product.objects.all(), 'SKU-7', 'sku'), self.products[6])
+        # The row is still checked against the filters
+        with self.assertRaises(Product.DoesNotExist):
+            get_by_code(Product.objects.filter(stock__gt=0), self.products[2].barcode)
+
+    def test_changes_are_served_until_the_next_build(self):
+        index = get_index()
+        product = self.products[0]
+        # Saves that leave the codes alone keep the index current
+        product.stock = 9
+        product.save()
+        self.assertFalse(needs_rebuild())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.barcode = '6299999999999'
+            product.save(update_fields=['barcode'])
+        # The save only flags the index; the file is rebuilt outside the request
+        self.assertEqual(get_index().stamp, index.stamp)
+        self.assertTrue(needs_rebuild())
+        # Misses go to the database while the index is stale; old codes are never returned
+        self.assertEqual(get_by_code(Product.objects.all(), '6299999999999'), product)
+        with self.assertRaises(Product.DoesNotExist):
+            get_by_code(Product.objects.all(), '6281000000001')
+
+        build_barcode_index()
+        fresh = get_index()
+        self.assertGreater(fresh.stamp, index.stamp)
+        self.assertEqual(fresh.lookup('6299999999999'), product.pk)
+        self.assertIsNone(fresh.lookup('6281000000001'))
+        # The old map stays readable for lookups that still hold it
+        self.assertEqual(index.lookup('6281000000001'), product.pk)
+        with self.assertNumQueries(0):
+            with self.assertRaises(Product.DoesNotExist):
+                get_by_code(Product.objects.all(), '6281000000001')
+
+    def test_assigned_barcodes_are_found_before_the_rebuild(self):
+        product = self.products[0]
+        product.barcode = None
+        product.save()
+        build_barcode_index()
+        BarcodeGenerator.assign_barcodes([product])
+        self.assertEqual(get_by_code(Product.objects.all(), product.barcode), product)
+
+        stdout = StringIO()
+        call_command('rebuild_barcode_index', stdout=stdout)
+        self.assertIn('80 codes indexed', stdout.getvalue())
+        self.assertFalse(needs_rebuild())
+
+    def test_bulk_changes_need_a_rebuild(self):
+        Product.objects.filter(pk=self.products[0].pk).update(barcode='6200000000000')
+        # A stale entry is never returned under its old code
+        with self.assertRaises(Product.DoesNotExist):
+            get_by_code(Product.objects.all(), '6281000000001')
+        stdout = StringIO()
+        call_command('rebuild_barcode_index', stdout=stdout)
+        self.assertIn('80 codes indexed', stdout.getvalue())
+        self.assertEqual(get_by_code(Product.objects.all(), '6200000000000'), self.products[0])
+
+    def test_without_an_index_lookups_query_the_database(self):
+        with override_settings(BARCODE_INDEX_PATH=None):
+            self.assertIsNone(get_index())
+            with self.assertNumQueries(1):
+                self.assertEqual(get_by_code(Product.objects.all(), 'SKU-3', 'sku'), self.products[2])
+        os.remove(self.path)
+        self.assertIsNone(get_index())
+
+    def test_lookup_endpoints(self):
+        product = self.products[0]
+        response = ajax_views.product_barcode_lookup_public(
+            RequestFactory().get('/ajax/barcode-lookup/', {'barcode': product.barcode})
+        )
+        self.assertEqual(json.loads(response.content)['product']['id'], product.pk)
+        response = ajax_views.product_barcode_lookup_public(
+            RequestFactory().get('/ajax/barcode-lookup/', {'barcode': self.products[2].barcode})
+        )
+        self.assertEqual(response.status_code, 404)
+
+        request = RequestFactory().post('/api/barcode-scan/', {'barcode': '9999999999999'})
+        request.user = User.objects.create_superuser('scanner', 'scanner@example.com', 'pass')
+        with self.assertNumQueries(0):
+            response = views.barcode_scan(request)
+        self.assertEqual(response.status_code, 404)
+
+
+class BarcodeScanBatchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Cables', icon='fa-hdd')
+        self.products = [
+            create_product(
+                category, f'CBL-{number}', name=f'Cable {number}', barcode=f'628200000000{number}',
+                cost_price=Decimal('4.00'), unit_price=Decimal('5.00'), stock=number * 6, warranty_period=0,
+            )
+            for number in range(1, 4)
+        ]
+        self.user = User.objects.create_user('handheld', password='pass')
+
+    def _post(self, payload):
+        request = RequestFactory().post(
+            '/api/barcode-scan/batch/', json.dumps(payload), content_type='application/json'
+        )
+        request.user = self.user
+        return views.barcode_scan_batch(request)
+
+    def test_batch_matches_single_scans(self):
+        codes = [product.barcode for product in self.products]
+        scans = [
+            {'barcode': codes[0], 'quantity': 2}, {'barcode': '0000'}, {'barcode': codes[2]},
+            {'barcode': codes[0], 'quantity': 1},
+        ]
+        with self.assertNumQueries(1):
+            response = self._post({'scans': scans})
+        data = json.loads(response.content)
+        self.assertEqual((data['found'], data['not_found']), (3, 1))
+        self.assertEqual([result['quantity'] for result in data['results']], [2, 1, 1, 1])
+        self.assertEqual(data['results'][1], {
+            'success': False, 'quantity': 1, 'error': 'Product not found', 'barcode': '0000',
+            'suggestions': 'Please check the barcode number or add this product to inventory',
+        })
+
+        request = RequestFactory().post('/api/barcode-scan/', {'barcode': codes[2]})
+        request.user = self.user
+        single = json.loads(views.barcode_scan(request).content)
+        self.assertEqual(single['product'], data['results'][2]['product'])
+        self.assertEqual(single['product']['selling_price'], '5.00')
+        self.assertEqual(single['product']['stock_status'], 'In Stock')
+
+        data = json.loads(self._post({'barcodes': codes[:2]}).content)
+        self.assertEqual([result['product']['sku'] for result in data['results']], ['CBL-1', 'CBL-2'])
+
+    def test_invalid_batches(self):
+        for payload in ({}, {'scans': []}, {'scans': [{'barcode': ' '}]}, {'scans': [{'barcode': '1', 'quantity': 0}]},
+                        {'barcodes': ['1'] * 501}, ['1']):
+            self.assertEqual(self._post(payload).status_code, 400, payload)
+
+
+class CustomerTypeaheadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ahmed = Customer.objects.create(full_name='Ahmed Al-Kuwari', phone='+974 5555-1234')
+        self.fatima = Customer.objects.create(full_name='فاطمة أحمد', phone='٥٥٥٦٧٨٩٠', company_name='Pearl Trading')
+        Customer.bulk_create_with_ids([
+            Customer(full_name=f'Customer {number:03d}', phone=f'3000{number:04d}') for number in range(30)
+        ])
+        self.other_site = Site.objects.create(domain='other.example.com', name='Other')
+        Customer.all_objects.create(site=self.other_site, full_name='Ahmed Elsewhere', phone='55550000')
+
+    def _names(self, query):
+        return [customer['display_text'] for customer in search_customers(query)]
+
+    def test_normalized_columns(self):
+        self.assertEqual(
+            (self.ahmed.search_name, self.ahmed.search_company, self.ahmed.search_phone),
+            ('ahmed al kuwari', '', '97455551234'),
+        )
+        self.assertEqual((self.fatima.search_name, self.fatima.search_phone), ('فاطمه احمد', '55567890'))
+        self.assertEqual(Customer.objects.get(full_name='Customer 007').search_phone, '30000007')
+
+        self.ahmed.full_name = 'Ahmad Kuwari'
+        self.ahmed.save(update_fields=['full_name'])
+        self.assertEqual(Customer.objects.get(pk=self.ahmed.pk).search_name, 'ahmad kuwari')
+
+    def test_prefix_matches(self):
+        self.assertEqual(self._names('AHMED al'), ['Ahmed Al-Kuwari'])
+        self.assertEqual(self._names('فاطمة'), ['Pearl Trading'])
+        self.assertEqual(self._names('pearl'), ['Pearl Trading'])
+        self.assertEqual(self._names('+974 5555'), ['Ahmed Al-Kuwari'])
+        self.assertEqual(self._names('٥٥٥٦'), ['Pearl Trading'])
+        self.assertEqual(self._names(self.ahmed.customer_id.lower()), ['Ahmed Al-Kuwari'])
+        # Prefixes only, and ten results in name order
+        self.assertEqual(self._names('kuwari'), [])
+        self.assertEqual(self._names('customer'), [f'Customer {number:03d}' for number in range(10)])
+        self.assertEqual(self._names('  '), [])
+
+    def test_results_are_cached_until_a_customer_changes(self):
+        self.assertEqual(self._names('ahm'), ['Ahmed Al-Kuwari'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self._names('ahm'), ['Ahmed Al-Kuwari'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(full_name='Ahmad Saleh', phone='1')
+        self.assertEqual(self._names('ahm'), ['Ahmad Saleh', 'Ahmed Al-Kuwari'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ahmed.delete()
+        self.assertEqual(self._names('ahm'), ['Ahmad Saleh'])
+
+    def test_endpoint(self):
+        request = RequestFactory().get('/ajax/customer-search/', {'q': 'pearl'})
+        request.user = User.objects.create_user('clerk', password='pass')
+        customers = json.loads(views.customer_search(request).content)['customers']
+        self.assertEqual(customers, [{
+            'id': self.fatima.pk, 'display_text': 'Pearl Trading', 'phone': '٥٥٥٦٧٨٩٠', 'tax_number': None,
+            'address': None,
+        }])
+
+
+class ImportInvoicesCommandTests(TestCase):
+    csv_rows = (
+        'ref,date,status,customer_name,customer_phone,tax,discount_type,discount_value,sku,quantity,unit_price\n'
+        'POS-1,2024-03-02,paid,Ali,55501234,0,amount,5,IMP-A,2,10.00\n'
+        'POS-1,,,,,,,,IMP-B,1,\n'
+        'POS-2,2024-03-02,draft,,,0,amount,0,IMP-A,1,12.50\n'
+        'POS-3,2024-04-10,paid,Ali,55501234,0,percent,10,IMP-B,3,\n'
+        'POS-4,2024-04-10,paid,,,0,amount,0,MISSING,1,1.00\n'
+    )
+
+    def setUp(self):
+        for sku, price in (('IMP-A', '10.00'), ('IMP-B', '20.00')):
+            create_product(
+                'Accessories', sku, cost_price=Decimal('4.00'), unit_price=Decimal(price), stock=0, warranty_period=0,
+            )
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as csv_file:
+            csv_file.write(self.csv_rows)
+        self.addCleanup(os.remove, self.path)
+
+    def test_import_builds_invoices_and_ledger(self):
+        call_command('import_invoices', self.path, batch_size=2, stdout=StringIO(), stderr=StringIO())
+
+        invoices = {invoice.notes.rsplit(' ', 1)[-1]: invoice for invoice in Invoice.objects.all()}
+        self.assertEqual(set(invoices), {'POS-1', 'POS-2', 'POS-3'})
+        first = invoices['POS-1']
+        self.assertEqual(first.date, date(2024, 3, 2))
+        self.assertEqual(first.invoice_number, '2024030201')
+        self.assertEqual(invoices['POS-2'].invoice_number, '2024030202')
+        self.assertEqual(first.subtotal, Decimal('40.00'))
+        self.assertEqual(first.grand_total, Decimal('35.00'))
+        self.assertEqual(invoices['POS-3'].grand_total, Decimal('54.00'))
+        self.assertEqual(first.customer_id, invoices['POS-3'].customer_id)
+        self.assertEqual(Customer.objects.filter(phone='55501234').count(), 1)
+
+        # Only the two paid invoices are posted to the ledger
+        self.assertEqual(SoldItem.objects.count(), 3)
+        self.assertEqual(
+            {timezone.localtime(sold.date_sold).date() for sold in SoldItem.objects.filter(invoice=first)},
+            {date(2024, 3, 2)},
+        )
+        self.assertEqual(FinanceTransaction.objects.filter(source_type='invoice').count(), 2)
+        self.assertEqual(InventoryTransaction.objects.filter(type='sale').count(), 3)
+        march = FinancialSummary.objects.get(year=2024, month=3)
+        self.assertEqual(march.total_sales, Decimal('35.00'))
+        self.assertEqual(march.total_invoices, 1)
+
+    def test_dry_run_writes_nothing(self):
+        call_command('import_invoices', self.path, dry_run=True, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_import_into_another_site_leaves_site_id_alone(self):
+        branch = Site.objects.create(domain='branch.example.com', name='Branch')
+        category = Category.all_objects.create(site=branch, name='Accessories')
+        for sku in ('IMP-A', 'IMP-B'):
+            Product.all_objects.filter(sku=sku).update(site=branch, category=category)
+
+        with override_settings(SITE_ID=1):
+            call_command('import_invoices', self.path, site=str(branch.pk), stdout=StringIO(), stderr=StringIO())
+            self.assertEqual(settings.SITE_ID, 1)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertEqual(Invoice.all_objects.filter(site=branch).count(), 3)
+
+
+class ImportCustomersCommandTests(TestCase):
+    def test_import_skips_duplicates(self):
+        Customer.objects.create(full_name='Existing', phone='55500000')
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as csv_file:
+            csv_file.write('full_name,phone,company_name\n')
+            csv_file.write('Existing Again,55500000,\n')
+            for i in range(1, 120):
+                csv_file.write(f'Customer {i},555{i:05d},Acme\n')
+            csv_file.write('Repeat,55500001,\n,55599999,\n')
+        self.addCleanup(os.remove, path)
+
+        call_command('import_customers', path, batch_size=50, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Customer.objects.count(), 120)
+        self.assertEqual(Customer.objects.filter(company_name='Acme').count(), 119)
+        self.assertEqual(Customer.objects.values('customer_id').distinct().count(), 120)
+
+    def test_import_into_another_site_leaves_site_id_alone(self):
+        branch = Site.objects.create(domain='branch.example.com', name='Branch')
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as csv_file:
+            csv_file.write('full_name,phone\nBranch Customer,55512345\n')
+        self.addCleanup(os.remove, path)
+
+        with override_settings(SITE_ID=1):
+            call_command('import_customers', path, site=branch.domain, stdout=StringIO(), stderr=StringIO())
+            self.assertEqual(settings.SITE_ID, 1)
+        self.assertFalse(Customer.objects.exists())
+        self.assertEqual(Customer.all_objects.get(site=branch).full_name, 'Branch Customer')
+
+
+class ReferenceDataTests(TestCase):
+    def setUp(self):
+        reference_data.invalidate()
+
+    def test_lookups_are_memoized_after_commit(self):
+        # Creating the rows is a write that invalidates; the next reads are memoized
+        with self.captureOnCommitCallbacks(execute=True):
+            reference_data.get_system_user()
+            reference_data.get_finance_category('Sales Revenue', 'sale', 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            user = reference_data.get_system_user()
+            category = reference_data.get_finance_category('Sales Revenue', 'sale', 1)
+            site = reference_data.get_site_by_domain(Site.objects.get(pk=1).domain)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(reference_data.get_system_user(), user)
+            self.assertEqual(reference_data.get_finance_category('Sales Revenue', 'sale', 1), category)
+            self.assertEqual(reference_data.get_site_by_domain(site.domain), site)
+
+    def test_writes_invalidate_the_memo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            site = reference_data.get_site(1)
+        Site.objects.filter(pk=1).update(name='Renamed')
+        self.assertEqual(reference_data.get_site(1).name, site.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Site.objects.get(pk=1).save()
+        self.assertEqual(reference_data.get_site(1).name, 'Renamed')
+
+    def test_version_bump_from_another_process_drops_the_memo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reference_data.get_site(1)
+        cache.incr(reference_data.VERSION_KEY)
+        reference_data._state['checked_at'] = 0.0
+        with self.assertNumQueries(1):
+            reference_data.get_site(1)
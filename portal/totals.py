@@ -0,0 +1,145 @@
+"""
+Totals engine for invoices and quotations
+
+A document's subtotal is computed with a single aggregate query over its lines,
+the discount and grand total are derived from that row, and the result is
+written back with one UPDATE so ``save()`` and its signals are not re-run.
+
+Writers call ``schedule_totals`` after touching lines, as often as they like.
+Inside a transaction the work is coalesced (see ``portal.coalescing``) into one
+``on_commit`` callback per connection, so each document is recalculated exactly
+once when the transaction commits, however many item saves happened. Outside a
+transaction it runs at once.
+"""
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.dispatch import Signal
+
+from .coalescing import pending_batch
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+# Calculated columns written by the engine, per document model
+TOTAL_FIELDS = {
+    'invoice': ('subtotal', 'total', 'discount_amount', 'grand_total'),
+    'quotation': ('subtotal', 'tax', 'total'),
+}
+
+# Sent after a recalculation changed a document's stored totals, with
+# ``sender`` (the model), ``pk``, ``previous`` and ``totals`` (field -> value)
+# and ``document`` (the row's site_id, date and status)
+totals_changed = Signal()
+
+DOCUMENT_FIELDS = ('site_id', 'date', 'status')
+
+
+def _quantize(value):
+    return Decimal(value or 0).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _discount(base, discount_type, discount_value):
+    discount_value = Decimal(discount_value or 0)
+    if discount_type == 'percent':
+        return _quantize(base * discount_value / 100)
+    return _quantize(min(discount_value, base))
+
+
+def invoice_totals(subtotal, tax, discount_type, discount_value):
+    """Invoice totals: tax is an amount and the discount applies to subtotal + tax"""
+    subtotal = _quantize(subtotal)
+    total = subtotal + _quantize(tax)
+    discount_amount = _discount(total, discount_type, discount_value)
+    return {
+        'subtotal': subtotal,
+        'total': total,
+        'discount_amount': discount_amount,
+        'grand_total': total - discount_amount,
+    }
+
+
+def quotation_totals(subtotal, tax_rate, discount_type, discount_value):
+    """Quotation totals: tax comes from ``tax_rate`` and the discount applies to the subtotal"""
+    subtotal = _quantize(subtotal)
+    tax = _quantize(subtotal * Decimal(tax_rate or 0) / 100)
+    discount_amount = _discount(subtotal, discount_type, discount_value)
+    return {
+        'subtotal': subtotal,
+        'tax': tax,
+        'total': subtotal + tax - discount_amount,
+    }
+
+
+def _registry():
+    # Imported lazily: models.py calls into this module from its methods
+    from .models import Invoice, Quotation
+    return {
+        Invoice: (('tax', 'discount_type', 'discount_value'), invoice_totals),
+        Quotation: (('tax_rate', 'discount_type', 'discount_value'), quotation_totals),
+    }
+
+
+def recalculate_totals(model, pks, using=None):
+    """
+    Recalculate and store totals for the given documents right away.
+
+    One aggregate query fetches every document's inputs together with the sum of
+    ``quantity * unit_price`` over its lines; each document then gets a single
+    UPDATE. Returns ``{pk: totals}`` for the documents that still exist.
+    """
+    pks = {pk for pk in pks if pk is not None}
+    if not pks:
+        return {}
+
+    input_fields, calculate = _registry()[model]
+    total_fields = TOTAL_FIELDS[model._meta.model_name]
+    using = using or DEFAULT_DB_ALIAS
+    line_total = ExpressionWrapper(
+        F('items__quantity') * F('items__unit_price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    rows = (
+        model.all_objects.using(using)
+        .filter(pk__in=pks)
+        .values('pk', *DOCUMENT_FIELDS, *input_fields, *total_fields)
+        .annotate(line_subtotal=Sum(line_total))
+    )
+
+    results = {}
+    for row in rows:
+        totals = calculate(row['line_subtotal'], *(row[field] for field in input_fields))
+        previous = {field: row[field] for field in total_fields}
+        if previous != totals:
+            model.all_objects.using(using).filter(pk=row['pk']).update(**totals)
+            document = {field: row[field] for field in DOCUMENT_FIELDS}
+            totals_changed.send(sender=model, pk=row['pk'], previous=previous, totals=totals, document=document)
+        results[row['pk']] = totals
+    return results
+
+
+def _recalculate_queued(pks_by_model, using):
+    for model, pks in pks_by_model.items():
+        recalculate_totals(model, pks, using=using)
+    logger.debug(f"Recalculated totals for {sum(len(pks) for pks in pks_by_model.values())} document(s)")
+
+
+def schedule_totals(document, using=None):
+    """Queue ``document`` for a totals recalculation when the current transaction commits"""
+    if document.pk is None:
+        return
+    using = using or document._state.db or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        recalculate_totals(type(document), [document.pk], using=using)
+        return
+
+    pending_batch('totals', _recalculate_queued, using)[type(document)].add(document.pk)
+
+
+def refresh_totals(document):
+    """Reload the calculated totals onto an in-memory document"""
+    document.refresh_from_db(fields=TOTAL_FIELDS[document._meta.model_name])
@@ -0,0 +1,181 @@
+"""
+Customer typeahead for invoice entry
+
+``customer_search`` is called on every keystroke. Matching ``icontains``
+across four columns scans the whole customer table, so customers instead
+carry normalized copies of their name, company name and phone
+(``search_name``, ``search_company``: ``normalize_search_text``;
+``search_phone``: digits only), written by ``Customer.save`` and
+``Customer.bulk_create_with_ids``. A query is normalized the same way and
+matched as a prefix (``LIKE 'abc%'``) of the name, the company name, the
+customer ID or — for queries made of digits and phone separators — the phone.
+Every column has a ``(site_id, column)`` index in byte order (``COLLATE "C"``
+on PostgreSQL), so each match is an index range scan that stops after the
+first rows, however many customers share a short prefix.
+
+Results are cached per site and normalized query. Customer saves and deletions
+bump the site's version counter, which is part of the cache key, so a stale
+list is never served after a change. Like the dashboard counters (see
+``portal.dashboard``) this needs a cache shared by all processes; with a local
+memory cache each process only sees its own customer writes.
+``manage.py benchmark_customer_typeahead`` measures the uncached latency
+against a synthetic customer table.
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.db.models.signals import post_delete, post_save
+
+from .models import Customer
+from .search import normalize_search_text
+
+VERSION_KEY = 'customers:typeahead:version:{site_id}'
+RESULTS_KEY = 'customers:typeahead:{site_id}:{version}:{digest}'
+
+RESULT_LIMIT = 10
+
+# Digits with the usual phone separators, in Latin or Arabic-Indic numerals
+_PHONE_QUERY = re.compile(r'[\d\s+()\-.]+')
+
+
+def _timeout():
+    return getattr(settings, 'CUSTOMER_TYPEAHEAD_TIMEOUT', 300)
+
+
+def phone_digits(phone):
+    """The digits of ``phone`` as ASCII, without separators"""
+    return ''.join(char for char in normalize_search_text(phone) if char.isdigit())
+
+
+def customer_search_fields(customer):
+    """``(search_name, search_company, search_phone)`` of ``customer``"""
+    return (
+        normalize_search_text(customer.full_name)[:200],
+        normalize_search_text(customer.company_name)[:200],
+        phone_digits(customer.phone)[:20],
+    )
+
+
+# =============================================================================
+# SEARCHING
+# =============================================================================
+
+def search_customers(query, site_id=None, limit=RESULT_LIMIT):
+    """
+    Up to ``limit`` customers of ``site_id`` (default: the current site) whose
+    name, company name, customer ID or phone starts with ``query``, as the
+    typeahead's result dicts ordered by the text that matched.
+    """
+    site_id = site_id or settings.SITE_ID
+    query = (query or '').strip()
+    prefix = normalize_search_text(query)
+    digits = phone_digits(query) if _PHONE_QUERY.fullmatch(query) else ''
+    if not prefix and not digits:
+        return []
+
+    digest = hashlib.md5(f'{prefix}|{digits}|{query.upper()}|{limit}'.encode()).hexdigest()
+    key = RESULTS_KEY.format(site_id=site_id, version=typeahead_version(site_id), digest=digest)
+    results = cache.get(key)
+    if results is None:
+        results = match_customers(query, prefix, digits, site_id, limit)
+        cache.set(key, results, _timeout())
+    return results
+
+
+def match_customers(query, prefix, digits, site_id, limit=RESULT_LIMIT):
+    """
+    The uncached lookup behind ``search_customers``: one index range scan per
+    matched column, each stopping after ``limit`` rows, merged by the text
+    that matched.
+    """
+    customers = Customer.all_objects.filter(site_id=site_id)
+    branches = []
+    if prefix:
+        branches += [('search_name', prefix), ('search_company', prefix)]
+    if query.isascii() and query.isalnum():
+        branches.append(('customer_id', query.upper()))
+    if digits:
+        branches.append(('search_phone', digits))
+
+    matches = {}
+    for field, value in branches:
+        for row in _prefix_rows(customers, field, value, limit):
+            if row['id'] not in matches or row['match_key'] < matches[row['id']]['match_key']:
+                matches[row['id']] = row
+    rows = sorted(matches.values(), key=lambda row: (row['match_key'], row['id']))[:limit]
+    return [
+        {
+            'id': row['id'],
+            'display_text': row['company_name'] or row['full_name'],
+            'phone': row['phone'],
+            'tax_number': row['tax_number'],
+            'address': row['address'],
+        }
+        for row in rows
+    ]
+
+
+def _prefix_rows(customers, field, prefix, limit):
+    """
+    The first ``limit`` customers whose ``field`` starts with ``prefix``, in
+    byte order. A range rather than ``LIKE``, which SQLite cannot answer from
+    an index; PostgreSQL compares in the "C" collation of the expression
+    indexes from the 0031 migration, where the range is exactly the prefix.
+    """
+    if connections[customers.db].vendor == 'postgresql':
+        key = Collate(F(field), 'C')
+    else:
+        key = F(field)
+    return (
+        customers.annotate(match_key=key)
+        .filter(match_key__gte=prefix, match_key__lt=_successor(prefix))
+        .order_by('match_key', 'pk')
+        .values('id', 'full_name', 'company_name', 'phone', 'tax_number', 'address', 'match_key')[:limit]
+    )
+
+
+def _successor(prefix):
+    """The smallest string above every string that starts with ``prefix``"""
+    last = ord(prefix[-1]) + 1
+    if 0xd800 <= last <= 0xdfff:
+        last = 0xe000
+    return prefix[:-1] + chr(last)
+
+
+# =============================================================================
+# INVALIDATION
+# =============================================================================
+
+def typeahead_version(site_id):
+    return cache.get(VERSION_KEY.format(site_id=site_id)) or 0
+
+
+def _bump_version(site_id):
+    key = VERSION_KEY.format(site_id=site_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_customer_search(site_id):
+    """Retire every cached result list of ``site_id``"""
+    _bump_version(site_id)
+    if connection.in_atomic_block:
+        # Another request may cache the old rows before the write commits
+        transaction.on_commit(lambda: _bump_version(site_id))
+
+
+def customer_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_customer_search(instance.site_id)
+
+
+post_save.connect(customer_changed, sender=Customer, dispatch_uid='typeahead_post_save_Customer')
+post_delete.connect(customer_changed, sender=Customer, dispatch_uid='typeahead_post_delete_Customer')
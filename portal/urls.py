@@ -3,7 +3,7 @@ from django.urls import path
 from . import views
 from .views import (
     ProductSearchView, product_search_fallback, barcode_scanner_view,
-    barcode_scan, InvoiceCreateView, InvoiceUpdateView, InvoiceDetailView, InvoiceListView,
+    barcode_scan, barcode_scan_batch, InvoiceCreateView, InvoiceUpdateView, InvoiceDetailView, InvoiceListView,
     InvoiceDeleteView, get_product_details, dashboard_view, report_view, analytics_api, export_reports,
     CustomerListView, CustomerCreateView, CustomerDetailView, CustomerUpdateView,
     ProductListView, ProductDetailView, ProductCreateView, ProductUpdateView,
@@ -40,8 +40,12 @@ urlpatterns = [
     path('dashboard/', dashboard_view, name='dashboard'),
     path('reports/', report_view, name='reports'),
     path('reports/export/', export_reports, name='export_reports'),
+    path('reports/jobs/', views.report_job_submit, name='report_job_submit'),
+    path('reports/jobs/<int:pk>/', views.report_job_status, name='report_job_status'),
+    path('reports/jobs/<int:pk>/download/', views.report_job_download, name='report_job_download'),
     path('api/analytics/', analytics_api, name='analytics_api'),
     path('dashboard_summary_api/', views.dashboard_summary_api, name='dashboard_summary_api'),
+    path('dashboard_summary_api/<slug:tile>/', views.dashboard_tile_api, name='dashboard_tile_api'),
     path('profile/', views.profile, name='profile'),
     path('enquiry/', views.enquiry, name='enquiry'),
     path('terms/', views.terms, name='terms'),
@@ -125,6 +129,7 @@ urlpatterns = [
     
     # Barcode functionality
     path('api/barcode-scan/', barcode_scan, name='barcode_scan'),
+    path('api/barcode-scan/batch/', barcode_scan_batch, name='barcode_scan_batch'),
     path('barcode-scanner/', barcode_scanner_view, name='barcode_scanner'),
     
     # AJAX endpoints for product search and barcode lookup
@@ -0,0 +1,227 @@
+"""
+Running inventory valuation counters
+
+Every product contributes a fixed set of counters to the InventoryValuation
+row of its category and to the site row (the one without a category): one
+product, and while active its stock, ``cost_price * stock``,
+``unit_price * stock`` and its prices (for averages). When a product changes,
+the signals at the bottom compare its old and new contribution and apply the
+difference to both rows with one ``F()`` increment UPDATE. ``Product.save``
+runs in a transaction, so the counters commit or roll back together with the
+product row.
+
+Migration 0028 seeds the rows from the products. Writes that bypass model
+signals (``QuerySet.update``, ``bulk_create``) leave the counters behind;
+``reconcile_valuation`` recomputes them from the products with one grouped
+query and backs ``manage.py verify_inventory_valuation``.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import InventoryValuation, Product
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = (
+    'product_count', 'active_count', 'stock_units', 'cost_value', 'selling_value',
+    'cost_price_sum', 'unit_price_sum', 'stock_cost_value',
+)
+
+MONEY_FIELDS = ('cost_value', 'selling_value', 'cost_price_sum', 'unit_price_sum', 'stock_cost_value')
+
+MONEY = DecimalField(max_digits=16, decimal_places=2)
+CENT = Decimal('0.01')
+
+
+def product_contribution(product):
+    """``(site_id, category_id, counters)`` that ``product`` adds to the valuation, or None"""
+    if product is None:
+        return None
+    stock = product.stock or 0
+    cost_price = product.cost_price or Decimal('0')
+    unit_price = product.unit_price or Decimal('0')
+    counters = {'product_count': 1, 'stock_cost_value': cost_price * stock}
+    if product.is_active:
+        counters.update(
+            active_count=1,
+            stock_units=stock,
+            cost_value=cost_price * stock,
+            selling_value=unit_price * stock,
+            cost_price_sum=cost_price,
+            unit_price_sum=unit_price,
+        )
+    return (product.site_id, product.category_id, counters)
+
+
+def apply_valuation_change(old, new):
+    """Apply ``new - old`` to the category and site rows; either side may be None"""
+    if old and new and old[:2] == new[:2]:
+        site_id, category_id, _ = new
+        deltas = {field: new[2].get(field, 0) - old[2].get(field, 0) for field in COUNTER_FIELDS}
+        apply_valuation_delta(site_id, category_id, deltas)
+        return
+    if old:
+        site_id, category_id, counters = old
+        # The category row may be going away with a cascading delete; never recreate it
+        removed = {field: -value for field, value in counters.items()}
+        apply_valuation_delta(site_id, category_id, removed, create=False)
+    if new:
+        apply_valuation_delta(*new)
+
+
+def apply_valuation_delta(site_id, category_id, deltas, create=True):
+    """
+    Add ``deltas`` (counter field -> amount) to the rows of ``category_id`` and
+    of the whole site with one increment UPDATE, creating missing rows.
+    """
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    rows = InventoryValuation.all_objects.filter(Q(category_id=category_id) | Q(category__isnull=True), site_id=site_id)
+    updated = rows.update(**{field: F(field) + value for field, value in deltas.items()})
+    if updated == 2 or not create:
+        return
+
+    existing = set(rows.values_list('category_id', flat=True))
+    for missing in {category_id, None} - existing:
+        try:
+            with transaction.atomic():
+                InventoryValuation.all_objects.create(site_id=site_id, category_id=missing, **deltas)
+        except IntegrityError:
+            # Created concurrently; add to that row instead
+            InventoryValuation.all_objects.filter(
+                Q(category_id=missing) if missing else Q(category__isnull=True), site_id=site_id,
+            ).update(**{field: F(field) + value for field, value in deltas.items()})
+
+
+def site_valuation(site_id):
+    """The site's InventoryValuation row, or an empty unsaved one"""
+    return (
+        InventoryValuation.all_objects.filter(site_id=site_id, category__isnull=True).first()
+        or InventoryValuation(site_id=site_id)
+    )
+
+
+# =============================================================================
+# RECONCILIATION
+# =============================================================================
+
+def expected_valuation(site_id=None):
+    """Counters recomputed from the products, keyed by ``(site_id, category_id)``"""
+    active = Q(is_active=True)
+    zero = Decimal('0')
+    products = Product.all_objects.all()
+    if site_id is not None:
+        products = products.filter(site_id=site_id)
+    rows = (
+        products.values('site_id', 'category_id')
+        .annotate(
+            product_count=Count('id'),
+            active_count=Count('id', filter=active),
+            stock_units=Coalesce(Sum('stock', filter=active), 0),
+            cost_value=Coalesce(Sum(F('cost_price') * F('stock'), filter=active, output_field=MONEY), zero),
+            selling_value=Coalesce(Sum(F('unit_price') * F('stock'), filter=active, output_field=MONEY), zero),
+            cost_price_sum=Coalesce(Sum('cost_price', filter=active, output_field=MONEY), zero),
+            unit_price_sum=Coalesce(Sum('unit_price', filter=active, output_field=MONEY), zero),
+            stock_cost_value=Coalesce(Sum(F('cost_price') * F('stock'), output_field=MONEY), zero),
+        )
+        .order_by()
+    )
+
+    expected = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    for row in rows:
+        for key in ((row['site_id'], row['category_id']), (row['site_id'], None)):
+            for field in COUNTER_FIELDS:
+                expected[key][field] += row[field]
+    for counters in expected.values():
+        for field in MONEY_FIELDS:
+            counters[field] = Decimal(counters[field]).quantize(CENT)
+    return expected
+
+
+def reconcile_valuation(site_id=None, fix=True):
+    """
+    Compare the stored counters with the products. Returns
+    ``(site_id, category_id, field, stored, expected)`` tuples for every
+    difference, rows missing on either side included; with ``fix`` set the
+    stored rows are rewritten to match.
+    """
+    expected = expected_valuation(site_id)
+    stored_rows = InventoryValuation.all_objects.all()
+    if site_id is not None:
+        stored_rows = stored_rows.filter(site_id=site_id)
+    stored = {(row.site_id, row.category_id): row for row in stored_rows}
+
+    drift = []
+    to_create = []
+    to_update = []
+    for key in sorted(set(expected) | set(stored), key=lambda key: (key[0], key[1] or 0)):
+        values = expected.get(key, dict.fromkeys(COUNTER_FIELDS, 0))
+        row = stored.get(key)
+        if row is None:
+            row = InventoryValuation(site_id=key[0], category_id=key[1])
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        for field in COUNTER_FIELDS:
+            if getattr(row, field) != values[field]:
+                drift.append((key[0], key[1], field, getattr(row, field), values[field]))
+            setattr(row, field, values[field])
+
+    if fix and drift:
+        with transaction.atomic():
+            InventoryValuation.all_objects.bulk_create(to_create)
+            InventoryValuation.all_objects.bulk_update(to_update, COUNTER_FIELDS)
+        logger.info(f"Reconciled inventory valuation: {len(drift)} value(s) fixed")
+        # Imported here as portal.dashboard reads the counters through this module
+        from .dashboard import invalidate_dashboard
+        for fixed_site in {row[0] for row in drift}:
+            invalidate_dashboard(fixed_site)
+    return drift
+
+
+# =============================================================================
+# SIGNALS
+# =============================================================================
+
+def remember_valuation_contribution(sender, instance, raw=False, using=None, **kwargs):
+    """
+    Capture what the stored product contributes before it is overwritten. The
+    row is locked until ``Product.save``'s transaction ends, so a concurrent
+    save of the same product cannot apply its delta against the same old row.
+    """
+    if raw:
+        return
+    previous = None
+    if instance.pk:
+        rows = sender._base_manager.using(using).filter(pk=instance.pk)
+        if transaction.get_connection(using).in_atomic_block:
+            rows = rows.select_for_update()
+        previous = rows.first()
+    instance._valuation_contribution = product_contribution(previous)
+
+
+def apply_valuation_contribution(sender, instance, raw=False, **kwargs):
+    """Move the counters by the difference between the old and new contribution"""
+    if raw:
+        return
+    contribution = product_contribution(instance)
+    apply_valuation_change(getattr(instance, '_valuation_contribution', None), contribution)
+    instance._valuation_contribution = contribution
+
+
+def remove_valuation_contribution(sender, instance, **kwargs):
+    """Take a deleted product's contribution back out of the counters"""
+    apply_valuation_change(product_contribution(instance), None)
+
+
+pre_save.connect(remember_valuation_contribution, sender=Product, dispatch_uid='valuation_pre_save_Product')
+post_save.connect(apply_valuation_contribution, sender=Product, dispatch_uid='valuation_post_save_Product')
+post_delete.connect(remove_valuation_contribution, sender=Product, dispatch_uid='valuation_post_delete_Product')
@@ -2,24 +2,38 @@
 from django.views import View
 from django.views.generic import (CreateView, UpdateView, DeleteView,
 ListView, DetailView, View)
-from portal.models import Invoice, InvoiceItem, Product, Customer, Quotation, QuotationItem, PaymentReceipt
-from procurement.models import Supplier, PurchaseOrder
-from django.db.models import Sum, Q, Avg, Count, F, Case, When, DecimalField, Min, Max
+from portal.models import Invoice, Product, Customer, Quotation, QuotationItem, PaymentReceipt, DocumentSequence, ReportJob
+from procurement.models import Supplier
+from django.db.models import Sum, Q, Avg, Count, Min, Max
 from django.db.models.functions import Cast
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from django.db.models.functions import TruncDate, TruncMonth
 from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
 from portal.forms import ProductEnquiryForm, InvoiceForm, InvoiceItemForm, CustomerForm, QuotationForm, PaymentReceiptForm
 from django.contrib import messages
 import decimal
 from decimal import Decimal
-from django.http import JsonResponse, HttpResponse, Http404, HttpResponseRedirect
+from django.http import JsonResponse, HttpResponse, Http404, HttpResponseRedirect, StreamingHttpResponse, FileResponse
 from django.urls import reverse, reverse_lazy
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.utils.cache import patch_cache_control
 from .decorators import superuser_required, dashboard_access_required, reports_access_required
+from .invoice_utils import parse_invoice_lines, add_invoice_items, sync_invoice_items
+from .totals import refresh_totals, schedule_totals
+from .valuation import site_valuation
+from .reports import ReportEngine, parse_report_filters
+from .pagination import KeysetPaginationMixin
+from .summaries import summarize
+from .search import search_products
+from .barcode_index import get_by_code
+from .typeahead import search_customers
+from .exports import EXPORTS, XLSX_AVAILABLE, export_rows, stream_csv
+from .report_jobs import job_params, submit_report_job
+from .dashboard import (
+    BUCKETS, TILES as DASHBOARD_TILES, DashboardMetrics, dashboard_etag, revenue_series, tile_timeout, top_customers,
+)
 from django.utils.decorators import method_decorator
 from django.contrib.admin.views.decorators import staff_member_required
 from django.urls import reverse, path
@@ -33,14 +47,12 @@ import logging
 from decimal import Decimal
 import os
 import base64
-import random
 from weasyprint import HTML, CSS
 from django.conf import settings
 import arabic_reshaper
 from bidi.algorithm import get_display
 from datetime import datetime, timedelta
 from django.core.paginator import Paginator
-import csv
 from django.db.models import ExpressionWrapper, FloatField
 from django.views.decorators.csrf import csrf_exempt
 
@@ -400,7 +412,7 @@ class InvoiceCreateView(CreateView):
                     invoice.invoice_number = self._generate_invoice_number()
                     print(f"🔍 VIEW: Generated invoice number: {invoice.invoice_number}")
 
-                if len(invoice.invoice_number) != 10 or not invoice.invoice_number.isdigit():
+                if len(invoice.invoice_number) < 10 or not invoice.invoice_number.isdigit():
                     form.add_error(None, "Generated invoice number is invalid")
                     return self.form_invalid(form)
                 
@@ -489,7 +501,9 @@ class InvoiceCreateView(CreateView):
                 self._create_invoice_items(invoice)
                 self._update_invoice_totals(invoice)
 
-                return self._handle_response(invoice)
+            # Totals are recalculated when the transaction above commits
+            refresh_totals(invoice)
+            return self._handle_response(invoice)
 
         except Exception as e:
             logger.error(f"Invoice creation error: {str(e)}")
@@ -517,127 +531,23 @@ class InvoiceCreateView(CreateView):
     
     def _generate_invoice_number(self):
         """Generate invoice number in YYYYMMDDNN format"""
-        # Define date_part at the start
-        date_part = timezone.now().strftime('%Y%m%d')  # YYYYMMDD format
-    
-        try:
-            with transaction.atomic():
-                # Get the highest invoice number for today
-                last_invoice = Invoice.objects.filter(
-                    invoice_number__startswith=date_part
-                ).order_by('-invoice_number').first()
-        
-                if last_invoice:
-                    last_num = int(last_invoice.invoice_number[-2:])  # Get last 2 digits
-                    next_num = last_num + 1
-                else:
-                    next_num = 1
-                
-                # Ensure we don't exceed 99 invoices per day
-                if next_num > 99:
-                    raise ValueError("Maximum daily invoice limit (99) reached")
-                
-                new_number = f"{date_part}{next_num:02d}"
-                print(f"✅ Generated new invoice number: {new_number}")
-                return new_number
-        except Exception as e:
-            # Fallback mechanism
-            fallback_num = random.randint(1, 99)
-            fallback_number = f"{date_part}{fallback_num:02d}F"  # F for fallback
-            print(f"🚨 Fallback invoice number generation: {fallback_number}")
-            logger.error(f"Invoice number generation error: {str(e)}")
-            return fallback_number
+        new_number = DocumentSequence.next_number('invoice')
+        print(f"✅ Generated new invoice number: {new_number}")
+        return new_number
 
     def _create_invoice_items(self, invoice):
-        """Create all associated invoice items"""
+        """Create all associated invoice items in a single batch"""
         items_data = json.loads(self.request.POST.get('items', '[]'))
-        print(f"=== ITEMS DEBUG ===")
-        print(f"Items JSON: {self.request.POST.get('items', '[]')}")
-        print(f"Parsed items: {items_data}")
-        logger.info(f"Creating invoice items: {items_data}")
-        
-        for item in items_data:
-            print(f"=== PROCESSING ITEM ===")
-            print(f"Item data: {item}")
-            logger.info(f"Processing item: {item}")
-            try:
-                # Safely convert product ID to integer
-                product_id = item.get('product', '').strip()
-                print(f"Raw product ID: '{product_id}'")
-                print(f"Product ID type: {type(product_id)}")
-                print(f"Product ID length: {len(product_id) if product_id else 'None'}")
-                
-                if not product_id or product_id == '':
-                    print("Skipping item with empty product ID")
-                    logger.warning(f"Skipping item with empty product ID: {item}")
-                    continue
-                    
-                try:
-                    print(f"Attempting to convert '{product_id}' to int...")
-                    product_id_int = int(product_id)
-                    print(f"Successfully converted to: {product_id_int}")
-                except (ValueError, TypeError) as e:
-                    print(f"Failed to convert '{product_id}' to int: {e}")
-                    logger.error(f"Invalid product ID '{product_id}' in item: {item}")
-                    continue
-                
-                product = Product.objects.get(pk=product_id)
-                logger.info(f"Found product: {product.name} (ID: {product.id})")
-                
-                # Safely convert quantity and price
-                try:
-                    quantity = int(item.get('quantity', '1'))
-                    if quantity <= 0:
-                        quantity = 1
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid quantity '{item.get('quantity')}', defaulting to 1")
-                    quantity = 1
-                
-                try:
-                    unit_price = Decimal(str(item.get('selling_price', item.get('unit_price', product.unit_price))))
-                except (ValueError, TypeError, decimal.InvalidOperation):
-                    logger.warning(f"Invalid price '{item.get('unit_price')}', using product price")
-                    unit_price = product.unit_price
-                
-                InvoiceItem.objects.create(
-                    invoice=invoice,
-                    product=product,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                )
-                logger.info(f"Created invoice item for product: {product.name}")
-            except Product.DoesNotExist:
-                logger.error(f"Product not found with ID: {product_id}")
-                continue
-            except Exception as e:
-                logger.error(f"Error creating invoice item: {e}, item data: {item}")
-                raise
+        lines = parse_invoice_lines(items_data)
+        add_invoice_items(invoice, lines)
+        logger.info(f"Created {len(lines)} invoice item(s) for invoice {invoice.invoice_number}")
 
     def _update_invoice_totals(self, invoice):
-        """Update calculated invoice totals with safe decimal conversion"""
-        try:
-            subtotal = self.request.POST.get('subtotal', '0').strip()
-            invoice.subtotal = Decimal(subtotal) if subtotal else Decimal('0')
-        except (ValueError, decimal.InvalidOperation):
-            logger.warning(f"Invalid subtotal '{self.request.POST.get('subtotal')}', defaulting to 0")
-            invoice.subtotal = Decimal('0')
-            
-        try:
-            discount_amount = self.request.POST.get('discount_amount', '0').strip()
-            invoice.discount_amount = Decimal(discount_amount) if discount_amount else Decimal('0')
-        except (ValueError, decimal.InvalidOperation):
-            logger.warning(f"Invalid discount amount '{self.request.POST.get('discount_amount')}', defaulting to 0")
-            invoice.discount_amount = Decimal('0')
-            
-        try:
-            grand_total = self.request.POST.get('grand_total', '0').strip()
-            invoice.grand_total = Decimal(grand_total) if grand_total else Decimal('0')
-        except (ValueError, decimal.InvalidOperation):
-            logger.warning(f"Invalid grand total '{self.request.POST.get('grand_total')}', defaulting to 0")
-            invoice.grand_total = Decimal('0')
-            
-        invoice.save()
-        return self._handle_response(invoice)
+        """
+        Queue the totals recalculation. Totals are derived from the stored items,
+        never from client-posted figures, once the transaction commits.
+        """
+        schedule_totals(invoice)
 
     def _handle_response(self, invoice):
         """Return appropriate response based on request type"""
@@ -829,7 +739,9 @@ class InvoiceCreateView(CreateView):
                 self._create_invoice_items(invoice)
                 self._update_invoice_totals(invoice)
 
-                return self._handle_response(invoice)
+            # Totals are recalculated when the transaction above commits
+            refresh_totals(invoice)
+            return self._handle_response(invoice)
 
         except Exception as e:
             logger.error(f"Invoice creation error: {str(e)}")
@@ -857,126 +769,24 @@ class InvoiceCreateView(CreateView):
     
     def _generate_invoice_number(self):
         """Generate invoice number in YYYYMMDDNN format"""
-        # Define date_part at the start
-        date_part = timezone.now().strftime('%Y%m%d')  # YYYYMMDD format
-    
-        try:
-            with transaction.atomic():
-                # Get the highest invoice number for today
-                last_invoice = Invoice.objects.filter(
-                    invoice_number__startswith=date_part
-                ).order_by('-invoice_number').first()
-        
-                if last_invoice:
-                    last_num = int(last_invoice.invoice_number[-2:])  # Get last 2 digits
-                    next_num = last_num + 1
-                else:
-                    next_num = 1
-                
-                # Ensure we don't exceed 99 invoices per day
-                if next_num > 99:
-                    raise ValueError("Maximum daily invoice limit (99) reached")
-                
-                new_number = f"{date_part}{next_num:02d}"
-                print(f"✅ Generated new invoice number: {new_number}")
-                return new_number
-        except Exception as e:
-            # Fallback mechanism
-            fallback_num = random.randint(1, 99)
-            fallback_number = f"{date_part}{fallback_num:02d}F"  # F for fallback
-            print(f"🚨 Fallback invoice number generation: {fallback_number}")
-            return fallback_number
+        new_number = DocumentSequence.next_number('invoice')
+        print(f"✅ Generated new invoice number: {new_number}")
+        return new_number
 
 
     def _create_invoice_items(self, invoice):
-        """Create all associated invoice items"""
+        """Create all associated invoice items in a single batch"""
         items_data = json.loads(self.request.POST.get('items', '[]'))
-        print(f"=== ITEMS DEBUG ===")
-        print(f"Items JSON: {self.request.POST.get('items', '[]')}")
-        print(f"Parsed items: {items_data}")
-        logger.info(f"Creating invoice items: {items_data}")
-        
-        for item in items_data:
-            print(f"=== PROCESSING ITEM ===")
-            print(f"Item data: {item}")
-            logger.info(f"Processing item: {item}")
-            try:
-                # Safely convert product ID to integer
-                product_id = item.get('product', '').strip()
-                print(f"Raw product ID: '{product_id}'")
-                print(f"Product ID type: {type(product_id)}")
-                print(f"Product ID length: {len(product_id) if product_id else 'None'}")
-                
-                if not product_id or product_id == '':
-                    print("Skipping item with empty product ID")
-                    logger.warning(f"Skipping item with empty product ID: {item}")
-                    continue
-                    
-                try:
-                    print(f"Attempting to convert '{product_id}' to int...")
-                    product_id_int = int(product_id)
-                    print(f"Successfully converted to: {product_id_int}")
-                except (ValueError, TypeError) as e:
-                    print(f"Failed to convert '{product_id}' to int: {e}")
-                    logger.error(f"Invalid product ID '{product_id}' in item: {item}")
-                    continue
-                
-                product = Product.objects.get(pk=product_id)
-                logger.info(f"Found product: {product.name} (ID: {product.id})")
-                
-                # Safely convert quantity and price
-                try:
-                    quantity = int(item.get('quantity', '1'))
-                    if quantity <= 0:
-                        quantity = 1
-                except (ValueError, TypeError):
-                    logger.warning(f"Invalid quantity '{item.get('quantity')}', defaulting to 1")
-                    quantity = 1
-                
-                try:
-                    unit_price = Decimal(str(item.get('selling_price', item.get('unit_price', product.unit_price))))
-                except (ValueError, TypeError, decimal.InvalidOperation):
-                    logger.warning(f"Invalid price '{item.get('unit_price')}', using product price")
-                    unit_price = product.unit_price
-                
-                InvoiceItem.objects.create(
-                    invoice=invoice,
-                    product=product,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                )
-                logger.info(f"Created invoice item for product: {product.name}")
-            except Product.DoesNotExist:
-                logger.error(f"Product not found with ID: {product_id}")
-                continue
-            except Exception as e:
-                logger.error(f"Error creating invoice item: {e}, item data: {item}")
-                raise
+        lines = parse_invoice_lines(items_data)
+        add_invoice_items(invoice, lines)
+        logger.info(f"Created {len(lines)} invoice item(s) for invoice {invoice.invoice_number}")
 
     def _update_invoice_totals(self, invoice):
-        """Update calculated invoice totals with safe decimal conversion"""
-        try:
-            subtotal = self.request.POST.get('subtotal', '0').strip()
-            invoice.subtotal = Decimal(subtotal) if subtotal else Decimal('0')
-        except (ValueError, decimal.InvalidOperation):
-            logger.warning(f"Invalid subtotal '{self.request.POST.get('subtotal')}', defaulting to 0")
-            invoice.subtotal = Decimal('0')
-            
-        try:
-            discount_amount = self.request.POST.get('discount_amount', '0').strip()
-            invoice.discount_amount = Decimal(discount_amount) if discount_amount else Decimal('0')
-        except (ValueError, decimal.InvalidOperation):
-            logger.warning(f"Invalid discount amount '{self.request.POST.get('discount_amount')}', defaulting to 0")
-            invoice.discount_amount = Decimal('0')
-            
-        try:
-            grand_total = self.request.POST.get('grand_total', '0').strip()
-            invoice.grand_total = Decimal(grand_total) if grand_total else Decimal('0')
-        except (ValueError, decimal.InvalidOperation):
-            logger.warning(f"Invalid grand total '{self.request.POST.get('grand_total')}', defaulting to 0")
-            invoice.grand_total = Decimal('0')
-            
-        invoice.save()
+        """
+        Queue the totals recalculation. Totals are derived from the stored items,
+        never from client-posted figures, once the transaction commits.
+        """
+        schedule_totals(invoice)
 
     def _handle_response(self, invoice):
         """Return appropriate response based on request type"""
@@ -1053,17 +863,8 @@ class InvoiceUpdateView(UpdateView):
                 # Process invoice items
                 self._process_invoice_items(invoice)
                 
-                # Update totals from form data
-                invoice.subtotal = form.cleaned_data.get('subtotal', 0)
-                invoice.tax = form.cleaned_data.get('tax', 0)
-                invoice.discount_type = form.cleaned_data.get('discount_type', 'amount')
-                discount_value = form.cleaned_data.get('discount_value', 0)
-                print(f"DEBUG: discount_value from form: {discount_value} (type: {type(discount_value)})")
-                invoice.discount_value = discount_value if discount_value is not None else 0
-                invoice.discount_amount = form.cleaned_data.get('discount_amount', 0)
-                invoice.grand_total = form.cleaned_data.get('grand_total', 0)
-                print(f"DEBUG: invoice.discount_value before save: {invoice.discount_value}")
-                invoice.save()
+                # Totals are recalculated from the saved items on commit
+                schedule_totals(invoice)
                 
                 messages.success(self.request, f"Invoice #{invoice.invoice_number} updated successfully!")
                 return redirect('portal:invoice_detail', pk=invoice.pk)
@@ -1074,60 +875,10 @@ class InvoiceUpdateView(UpdateView):
             return self.form_invalid(form)
 
     def _process_invoice_items(self, invoice):
-        """Process all invoice item changes (create/update/delete)"""
+        """Process all invoice item changes (create/update/delete) in one batch"""
         items_data = json.loads(self.request.POST.get('items', '[]'))
-        existing_ids = set(invoice.items.values_list('id', flat=True))
-        updated_ids = set()
-        
-        for item_data in items_data:
-            if item_data.get('id'):
-                # Update existing item
-                self._update_existing_item(invoice, item_data)
-                updated_ids.add(int(item_data['id']))
-            else:
-                # Create new item
-                self._create_new_item(invoice, item_data)
-        
-        # Delete removed items
-        self._delete_removed_items(invoice, existing_ids, updated_ids)
-
-    def _update_existing_item(self, invoice, item_data):
-        """Update an existing invoice item"""
-        try:
-            product = Product.objects.get(pk=item_data['product'])
-            InvoiceItem.objects.filter(
-                id=item_data['id'],
-                invoice=invoice
-            ).update(
-                product=product,
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                total_price=Decimal(item_data['quantity']) * Decimal(item_data['unit_price'])
-            )
-        except (Product.DoesNotExist, KeyError, ValueError) as e:
-            logger.error(f"Error updating invoice item: {str(e)}")
-            raise
-
-    def _create_new_item(self, invoice, item_data):
-        """Create a new invoice item"""
-        try:
-            product = Product.objects.get(pk=item_data['product'])
-            InvoiceItem.objects.create(
-                invoice=invoice,
-                product=product,
-                quantity=item_data['quantity'],
-                unit_price=item_data['unit_price'],
-                total_price=Decimal(item_data['quantity']) * Decimal(item_data['unit_price'])
-            )
-        except (Product.DoesNotExist, KeyError, ValueError) as e:
-            logger.error(f"Error creating invoice item: {str(e)}")
-            raise
-
-    def _delete_removed_items(self, invoice, existing_ids, updated_ids):
-        """Delete items that were removed from the invoice"""
-        items_to_delete = existing_ids - updated_ids
-        if items_to_delete:
-            invoice.items.filter(id__in=items_to_delete).delete()
+        lines = parse_invoice_lines(items_data, strict=True)
+        sync_invoice_items(invoice, lines)
 
 
 @method_decorator(login_required, name='dispatch')
@@ -1151,11 +902,12 @@ class InvoiceDetailView(DetailView):
         return context
 
 @method_decorator(login_required, name='dispatch')
-class InvoiceListView(ListView):
+class InvoiceListView(KeysetPaginationMixin, ListView):
     model = Invoice
     template_name = 'portal/invoice_list.html'
     paginate_by = 25
     ordering = ['-date']
+    keyset_ordering = ('-date', '-id')
     
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -1170,7 +922,7 @@ class InvoiceListView(ListView):
         
         # Default to recent invoices (last 7 days) if no filters
         if not filters_active:
-            last_week = timezone.now() - timezone.timedelta(days=7)
+            last_week = timezone.localdate() - timedelta(days=7)
             queryset = queryset.filter(date__gte=last_week)
         
         # Date range filtering
@@ -1198,22 +950,20 @@ class InvoiceListView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queryset = self.get_queryset()
-        
-        # Calculate summary statistics in single query
-        aggregates = queryset.aggregate(
+
+        # Summary statistics of the filtered invoices in a single query
+        paid = Q(status='paid')
+        pending = ~Q(status__in=['paid', 'cancelled'])
+        context.update(summarize(
+            self.object_list,
+            total_invoices=Count('id'),
+            paid_invoices=Count('id', filter=paid),
+            pending_invoices=Count('id', filter=pending),
             total_amount=Sum('grand_total'),
-            paid_amount=Sum('grand_total', filter=Q(status='paid')),
-            pending_amount=Sum('grand_total', filter=~Q(status__in=['paid', 'cancelled']))
-        )
-        
+            paid_amount=Sum('grand_total', filter=paid),
+            pending_amount=Sum('grand_total', filter=pending),
+        ))
         context.update({
-            'total_invoices': queryset.count(),
-            'paid_invoices': queryset.filter(status='paid').count(),
-            'pending_invoices': queryset.exclude(status__in=['paid', 'cancelled']).count(),
-            'total_amount': aggregates['total_amount'] or 0,
-            'paid_amount': aggregates['paid_amount'] or 0,
-            'pending_amount': aggregates['pending_amount'] or 0,
             # Current filter values for template
             'current_status': self.request.GET.get('status', ''),
             'current_payment_mode': self.request.GET.get('payment_mode', ''),
@@ -1298,15 +1048,8 @@ class ProductSearchView(ListView):
 
     def get_queryset(self):
         query = self.request.GET.get('q', '').strip()
-        if not query:
-            return Product.objects.none()  # Return empty queryset if no query
-            
-        return Product.objects.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(sku__iexact=query),
-            is_active=True
-        ).select_related('category')  # Optimize DB queries
+        # Ranked matches; nothing for an empty query
+        return search_products(query, Product.objects.filter(is_active=True).select_related('category'))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1317,18 +1060,72 @@ class ProductSearchView(ListView):
 def product_search_fallback(request):
     return render(request, 'portal/products/search_empty.html')
 
-@csrf_exempt  # For simplicity in development, remove in production with proper CSRF handling
-@require_http_methods(["POST"])
-@login_required
-def barcode_scan(request):
+def _barcode_scan_product(product):
     """
-    Enhanced barcode scanner that fetches complete product details including:
+    Complete product details of a scan:
     - Product information (name, SKU, description)
     - Stock availability
     - Cost price and selling price
     - Category information
     - Profit calculations
     """
+    # Calculate profit margin and amount
+    profit_margin = product.profit_margin()
+    profit_amount = product.profit_amount()
+    
+    # Determine stock status with proper labels
+    if product.stock > 10:
+        stock_status = 'In Stock'
+    elif product.stock > 0:
+        stock_status = 'Low Stock'
+    else:
+        stock_status = 'Out of Stock'
+    
+    return {
+        'id': product.id,
+        'name': product.name,
+        'sku': product.sku,
+        'description': product.description,
+        'barcode': product.barcode,
+        
+        # Pricing information (unit_price is the selling price)
+        'cost_price': str(product.cost_price),
+        'selling_price': str(product.unit_price),
+        'profit_margin': f"{profit_margin:.1f}%" if profit_margin else "0.0%",
+        'profit_amount': str(profit_amount) if profit_amount else "0.00",
+        
+        # Stock information
+        'stock': product.stock,
+        'stock_status': stock_status,
+        'is_active': product.is_active,
+        
+        # Category information
+        'category_name': product.category.name if product.category else 'Uncategorized',
+        'category_description': product.category.description if product.category else '',
+        'category_icon': product.category.icon if product.category else '',
+        
+        # Additional information
+        'warranty': f"{product.warranty_period} months" if product.warranty_period else "No warranty",
+        'image_url': product.image.url if product.image else None,
+        
+        # Legacy field for backward compatibility
+        'legacy_price': str(product.unit_price),  # Keep for existing code
+    }
+
+
+def _barcode_not_found(barcode):
+    return {
+        'error': 'Product not found',
+        'barcode': barcode,
+        'suggestions': 'Please check the barcode number or add this product to inventory'
+    }
+
+
+@csrf_exempt  # For simplicity in development, remove in production with proper CSRF handling
+@require_http_methods(["POST"])
+@login_required
+def barcode_scan(request):
+    """Enhanced barcode scanner that fetches complete product details"""
     barcode_data = request.POST.get('barcode', '').strip()
     
     if not barcode_data:
@@ -1336,102 +1133,97 @@ def barcode_scan(request):
     
     try:
         # Get product with related category information
-        product = Product.objects.select_related('category').get(barcode=barcode_data)
-        
-        # Calculate profit margin and amount
-        profit_margin = product.profit_margin()
-        profit_amount = product.profit_amount()
-        
-        # Determine stock status with proper labels
-        if product.stock > 10:
-            stock_status = 'In Stock'
-        elif product.stock > 0:
-            stock_status = 'Low Stock'
-        else:
-            stock_status = 'Out of Stock'
-        
-        response_data = {
-            'success': True,
-            'product': {
-                'id': product.id,
-                'name': product.name,
-                'sku': product.sku,
-                'description': product.description,
-                'barcode': product.barcode,
-                
-                # Pricing information
-                'cost_price': str(product.cost_price),
-                'selling_price': str(product.selling_price),
-                'profit_margin': f"{profit_margin:.1f}%" if profit_margin else "0.0%",
-                'profit_amount': str(profit_amount) if profit_amount else "0.00",
-                
-                # Stock information
-                'stock': product.stock,
-                'stock_status': stock_status,
-                'is_active': product.is_active,
-                
-                # Category information
-                'category_name': product.category.name if product.category else 'Uncategorized',
-                'category_description': product.category.description if product.category else '',
-                'category_icon': product.category.icon if product.category else '',
-                
-                # Additional information
-                'warranty': f"{product.warranty_period} months" if product.warranty_period else "No warranty",
-                'image_url': product.image.url if product.image else None,
-                
-                # Legacy field for backward compatibility
-                'legacy_price': str(product.selling_price),  # Keep for existing code
-            }
-        }
-        
-        return JsonResponse(response_data)
+        product = get_by_code(Product.objects.select_related('category'), barcode_data)
+        return JsonResponse({'success': True, 'product': _barcode_scan_product(product)})
         
     except Product.DoesNotExist:
-        return JsonResponse({
-            'error': 'Product not found',
-            'barcode': barcode_data,
-            'suggestions': 'Please check the barcode number or add this product to inventory'
-        }, status=404)
+        return JsonResponse(_barcode_not_found(barcode_data), status=404)
     except Exception as e:
         return JsonResponse({
             'error': f'An unexpected error occurred: {str(e)}',
             'barcode': barcode_data
         }, status=500)
 
+
+# Scans accepted by one batch request
+BARCODE_BATCH_LIMIT = 500
+
+
+def _parse_scans(payload):
+    """
+    ``[(barcode, quantity), ...]`` from a batch payload, ``{"scans": [{"barcode":
+    ..., "quantity": ...}, ...]}`` or ``{"barcodes": [...]}``; raises ValueError.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('Expected a JSON object')
+    entries = payload.get('scans', payload.get('barcodes'))
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('No scans provided')
+    if len(entries) > BARCODE_BATCH_LIMIT:
+        raise ValueError(f'At most {BARCODE_BATCH_LIMIT} scans per request')
+
+    scans = []
+    for position, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {'barcode': entry}
+        if not isinstance(entry, dict):
+            raise ValueError(f'Scan {position + 1} is not an object')
+        barcode = str(entry.get('barcode') or '').strip()
+        if not barcode:
+            raise ValueError(f'Scan {position + 1} has no barcode')
+        quantity = entry.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            raise ValueError(f'Scan {position + 1} has an invalid quantity')
+        scans.append((barcode, quantity))
+    return scans
+
+
+@csrf_exempt  # Same as barcode_scan: the handhelds post without a CSRF token
+@require_http_methods(["POST"])
+@login_required
+def barcode_scan_batch(request):
+    """
+    Resolve the scans a handheld buffered while offline in one request. Every
+    scan gets the ``barcode_scan`` payload (or its not-found payload) with its
+    quantity, in the order sent; the products come from a single query.
+    """
+    try:
+        scans = _parse_scans(json.loads(request.body or b'null'))
+    except ValueError as e:
+        # json.JSONDecodeError is a ValueError
+        return JsonResponse({'error': str(e)}, status=400)
+
+    products = {
+        product.barcode: product
+        for product in Product.objects.select_related('category').filter(barcode__in={code for code, _ in scans})
+    }
+    details = {}
+    results = []
+    for barcode, quantity in scans:
+        product = products.get(barcode)
+        if product is None:
+            results.append({'success': False, 'quantity': quantity, **_barcode_not_found(barcode)})
+            continue
+        if barcode not in details:
+            details[barcode] = _barcode_scan_product(product)
+        results.append({'success': True, 'barcode': barcode, 'quantity': quantity, 'product': details[barcode]})
+
+    found = sum(1 for result in results if result['success'])
+    return JsonResponse({
+        'success': True,
+        'results': results,
+        'found': found,
+        'not_found': len(results) - found,
+    })
+
 # customer search
 from django.views.decorators.csrf import csrf_exempt
 
 @csrf_exempt
 @login_required
 def customer_search(request):
-    print(f"🔍 customer_search called with query: {request.GET.get('q', '')}")
-    query = request.GET.get('q', '')
-    
-    if not query:
-        print("❌ No query provided")
-        return JsonResponse({'customers': []})
-    
-    print(f"📡 Searching for customers with query: {query}")
-    customers = Customer.objects.filter(
-        Q(full_name__icontains=query) | 
-        Q(company_name__icontains=query) |
-        Q(customer_id__icontains=query) |
-        Q(phone__icontains=query)
-    ).order_by('company_name', 'full_name')[:10]
-    
-    print(f"✅ Found {customers.count()} customers")
-    results = []
-    for customer in customers:
-        results.append({
-            'id': customer.id,
-            'display_text': customer.company_name or customer.full_name,
-            'phone': customer.phone,
-            'tax_number': customer.tax_number,
-            'address': customer.address,
-        })
-    
-    print(f"📤 Returning results: {results}")
-    return JsonResponse({'customers': results})
+    """Invoice customer typeahead: prefix matches from the normalized, indexed columns"""
+    return JsonResponse({'customers': search_customers(request.GET.get('q', ''))})
 
 # BarcodeScanner
 @login_required
@@ -1493,206 +1285,25 @@ def dashboard_view(request):
     """
     Comprehensive dashboard with business metrics and recent activity
     """
-    # Calculate date ranges
-    today = timezone.now().date()
-    current_month_start = today.replace(day=1)
-    last_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
-    last_month_end = current_month_start - timedelta(days=1)
-    
-    # Basic counts
-    total_customers = Customer.objects.count()  # No is_active field for Customer
-    active_products = Product.objects.filter(is_active=True).count()
-    active_suppliers = Supplier.objects.filter(is_active=True).count()
-    
-    # Invoice metrics
-    pending_invoices = Invoice.objects.filter(
-        status__in=['draft', 'pending']
-    ).count()
-    
-    # Monthly revenue (current month)
-    monthly_revenue = Invoice.objects.filter(
-        date__gte=current_month_start,  # Use 'date' not 'invoice_date'
-        status='paid'
-    ).aggregate(total=Sum('grand_total'))['total'] or 0
-    
-    # Purchase order metrics
-    pending_purchase_orders = PurchaseOrder.objects.filter(
-        status__in=['draft', 'ordered']
-    ).count()
-    
-    # Recent invoices (last 10)
-    recent_invoices = Invoice.objects.select_related(
-        'customer'
-    ).order_by('-date')[:10]  # Use 'date' instead of 'created_at'
-    
-    # Recent purchase orders (last 10)
-    recent_purchase_orders = PurchaseOrder.objects.select_related(
-        'supplier'
-    ).order_by('-created_at')[:10]
-    
-    # Low stock products (stock <= 10)
-    low_stock_products = Product.objects.filter(
-        stock__lte=10,
-        is_active=True
-    ).order_by('stock')[:10]
-    
-    # Top selling products (this month)
-    top_products = InvoiceItem.objects.filter(
-        invoice__date__gte=current_month_start,  # Use 'date' not 'invoice_date'
-        invoice__status='paid'
-    ).values(
-        'product__name'
-    ).annotate(
-        total_qty=Sum('quantity'),
-        total_revenue=Sum(F('quantity') * F('unit_price'))
-    ).order_by('-total_qty')[:5]
-    
-    # Recent customers (last 10 registered)
-    recent_customers = Customer.objects.order_by('-created_at')[:5]  # No is_active field
-    
-    # Enhanced Product Analytics
-    # Total inventory value (cost price * stock)
-    total_inventory_cost_value = Product.objects.filter(
-        is_active=True
-    ).aggregate(
-        total_value=Sum(F('cost_price') * F('stock'))
-    )['total_value'] or 0
-    
-    # Total inventory value (selling price * stock)  
-    total_inventory_value = Product.objects.filter(
-        is_active=True
-    ).aggregate(
-        total_value=Sum(F('unit_price') * F('stock'))
-    )['total_value'] or 0
-    
-    # Potential profit
-    potential_profit = total_inventory_value - total_inventory_cost_value
-    
-    # Average cost price
-    avg_cost_price = Product.objects.filter(
-        is_active=True
-    ).aggregate(avg_cost=Avg('cost_price'))['avg_cost'] or 0
-
-    # Average product cost (selling price)
-    avg_product_cost = Product.objects.filter(
-        is_active=True
-    ).aggregate(avg_cost=Avg('unit_price'))['avg_cost'] or 0
-    
-    # Average profit margin
-    avg_profit_margin = 0
-    if avg_cost_price > 0:
-        avg_profit_margin = ((avg_product_cost - avg_cost_price) / avg_cost_price) * 100
-
-    # Products by category count with cost analysis
-    products_by_category = Product.objects.filter(
-        is_active=True
-    ).values('category__name').annotate(
-        count=Count('id'),
-        total_cost_value=Sum(F('cost_price') * F('stock')),
-        total_value=Sum(F('unit_price') * F('stock')),
-        profit=Sum((F('unit_price') - F('cost_price')) * F('stock')),
-        avg_cost=Avg('cost_price'),
-        avg_selling=Avg('unit_price')
-    ).annotate(
-        profit_margin=Case(
-            When(avg_cost__gt=0, then=(F('avg_selling') - F('avg_cost')) / F('avg_cost') * 100),
-            default=0,
-            output_field=DecimalField(max_digits=10, decimal_places=2)
-        )
-    ).order_by('-count')[:5]
-    
-    # Procurement Analytics
-    total_purchase_orders = PurchaseOrder.objects.count()
-    total_procurement_value = PurchaseOrder.objects.aggregate(
-        total=Sum('total')
-    )['total'] or 0
-    
-    # This month's procurement
-    monthly_procurement = PurchaseOrder.objects.filter(
-        order_date__gte=current_month_start
-    ).aggregate(total=Sum('total'))['total'] or 0
-    
-    # Average order value
-    avg_order_value = 0
-    if total_purchase_orders > 0:
-        avg_order_value = total_procurement_value / total_purchase_orders
-    
-    # Recent products (last 10 added) with profit calculations
-    recent_products = Product.objects.filter(
-        is_active=True
-    ).annotate(
-        profit_margin_calc=Case(
-            When(cost_price__gt=0, then=(F('unit_price') - F('cost_price')) / F('cost_price') * 100),
-            default=0,
-            output_field=DecimalField(max_digits=10, decimal_places=2)
-        )
-    ).order_by('-id')[:10]
-    
-    # High value products (top 10 by cost) with profit calculations
-    high_value_products = Product.objects.filter(
-        is_active=True
-    ).annotate(
-        profit_per_unit=F('unit_price') - F('cost_price'),
-        total_cost_value=F('cost_price') * F('stock'),
-        total_selling_value=F('unit_price') * F('stock')
-    ).order_by('-unit_price')[:10]
-    
-    # Monthly comparison data
-    last_month_revenue = Invoice.objects.filter(
-        date__gte=last_month_start,  # Use 'date' not 'invoice_date'
-        date__lte=last_month_end,
-        status='paid'
-    ).aggregate(total=Sum('grand_total'))['total'] or 0
-    
-    revenue_change = 0
-    if last_month_revenue > 0:
-        revenue_change = ((monthly_revenue - last_month_revenue) / last_month_revenue) * 100
-    
-    context = {
-        'total_customers': total_customers,
-        'pending_invoices': pending_invoices,
-        'monthly_revenue': monthly_revenue,
-        'active_products': active_products,
-        'active_suppliers': active_suppliers,
-        'pending_purchase_orders': pending_purchase_orders,
-        'recent_invoices': recent_invoices,
-        'recent_purchase_orders': recent_purchase_orders,
-        'low_stock_products': low_stock_products,
-        'top_products': top_products,
-        'recent_customers': recent_customers,
-        'revenue_change': revenue_change,
-        'last_month_revenue': last_month_revenue,
-        'current_month': current_month_start.strftime('%B %Y'),
-        'total_inventory_value': total_inventory_value,
-        'total_inventory_cost_value': total_inventory_cost_value,
-        'potential_profit': potential_profit,
-        'avg_product_cost': avg_product_cost,
-        'avg_cost_price': avg_cost_price,
-        'avg_profit_margin': avg_profit_margin,
-        'products_by_category': products_by_category,
-        'recent_products': recent_products,
-        'high_value_products': high_value_products,
-        'total_purchase_orders': total_purchase_orders,
-        'total_procurement_value': total_procurement_value,
-        'monthly_procurement': monthly_procurement,
-        'avg_order_value': avg_order_value,
-    }
-    
+    context = DashboardMetrics().get()
+
     # Render enhanced dashboard with improved styling
     return render(request, 'portal/dashboard_enhanced.html', context)
 
-@dashboard_access_required
-def analytics_api(request):
-    """
-    API endpoint for dashboard analytics data (for AJAX updates)
-    """
+ANALYTICS_BUCKETS = {'30days': 'day', 'week': 'day', 'month': 'day', 'quarter': 'week', 'year': 'month'}
+
+
+def _analytics_range(request):
+    """Start, end and bucket of the analytics request; raises ValueError on bad parameters"""
     today = timezone.now().date()
     current_month_start = today.replace(day=1)
-    
-    # Get period (default to current month)
-    period = request.GET.get('period', 'month')
-    
-    if period == 'week':
+
+    # Get period (default to the last 30 days, the window of the dashboard chart)
+    period = request.GET.get('period', '30days')
+
+    if period == '30days':
+        start_date = today - timedelta(days=29)
+    elif period == 'week':
         start_date = today - timedelta(days=7)
     elif period == 'quarter':
         start_date = current_month_start - timedelta(days=90)
@@ -1700,41 +1311,79 @@ def analytics_api(request):
         start_date = current_month_start.replace(month=1)
     else:  # month
         start_date = current_month_start
-    
-    # Revenue trend data
-    revenue_data = []
-    for i in range(30):  # Last 30 days
-        date = today - timedelta(days=i)
-        daily_revenue = Invoice.objects.filter(
-            date=date,  # Use 'date' not 'invoice_date'
-            status='paid'
-        ).aggregate(total=Sum('grand_total'))['total'] or 0
-        
-        revenue_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'revenue': float(daily_revenue)
-        })
-    
-    # Top customers by revenue
-    top_customers = Customer.objects.annotate(
-        total_revenue=Sum('invoice__grand_total', filter=Q(
-            invoice__status='paid',
-            invoice__date__gte=start_date  # Use 'date' not 'invoice_date'
-        ))
-    ).filter(total_revenue__isnull=False).order_by('-total_revenue')[:5]
-    
+        period = 'month'
+    end_date = today
+
+    # An explicit range overrides the period
+    if request.GET.get('start'):
+        start_date = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+    if request.GET.get('end'):
+        end_date = datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+    if end_date < start_date:
+        raise ValueError('end must not be before start')
+
+    bucket = request.GET.get('bucket', ANALYTICS_BUCKETS[period])
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'")
+    return start_date, end_date, bucket
+
+
+def _analytics_etag(request):
+    try:
+        start_date, end_date, bucket = _analytics_range(request)
+    except ValueError:
+        return None
+    return dashboard_etag(settings.SITE_ID, 'analytics', start_date, end_date, bucket)
+
+
+@dashboard_access_required
+@condition(etag_func=_analytics_etag)
+def analytics_api(request):
+    """
+    API endpoint for dashboard analytics data (for AJAX updates)
+
+    Revenue is bucketed by day, week or month over the requested period and
+    compared with the period before it. Responses carry an ETag that only
+    changes with the site's data, so polling with If-None-Match is answered
+    with 304 Not Modified.
+    """
+    try:
+        start_date, end_date, bucket = _analytics_range(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    series = revenue_series(start_date, end_date, bucket)
+
+    def points(rows):
+        return [
+            {'date': row['date'].strftime('%Y-%m-%d'), 'revenue': float(row['revenue']), 'invoices': row['invoices']}
+            for row in rows
+        ]
+
     customer_data = [
         {
-            'name': customer.full_name,
-            'revenue': float(customer.total_revenue or 0)
+            'name': customer['customer__full_name'],
+            'revenue': float(customer['revenue'] or 0)
         }
-        for customer in top_customers
+        for customer in top_customers(start_date, end_date)
     ]
-    
-    return JsonResponse({
-        'revenue_trend': revenue_data,
+
+    response = JsonResponse({
+        'start': start_date.strftime('%Y-%m-%d'),
+        'end': end_date.strftime('%Y-%m-%d'),
+        'bucket': bucket,
+        'revenue_trend': points(series['current']),
+        'previous_trend': points(series['previous']),
+        'totals': {
+            'revenue': float(series['totals']['current']),
+            'previous_revenue': float(series['totals']['previous']),
+            'change': series['totals']['change'],
+        },
         'top_customers': customer_data,
     })
+    # Let browsers cache the response but revalidate it on every poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @dashboard_access_required
@@ -1742,163 +1391,57 @@ def dashboard_summary_api(request):
     """
     Returns rendered HTML for the dashboard summary (cards/tables) so the main dashboard can load quickly
     and fetch heavy data asynchronously.
+
+    The tiles missing from the cache are computed concurrently, so the response
+    takes as long as the slowest tile rather than all of them together.
     """
-    # Build the same heavy context used previously but keep it minimal and efficient
-    total_customers = Customer.objects.count()
-    active_products = Product.objects.filter(is_active=True).count()
-    active_suppliers = Supplier.objects.filter(is_active=True).count()
-    pending_invoices = Invoice.objects.filter(status__in=['draft', 'pending']).count()
-
-    monthly_revenue = Invoice.objects.filter(
-        date__gte=timezone.now().date().replace(day=1),
-        status='paid'
-    ).aggregate(total=Sum('grand_total'))['total'] or 0
+    ctx = {}
+    for figures in DashboardMetrics().tiles(list(DASHBOARD_TILES)).values():
+        ctx.update(figures)
 
-    # Product/Procurement aggregates (limited sets)
-    total_inventory_cost_value = Product.objects.filter(is_active=True).aggregate(total_value=Sum(F('cost_price') * F('stock')))['total_value'] or 0
-    total_inventory_value = Product.objects.filter(is_active=True).aggregate(total_value=Sum(F('unit_price') * F('stock')))['total_value'] or 0
-    potential_profit = total_inventory_value - total_inventory_cost_value
+    html = render(request, 'portal/_dashboard_summary.html', ctx).content.decode('utf-8')
+    return JsonResponse({'html': html})
 
-    total_purchase_orders = PurchaseOrder.objects.count()
-    total_procurement_value = PurchaseOrder.objects.aggregate(total=Sum('total'))['total'] or 0
-    monthly_procurement = PurchaseOrder.objects.filter(order_date__gte=timezone.now().date().replace(day=1)).aggregate(total=Sum('total'))['total'] or 0
-    avg_order_value = 0
-    if total_purchase_orders > 0:
-        avg_order_value = total_procurement_value / total_purchase_orders
 
-    products_by_category = Product.objects.filter(is_active=True).values('category__name').annotate(
-        count=Count('id'),
-        total_cost_value=Sum(F('cost_price') * F('stock')),
-        total_value=Sum(F('unit_price') * F('stock')),
-        profit=Sum((F('unit_price') - F('cost_price')) * F('stock'))
-    ).order_by('-count')[:5]
-
-    high_value_products = Product.objects.filter(is_active=True).annotate(
-        profit_per_unit=F('unit_price') - F('cost_price'),
-        total_cost_value=F('cost_price') * F('stock'),
-        total_selling_value=F('unit_price') * F('stock')
-    ).order_by('-unit_price')[:10]
-
-    ctx = {
-        'total_customers': total_customers,
-        'pending_invoices': pending_invoices,
-        'monthly_revenue': monthly_revenue,
-        'active_products': active_products,
-        'active_suppliers': active_suppliers,
-        'total_inventory_cost_value': total_inventory_cost_value,
-        'total_inventory_value': total_inventory_value,
-        'potential_profit': potential_profit,
-        'total_purchase_orders': total_purchase_orders,
-        'total_procurement_value': total_procurement_value,
-        'monthly_procurement': monthly_procurement,
-        'avg_order_value': avg_order_value,
-        'products_by_category': products_by_category,
-        'high_value_products': high_value_products,
-    }
+@dashboard_access_required
+def dashboard_tile_api(request, tile):
+    """
+    Returns rendered HTML for a single dashboard summary tile, so each tile can
+    be fetched and refreshed on its own schedule.
+    """
+    if tile not in DASHBOARD_TILES:
+        raise Http404(f"Unknown dashboard tile '{tile}'")
 
-    html = render(request, 'portal/_dashboard_summary.html', ctx).content.decode('utf-8')
-    return JsonResponse({'html': html})
+    ctx = DashboardMetrics().tile(tile)
+    html = render(request, f'portal/tiles/_{tile}.html', ctx).content.decode('utf-8')
+    response = JsonResponse({'tile': tile, 'html': html})
+    patch_cache_control(response, private=True, max_age=tile_timeout(tile))
+    return response
 
 @reports_access_required
 def report_view(request):
     """
     Comprehensive reports with filtering capabilities
+
+    Figures come from the compiled, cached ReportEngine; only the listed
+    documents are read per request.
     """
-    # Get filter parameters
-    customer_id = request.GET.get('customer_id')
-    supplier_id = request.GET.get('supplier_id')
-    status = request.GET.get('status')
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
     report_type = request.GET.get('report_type', 'invoice')
-    
-    # Base querysets
-    invoices = Invoice.objects.select_related('customer').order_by('-date')
-    purchase_orders = PurchaseOrder.objects.select_related('supplier').order_by('-order_date')
-    
-    # Apply filters
-    filters = {}
-    if customer_id:
-        invoices = invoices.filter(customer_id=customer_id)
-        filters['customer_id'] = customer_id
-        
-    if supplier_id:
-        purchase_orders = purchase_orders.filter(supplier_id=supplier_id)
-        filters['supplier_id'] = supplier_id
-        
-    if status:
-        invoices = invoices.filter(status=status)
-        purchase_orders = purchase_orders.filter(status=status)
-        filters['status'] = status
-        
-    if date_from:
-        try:
-            date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-            invoices = invoices.filter(date__gte=date_from_obj)
-            purchase_orders = purchase_orders.filter(order_date__gte=date_from_obj)
-            filters['date_from'] = date_from
-        except ValueError:
-            pass
-            
-    if date_to:
-        try:
-            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-            invoices = invoices.filter(date__lte=date_to_obj)
-            purchase_orders = purchase_orders.filter(order_date__lte=date_to_obj)
-            filters['date_to'] = date_to
-        except ValueError:
-            pass
-    
-    # Pagination
+    filters = parse_report_filters(request.GET)
+    engine = ReportEngine(filters, report_type)
+    report = engine.run()
+
+    invoices = engine.invoices().select_related('customer').order_by('-date')
+    purchase_orders = engine.purchase_orders().select_related('supplier').order_by('-order_date')
+
+    # Pagination (the count is already known from the report)
     page = request.GET.get('page', 1)
     items_per_page = 25
-    
-    if report_type == 'purchase_order':
-        paginator = Paginator(purchase_orders, items_per_page)
-        page_obj = paginator.get_page(page)
-        
-        # Purchase order statistics
-        total_count = purchase_orders.count()
-        total_amount = purchase_orders.aggregate(total=Sum('total_amount'))['total'] or 0
-        avg_amount = purchase_orders.aggregate(avg=Avg('total_amount'))['avg'] or 0
-        
-        # Status breakdown
-        status_breakdown = purchase_orders.values('status').annotate(
-            count=Count('id'),
-            total_amount=Sum('total_amount')
-        )
-        
-        stats = {
-            'total_count': total_count,
-            'total_amount': total_amount,
-            'avg_amount': avg_amount,
-            'status_breakdown': status_breakdown,
-        }
-    else:
-        # Default to invoice report
-        paginator = Paginator(invoices, items_per_page)
-        page_obj = paginator.get_page(page)
-        
-        # Invoice statistics
-        total_count = invoices.count()
-        total_amount = invoices.aggregate(total=Sum('grand_total'))['total'] or 0
-        avg_amount = invoices.aggregate(avg=Avg('grand_total'))['avg'] or 0
-        
-        # Status breakdown
-        status_breakdown = invoices.values('status').annotate(
-            count=Count('id'),
-            total_amount=Sum('grand_total')
-        )
-        
-        stats = {
-            'total_count': total_count,
-            'total_amount': total_amount,
-            'avg_amount': avg_amount,
-            'status_breakdown': status_breakdown,
-        }
-    
+    paginator = Paginator(purchase_orders if report_type == 'purchase_order' else invoices, items_per_page)
+    paginator.count = report['stats']['total_count']
+    page_obj = paginator.get_page(page)
+
     # Get choices for dropdowns
-    customers = Customer.objects.order_by('full_name')
     suppliers = Supplier.objects.filter(is_active=True).order_by('name')
     invoice_status_choices = Invoice.INVOICE_STATUS
     purchase_order_status_choices = [
@@ -1907,180 +1450,35 @@ def report_view(request):
         ('received', 'Received'),
         ('cancelled', 'Cancelled'),
     ]
-    
-    # Calculate cost value based on product cost prices (from inventory)
-    total_cost_value = InvoiceItem.objects.filter(
-        invoice__in=invoices.filter(status='paid')
-    ).aggregate(
-        total_cost=Sum(F('quantity') * F('product__cost_price'))
-    )['total_cost'] or 0
-    
-    # Revenue from invoices (in filtered period if applicable)
-    total_revenue = invoices.filter(status='paid').aggregate(
-        total=Sum('grand_total')
-    )['total'] or 0
-    
-    # Gross profit and margin
-    gross_profit = total_revenue - total_cost_value
-    gross_margin = 0
-    if total_revenue > 0:
-        gross_margin = (gross_profit / total_revenue) * 100
-    # Use total_revenue from invoices (grand_total), not from InvoiceItem/unit_price
-    # total_revenue = invoices.filter(status='paid').aggregate(
-    #     total=Sum('grand_total')
-    # )['total'] or 0
-    total_revenue = invoices.filter(status='paid').aggregate(
-        total=Sum('grand_total')
-    )['total'] or 0    
-    # Gross profit and margin
-    # Daily breakdown (using InvoiceItem)
-    daily_gross_profit = (
-        InvoiceItem.objects.filter(invoice__status='paid')
-        .annotate(date=TruncDate('invoice__date'))
-        .values('date')
-        .annotate(
-            sales_value=Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
-            cost_value=Sum(F('quantity') * F('product__cost_price'), output_field=DecimalField()),
-        )
-        .annotate(
-            gross_profit=F('sales_value') - F('cost_value'),
-            margin=Case(
-                When(sales_value__gt=0, then=(F('gross_profit') / F('sales_value')) * 100),
-                default=0,
-                output_field=DecimalField(max_digits=5, decimal_places=1)
-            )
-        )
-        .order_by('date')
-    )
-    # Monthly breakdown
-    monthly_gross_profit = (
-        InvoiceItem.objects.filter(invoice__status='paid')
-        .annotate(month=TruncMonth('invoice__date'))
-        .values('month')
-        .annotate(
-            sales_value=Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
-            cost_value=Sum(F('quantity') * F('product__cost_price'), output_field=DecimalField()),
-        )
-        .annotate(
-            gross_profit=F('sales_value') - F('cost_value'),
-            margin=Case(
-                When(sales_value__gt=0, then=(F('gross_profit') / F('sales_value')) * 100),
-                default=0,
-                output_field=DecimalField(max_digits=5, decimal_places=1)
-            )
-        )
-        .order_by('month')
-    )
-
-    # Add to context:
-    context = {}
-    context['daily_gross_profit'] = daily_gross_profit
-    context['monthly_gross_profit'] = monthly_gross_profit
-    
-    # Category analysis - using 'items' as related_name
-    category_analysis = InvoiceItem.objects.filter(
-        invoice__in=invoices.filter(status='paid')
-    ).values('product__category__name').annotate(
-        count=Count('id'),
-        total_qty=Sum('quantity'),
-        total_cost=Sum(F('quantity') * F('product__cost_price')),
-        total_revenue=Sum(F('quantity') * F('unit_price')),
-        avg_cost=Avg('product__cost_price'),
-        avg_selling=Avg('unit_price')
-    ).annotate(
-        margin=Case(
-            When(avg_cost__gt=0, then=(F('avg_selling') - F('avg_cost')) / F('avg_cost') * 100),
-            default=0,
-            output_field=DecimalField(max_digits=10, decimal_places=2)
-        )
-    ).order_by('-total_revenue')[:10]
-
-    # Top products
-    top_products = InvoiceItem.objects.filter(
-        invoice__status='paid'
-    ).values(
-        'product__name', 
-        'product__cost_price'
-    ).annotate(
-        total_qty=Sum('quantity'),
-        total_revenue=Sum(F('quantity') * F('unit_price')),
-        total_cost=Sum(F('quantity') * F('product__cost_price'))
-    ).annotate(
-        total_profit=F('total_revenue') - F('total_cost'),
-        margin=Case(
-            When(total_revenue__gt=0, then=(F('total_profit') / F('total_revenue')) * 100),
-            default=0,
-            output_field=DecimalField(max_digits=5, decimal_places=1)
-        )
-    ).order_by('-total_revenue')[:10]
-
-    # Invoice and PO totals for summary cards
-    invoice_totals = {
-        'count': invoices.count(),
-        'total_amount': invoices.aggregate(total=Sum('grand_total'))['total'] or 0
-    }
-    
-    po_totals = {
-        'count': purchase_orders.count(),
-        'total_amount': purchase_orders.aggregate(total=Sum('total'))['total'] or 0
-    }
-    
-
-    # Calculate profit metrics
-    total_profit = gross_profit
-    profit_margin = gross_margin
-    avg_margin = 0
-    
-    if category_analysis:
-        avg_margin = sum(cat['margin'] or 0 for cat in category_analysis) / len(category_analysis)
-    
-    # Define daily_profit_breakdown using the same queryset as daily_gross_profit for compatibility
-    daily_profit_breakdown = daily_gross_profit
-
-    # Define monthly_profit_breakdown using similar logic, grouped by month
-    monthly_profit_breakdown = (
-        InvoiceItem.objects.filter(invoice__status='paid')
-        .annotate(month=TruncMonth('invoice__date'))
-        .values('month')
-        .annotate(
-            sales_value=Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
-            cost_value=Sum(F('quantity') * F('product__cost_price'), output_field=DecimalField()),
-        )
-        .annotate(
-            gross_profit=F('sales_value') - F('cost_value'),
-            margin=Case(
-                When(sales_value__gt=0, then=(F('gross_profit') / F('sales_value')) * 100),
-                default=0,
-                output_field=DecimalField(max_digits=5, decimal_places=1)
-            )
-        )
-        .order_by('month')
-    )
 
     context = {
         'page_obj': page_obj,
-        'stats': stats,
+        'stats': report['stats'],
         'filters': filters,
-        'customers': customers,
+        'customers': report['customers'],
         'suppliers': suppliers,
         'invoice_status_choices': invoice_status_choices,
         'purchase_order_status_choices': purchase_order_status_choices,
         'report_type': report_type,
         'current_filters': request.GET,
-        'invoice_totals': invoice_totals,
-        'po_totals': po_totals,
-        'total_cost_value': total_cost_value,
-        'total_revenue': total_revenue,
-        'gross_profit': gross_profit,
-        'gross_margin': gross_margin,
-        'total_profit': total_profit,
-        'profit_margin': profit_margin,
-        'avg_margin': avg_margin,
-        'total_costs': total_cost_value,
-        'category_analysis': category_analysis,
-        'top_products': top_products,
-        'daily_profit_breakdown': daily_profit_breakdown,
-        'monthly_profit_breakdown': monthly_profit_breakdown,
+        'invoice_totals': report['invoice_totals'],
+        'po_totals': report['po_totals'],
+        'total_cost_value': report['total_cost_value'],
+        'total_revenue': report['total_revenue'],
+        'gross_profit': report['gross_profit'],
+        'gross_margin': report['gross_margin'],
+        'total_profit': report['gross_profit'],
+        'profit_margin': report['gross_margin'],
+        'avg_margin': report['avg_margin'],
+        'total_costs': report['total_cost_value'],
+        'category_analysis': report['category_analysis'],
+        'top_products': report['top_products'],
+        'daily_profit_breakdown': report['daily_profit_breakdown'],
+        'monthly_profit_breakdown': report['monthly_profit_breakdown'],
+        'report_timings': report['timings'],
+        'report_cached': report['cached'],
+        'report_elapsed': report['elapsed'],
+        'xlsx_export_available': XLSX_AVAILABLE,
         'invoices': invoices[:50],
         'purchase_orders': purchase_orders[:50],
     }
@@ -2089,122 +1487,85 @@ def report_view(request):
 
 @login_required
 def export_reports(request):
+    """
+    Stream the filtered invoices, purchase orders or purchase payments as CSV.
+    Rows are read in chunks and written as they come, so memory use stays flat
+    however many rows match.
+
+    An XLSX file can only be sent once it is complete, so ``format=xlsx``
+    queues a background export job instead (see ``report_job_submit``) and
+    answers with the job to poll.
+    """
     export_type = request.GET.get('export', 'invoices')
-    
-    # Get filters from request
-    filters = {
-        'customer_id': request.GET.get('customer_id'),
-        'supplier_id': request.GET.get('supplier_id'),
-        'status': request.GET.get('status'),
-        'date_from': request.GET.get('date_from'),
-        'date_to': request.GET.get('date_to'),
+    if export_type not in EXPORTS:
+        raise Http404(f"Unknown export '{export_type}'")
+
+    if request.GET.get('format') == 'xlsx':
+        try:
+            params = job_params('export', request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        job, created = submit_report_job('export', params, user=request.user)
+        return JsonResponse({'job': _report_job_payload(job), 'created': created}, status=202 if created else 200)
+
+    filters = parse_report_filters(request.GET)
+    filename = f"{export_type}_export_{timezone.now().date()}"
+    response = StreamingHttpResponse(stream_csv(export_rows(export_type, filters)), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def _report_job_payload(job):
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'rows_done': job.rows_done,
+        'rows_total': job.rows_total,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'status_url': reverse('portal:report_job_status', args=[job.pk]),
+        'download_url': reverse('portal:report_job_download', args=[job.pk]) if job.status == 'done' else None,
     }
-    
-    # Create the HttpResponse object with CSV header
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{export_type}_export_{timezone.now().date()}.csv"'
-    
-    writer = csv.writer(response)
-    
-    if export_type == 'invoices':
-        # Filter invoices based on request parameters
-        invoices = Invoice.objects.all()
-        
-        if filters['customer_id']:
-            invoices = invoices.filter(customer_id=filters['customer_id'])
-        if filters['date_from']:
-            invoices = invoices.filter(date__gte=filters['date_from'])
-        if filters['date_to']:
-            invoices = invoices.filter(date__lte=filters['date_to'])
-        if filters['status']:
-            invoices = invoices.filter(status=filters['status'])
-        
-        # Write CSV header
-        writer.writerow([
-            'Invoice Number', 'Customer', 'Date', 
-            'Subtotal', 'Tax', 'Discount', 'Grand Total', 
-            'Status', 'Payment Status', 'Created At'
-        ])
-        
-        # Write data rows
-        for invoice in invoices:
-            writer.writerow([
-                invoice.invoice_number,
-                invoice.customer.full_name if invoice.customer else '',
-                invoice.date.strftime('%Y-%m-%d'),
-                invoice.subtotal,
-                invoice.tax_amount,
-                invoice.discount_amount,
-                invoice.grand_total,
-                invoice.get_status_display(),
-                invoice.get_payment_status_display(),
-                invoice.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-    
-    elif export_type == 'purchase_orders':
-        # Filter purchase orders
-        purchase_orders = PurchaseOrder.objects.all()
-        
-        if filters['supplier_id']:
-            purchase_orders = purchase_orders.filter(supplier_id=filters['supplier_id'])
-        if filters['date_from']:
-            purchase_orders = purchase_orders.filter(order_date__gte=filters['date_from'])
-        if filters['date_to']:
-            purchase_orders = purchase_orders.filter(order_date__lte=filters['date_to'])
-        if filters['status']:
-            purchase_orders = purchase_orders.filter(status=filters['status'])
-        
-        # Write CSV header
-        writer.writerow([
-            'PO Reference', 'Supplier', 'Order Date', 
-            'Delivery Date', 'Total Amount', 'Status', 
-            'Created At', 'Created By'
-        ])
-        
-        # Write data rows
-        for po in purchase_orders:
-            writer.writerow([
-                po.reference,
-                po.supplier.name if po.supplier else '',
-                po.order_date.strftime('%Y-%m-%d'),
-                po.delivery_date.strftime('%Y-%m-%d') if po.delivery_date else '',
-                po.total,
-                po.get_status_display(),
-                po.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                po.created_by.get_full_name() if po.created_by else ''
-            ])
-    
-    elif export_type == 'payments':
-        # Filter payments
-        payments = Payment.objects.all()
-        
-        if filters['date_from']:
-            payments = payments.filter(payment_date__gte=filters['date_from'])
-        if filters['date_to']:
-            payments = payments.filter(payment_date__lte=filters['date_to'])
-        
-        # Write CSV header
-        writer.writerow([
-            'Payment Date', 'PO Reference', 'Supplier', 
-            'Amount', 'Payment Method', 'Reference', 
-            'Notes', 'Created At'
-        ])
-        
-        # Write data rows
-        for payment in payments:
-            writer.writerow([
-                payment.payment_date.strftime('%Y-%m-%d'),
-                payment.purchase_order.reference if payment.purchase_order else '',
-                payment.purchase_order.supplier.name if payment.purchase_order and payment.purchase_order.supplier else '',
-                payment.amount,
-                payment.get_payment_method_display(),
-                payment.reference or '',
-                payment.notes or '',
-                payment.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-    
+
+
+@reports_access_required
+@require_http_methods(["POST"])
+def report_job_submit(request):
+    """
+    Queue a report (``kind=report``) or export (``kind=export``) to run in the
+    background with the same parameters as report_view and export_reports.
+    Identical requests share one job.
+    """
+    try:
+        params = job_params(request.POST.get('kind', 'export'), request.POST)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    job, created = submit_report_job(request.POST.get('kind', 'export'), params, user=request.user)
+    return JsonResponse({'job': _report_job_payload(job), 'created': created}, status=202 if created else 200)
+
+
+@reports_access_required
+def report_job_status(request, pk):
+    """Progress of a background report job, polled by the report page"""
+    job = get_object_or_404(ReportJob, pk=pk)
+    response = JsonResponse({'job': _report_job_payload(job)})
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
+
+@reports_access_required
+def report_job_download(request, pk):
+    """The result file of a finished background report job"""
+    job = get_object_or_404(ReportJob, pk=pk, status='done')
+    if not job.result:
+        raise Http404("Report job has no result")
+    return FileResponse(job.result.open('rb'), as_attachment=True, filename=os.path.basename(job.result.name))
+
 '''
 @reports_access_required
 def report_view(request):
@@ -2570,15 +1931,10 @@ class ProductListView(ListView):
     def get_queryset(self):
         queryset = Product.objects.select_related('category').order_by('-id')
         
-        # Search functionality
+        # Search functionality, best matches first
         search_query = self.request.GET.get('q', '')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(sku__icontains=search_query) |
-                Q(barcode__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
+            queryset = search_products(search_query, queryset)
         
         # Category filter
         category_id = self.request.GET.get('category', '')
@@ -2693,15 +2049,10 @@ class PublicProductCatalogView(ListView):
             stock__gt=0
         ).select_related('category').order_by('-id')
         
-        # Search functionality
+        # Search functionality, best matches first
         search_query = self.request.GET.get('q', '')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(sku__icontains=search_query) |
-                Q(barcode__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
+            queryset = search_products(search_query, queryset)
         
         # Category filter
         category_id = self.request.GET.get('category', '')
@@ -2722,9 +2073,11 @@ class PublicProductCatalogView(ListView):
             except (ValueError, TypeError):
                 pass
         
-        # Sorting
-        sort_by = self.request.GET.get('sort', 'newest')
-        if sort_by == 'price_low':
+        # Sorting; relevance is the newest first when not searching
+        sort_by = self.request.GET.get('sort', 'relevance')
+        if sort_by == 'relevance' and search_query:
+            pass  # search_products already ranks the matches
+        elif sort_by == 'price_low':
             queryset = queryset.order_by('unit_price')
         elif sort_by == 'price_high':
             queryset = queryset.order_by('-unit_price')
@@ -2759,7 +2112,7 @@ class PublicProductCatalogView(ListView):
             'categories': categories,
             'current_category': self.request.GET.get('category', ''),
             'current_search': self.request.GET.get('q', ''),
-            'current_sort': self.request.GET.get('sort', 'newest'),
+            'current_sort': self.request.GET.get('sort', 'relevance'),
             'current_min_price': self.request.GET.get('min_price', ''),
             'current_max_price': self.request.GET.get('max_price', ''),
             'price_range': price_range,
@@ -2931,14 +2284,13 @@ def product_dashboard(request):
     from django.db.models import Sum, Avg, Count
     from portal.models import Category
     
-    # Get statistics
-    total_products = Product.objects.count()
-    active_products = Product.objects.filter(is_active=True).count()
+    # Get statistics (totals from the running inventory valuation counters)
+    valuation = site_valuation(settings.SITE_ID)
+    total_products = valuation.product_count
+    active_products = valuation.active_count
     low_stock_products = Product.objects.filter(stock__lte=10, stock__gt=0).count()
     out_of_stock_products = Product.objects.filter(stock=0).count()
-    total_stock_value = Product.objects.aggregate(
-        total_value=Sum(F('cost_price') * F('stock'))
-    )['total_value'] or 0
+    total_stock_value = valuation.stock_cost_value
     
     # Recent products
     recent_products = Product.objects.order_by('-id')[:5]
@@ -3041,7 +2393,9 @@ class QuotationCreateView(CreateView):
                 self._create_quotation_items(quotation)
                 self._update_quotation_totals(quotation)
 
-                return self._handle_response(quotation)
+            # Totals are recalculated when the transaction above commits
+            refresh_totals(quotation)
+            return self._handle_response(quotation)
 
         except Exception as e:
             logger.error(f"Quotation creation error: {str(e)}")
@@ -3049,28 +2403,7 @@ class QuotationCreateView(CreateView):
     
     def _generate_quotation_number(self):
         """Generate quotation number in QT-YYYYMMDDNN format"""
-        date_part = timezone.now().strftime('%Y%m%d')
-        prefix = f"QT-{date_part}"
-        
-        try:
-            with transaction.atomic():
-                last_quotation = Quotation.objects.filter(
-                    quotation_number__startswith=prefix
-                ).order_by('-quotation_number').first()
-                
-                if last_quotation:
-                    last_num = int(last_quotation.quotation_number[-2:])
-                    next_num = last_num + 1
-                else:
-                    next_num = 1
-                
-                if next_num > 99:
-                    raise ValueError("Maximum daily quotation limit (99) reached")
-                
-                return f"{prefix}{next_num:02d}"
-        except Exception as e:
-            fallback_num = random.randint(1, 99)
-            return f"{prefix}{fallback_num:02d}F"
+        return DocumentSequence.next_number('quotation')
 
     def _create_quotation_items(self, quotation):
         """Create all associated quotation items"""
@@ -3100,27 +2433,8 @@ class QuotationCreateView(CreateView):
                 continue
 
     def _update_quotation_totals(self, quotation):
-        """Update quotation totals based on items"""
-        items = quotation.items.all()
-        subtotal = sum(item.quantity * item.unit_price for item in items)
-        
-        # Apply discount
-        discount_amount = Decimal('0')
-        if quotation.discount_type == 'percentage':
-            discount_amount = subtotal * (quotation.discount_value / 100)
-        else:
-            discount_amount = quotation.discount_value
-        
-        # Apply tax
-        tax_amount = subtotal * (quotation.tax_rate / 100)
-        
-        total = subtotal + tax_amount - discount_amount
-        
-        quotation.subtotal = subtotal
-        quotation.tax_amount = tax_amount
-        quotation.discount_amount = discount_amount
-        quotation.total = total
-        quotation.save()
+        """Queue the totals recalculation from the stored items"""
+        schedule_totals(quotation)
 
     def _handle_response(self, quotation):
         """Return appropriate response based on request type"""
@@ -3148,11 +2462,12 @@ class QuotationCreateView(CreateView):
 
 
 @method_decorator(login_required, name='dispatch')
-class QuotationListView(ListView):
+class QuotationListView(KeysetPaginationMixin, ListView):
     model = Quotation
     template_name = 'portal/quotation_list.html'
     context_object_name = 'quotations'
     paginate_by = 20
+    keyset_ordering = ('-date', '-id')
     
     def get_queryset(self):
         queryset = Quotation.objects.select_related('customer').order_by('-date')
@@ -3180,14 +2495,12 @@ class QuotationListView(ListView):
         context['search_query'] = self.request.GET.get('q', '')
         
         # Calculate stats
-        all_quotations = Quotation.objects.all()
-        context['quotation_stats'] = {
-            'active': all_quotations.filter(status__in=['sent', 'accepted']).count(),
-            'pending': all_quotations.filter(status='draft').count(),
-            'total_value': all_quotations.aggregate(
-                total=Sum('total')
-            )['total'] or 0
-        }
+        context['quotation_stats'] = summarize(
+            Quotation.objects.all(),
+            active=Count('id', filter=Q(status__in=['sent', 'accepted'])),
+            pending=Count('id', filter=Q(status='draft')),
+            total_value=Sum('total'),
+        )
         
         return context
 
@@ -3328,11 +2641,12 @@ class PaymentReceiptCreateView(CreateView):
 
 
 @method_decorator(login_required, name='dispatch')
-class PaymentReceiptListView(ListView):
+class PaymentReceiptListView(KeysetPaginationMixin, ListView):
     model = PaymentReceipt
     template_name = 'portal/receipt_list.html'
     context_object_name = 'receipts'
     paginate_by = 20
+    keyset_ordering = ('-payment_date', '-id')
     
     def get_queryset(self):
         queryset = PaymentReceipt.objects.select_related(
@@ -3369,21 +2683,13 @@ class PaymentReceiptListView(ListView):
         context['search_query'] = self.request.GET.get('q', '')
         
         # Calculate stats
-        from django.utils import timezone
-        from datetime import datetime
-        
-        all_receipts = PaymentReceipt.objects.all()
         current_month = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        context['receipt_stats'] = {
-            'total_amount': all_receipts.aggregate(
-                total=Sum('amount_received')
-            )['total'] or 0,
-            'this_month': all_receipts.filter(
-                payment_date__gte=current_month
-            ).count(),
-            'active': all_receipts.filter(status='issued').count()
-        }
+        context['receipt_stats'] = summarize(
+            PaymentReceipt.objects.all(),
+            total_amount=Sum('amount_received'),
+            this_month=Count('id', filter=Q(payment_date__gte=current_month)),
+            active=Count('id', filter=Q(status='issued')),
+        )
         
         return context
 
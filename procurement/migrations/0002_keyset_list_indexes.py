@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0001_initial'),
+        ('sites', '0002_alter_domain_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['site', '-order_date', '-id'], name='po_site_date_id_idx'),
+        ),
+    ]
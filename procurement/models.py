@@ -64,6 +64,10 @@ class PurchaseOrder(ProcurementSiteModel):
     class Meta:
         unique_together = ['site', 'reference']
         ordering = ['-created_at', 'site']
+        indexes = [
+            # Keyset pagination of the purchase order list
+            models.Index(fields=['site', '-order_date', '-id'], name='po_site_date_id_idx'),
+        ]
         verbose_name = 'Purchase Order'
         verbose_name_plural = 'Purchase Orders'
 
@@ -1,5 +1,7 @@
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from portal.models import Product
 from .models import PurchaseItem, PurchaseOrder
 from decimal import Decimal
 
@@ -39,14 +41,18 @@ def update_product_stock_and_cost(sender, instance, created, **kwargs):
     Only update if the purchase order is received
     """
     if instance.purchase_order.status == 'received':
-        product = instance.product
-        
-        # Update stock (add purchased quantity)
-        if created:  # Only add stock if this is a new item
-            product.stock += instance.quantity
-        
-        # Update cost price to latest purchase cost
-        if product.cost_price != instance.unit_cost:
-            product.cost_price = instance.unit_cost
-            
-        product.save(update_fields=['stock', 'cost_price'])
\ No newline at end of file
+        with transaction.atomic():
+            # Lock and reload the product so concurrent receipts add up and the
+            # inventory valuation counters start from the stored stock
+            product = Product.all_objects.select_for_update().get(pk=instance.product_id)
+
+            # Update stock (add purchased quantity)
+            if created:  # Only add stock if this is a new item
+                product.stock += instance.quantity
+
+            # Update cost price to latest purchase cost
+            if product.cost_price != instance.unit_cost:
+                product.cost_price = instance.unit_cost
+
+            product.save(update_fields=['stock', 'cost_price'])
+        instance.product = product
\ No newline at end of file
@@ -1,6 +1,8 @@
 from django.views.generic import ListView, CreateView, UpdateView, DetailView, TemplateView
 from django.urls import reverse_lazy
 from django.db import models
+from portal.pagination import KeysetPaginationMixin
+from portal.summaries import summarize
 from procurement.models import Supplier, PurchaseOrder, PurchasePayment
 from procurement.forms import SupplierForm, PurchaseOrderForm, PurchasePaymentForm
 
@@ -22,12 +24,13 @@ class SupplierUpdateView(UpdateView):
     template_name = 'portal/supplier_form.html'
     success_url = reverse_lazy('procurement:supplier_list')
 
-class PurchaseOrderListView(ListView):
+class PurchaseOrderListView(KeysetPaginationMixin, ListView):
     model = PurchaseOrder
     template_name = 'portal/purchase_order_list.html'
     context_object_name = 'orders'
     paginate_by = 20
     ordering = ['-order_date']
+    keyset_ordering = ('-order_date', '-id')
     
     def get_queryset(self):
         # Temporarily remove site filtering to test basic functionality
@@ -35,15 +38,17 @@ class PurchaseOrderListView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        queryset = self.get_queryset()
         
-        # Statistics
-        context['total_orders'] = queryset.count()
-        context['draft_orders'] = queryset.filter(status='draft').count()
-        context['ordered_orders'] = queryset.filter(status='ordered').count()
-        context['received_orders'] = queryset.filter(status='received').count()
-        context['pending_payments'] = queryset.filter(status__in=['ordered', 'received']).count()
-        context['total_value'] = queryset.aggregate(total=models.Sum('total'))['total'] or 0
+        # Statistics in a single query
+        context.update(summarize(
+            self.object_list,
+            total_orders=models.Count('id'),
+            draft_orders=models.Count('id', filter=models.Q(status='draft')),
+            ordered_orders=models.Count('id', filter=models.Q(status='ordered')),
+            received_orders=models.Count('id', filter=models.Q(status='received')),
+            pending_payments=models.Count('id', filter=models.Q(status__in=['ordered', 'received'])),
+            total_value=models.Sum('total'),
+        ))
         
         # Suppliers for filter dropdown
         context['suppliers'] = Supplier.objects.all()
@@ -6,6 +6,7 @@ from django.urls import reverse
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.sites.shortcuts import get_current_site
 from django.utils import timezone
+from portal.reference_data import get_site_role
 from ..models import SiteUserProfile
 import logging
 
@@ -81,6 +82,9 @@ class RBACMiddleware(MiddlewareMixin):
             messages.error(request, 'You do not have access to this site.')
             return redirect('portal:login')
         
+        # Roles change rarely; take the memoized row instead of a query per request
+        user_profile.role = get_site_role(user_profile.role_id)
+
         # Check specific permissions for the requested path
         required_permission = self._get_required_permission(path)
         if required_permission:
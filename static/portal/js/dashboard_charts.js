@@ -57,8 +57,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 const revenueCtx = document.getElementById('chartRevenue');
                 if (revenueCtx && revenueCtx.getContext) {
                     const rCtx = revenueCtx.getContext('2d');
-                    const revenueLabels = data.revenue_trend.map(d => d.date).reverse();
-                    const revenueData = data.revenue_trend.map(d => d.revenue).reverse();
+                    // revenue_trend is already ordered oldest first
+                    const revenueLabels = data.revenue_trend.map(d => d.date);
+                    const revenueData = data.revenue_trend.map(d => d.revenue);
 
                     new Chart(rCtx, {
                     type: 'line',
@@ -95,11 +96,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 });
                 }
 
-                // Sparklines for quick stats (if present)
+                // Sparklines for quick stats (if present): the first ten days of the window
                 document.querySelectorAll('.sparkline').forEach((el, idx) => {
                     if (!el.getContext) return;
                     const ctx = el.getContext('2d');
-                    const values = (data.revenue_trend && data.revenue_trend.length) ? data.revenue_trend.map(d => d.revenue).slice(-10) : [0,0,0,0,0,0,0,0,0,0];
+                    const values = (data.revenue_trend && data.revenue_trend.length) ? data.revenue_trend.map(d => d.revenue).slice(0, 10) : [0,0,0,0,0,0,0,0,0,0];
                     new Chart(ctx, { type: 'line', data: { labels: values.map((_,i)=>i+1), datasets:[{ data: values, borderColor: 'rgba(34,34,34,0.95)', backgroundColor:'rgba(91,70,246,0.12)', tension:0.3 }] }, options:{ responsive:true, plugins:{ legend:{ display:false } }, scales:{ x:{ display:false }, y:{ display:false } } } });
                 });
             })